@@ -0,0 +1,70 @@
+# time of selecting text of annotations on annotation-heavy pages, shapely polygons (before) vs arrays.
+# run from the root of project: python -m benchmarks.annotation_selection [annotations_per_page]
+import os
+import sys
+import glob
+import time
+import random
+import pdfplumber
+
+from typing import Callable
+from index_package.parser.pdf_extractor import PdfExtractor, _TextBoxes
+from tests.test_pdf_extractor import _reference_selected_text
+
+_ASSETS_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "assets")
+
+# highlights over random spans of chars, a few lines each
+def _highlights(page, count: int) -> list[list[float]]:
+  chars = page.chars
+  quad_points_list: list[list[float]] = []
+  for _ in range(count):
+    quad_points: list[float] = []
+    for _ in range(random.randint(1, 4)):
+      begin = random.randrange(len(chars))
+      span = chars[begin:begin + random.randint(5, 60)]
+      x0 = min(c["x0"] for c in span)
+      x1 = max(c["x1"] for c in span)
+      y0 = min(c["y0"] for c in span)
+      y1 = max(c["y1"] for c in span)
+      quad_points.extend((x0, y1, x1, y1, x0, y0, x1, y0))
+    quad_points_list.append(quad_points)
+  return quad_points_list
+
+def _measure(name: str, pages: list, select: Callable[[object, list[list[float]]], list]) -> tuple[float, list]:
+  texts: list = []
+  begin = time.perf_counter()
+  for page, quad_points_list in pages:
+    texts.extend(select(page, quad_points_list))
+  duration = time.perf_counter() - begin
+  annotations_count = sum(len(q) for _, q in pages)
+  print(f"{name:>8}: {annotations_count} annotations in {duration:.3f}s, {annotations_count / duration:10.1f} annotations/s")
+  return duration, texts
+
+def _select_with_arrays(extractor: PdfExtractor, page, quad_points_list: list[list[float]]) -> list:
+  text_boxes = _TextBoxes(page)
+  return [extractor._extract_selected_text(page, q, text_boxes) for q in quad_points_list]
+
+def main():
+  annotations_per_page = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+  random.seed(0)
+  extractor = PdfExtractor(os.path.join(_ASSETS_PATH, "pages"))
+  pdf_files = [pdfplumber.open(p) for p in sorted(glob.glob(os.path.join(_ASSETS_PATH, "*.pdf")))]
+  try:
+    pages = [
+      (page, _highlights(page, annotations_per_page))
+      for pdf_file in pdf_files
+      for page in pdf_file.pages
+      if len(page.chars) > 0
+    ]
+    for page, _ in pages:
+      page.extract_text_lines(char=False) # warm up cache of text map of pdfplumber
+
+    before, before_texts = _measure("shapely", pages, lambda p, q: [_reference_selected_text(p, x) for x in q])
+    after, after_texts = _measure("arrays", pages, lambda p, q: _select_with_arrays(extractor, p, q))
+    print(f"speedup: {before / after:.1f}x, same texts: {before_texts == after_texts}")
+  finally:
+    for pdf_file in pdf_files:
+      pdf_file.close()
+
+if __name__ == "__main__":
+  main()
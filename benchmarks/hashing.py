@@ -0,0 +1,59 @@
+# throughput of hashing large and small files, 4 KiB reads (before) vs current engine.
+# run from the root of project: python -m benchmarks.hashing [large_mib]
+import os
+import sys
+import time
+import base64
+import hashlib
+import tempfile
+
+from typing import Callable
+from index_package.utils import hash_file, hash_files, HashAlgorithm
+
+_LARGE_FILES = 4
+_SMALL_FILES = 2000
+_SMALL_FILE_BYTES = 64 * 1024
+
+def _hash_with_small_reads(file_path: str) -> str:
+  sha512_hash = hashlib.sha512()
+  with open(file_path, "rb") as file:
+    while chunk := file.read(4096):
+      sha512_hash.update(chunk)
+  return base64.urlsafe_b64encode(sha512_hash.digest()).decode()
+
+def _write_files(dir_path: str, name: str, count: int, size: int) -> list[str]:
+  file_paths: list[str] = []
+  block = os.urandom(min(size, 1024 * 1024))
+  for i in range(count):
+    file_path = os.path.join(dir_path, f"{name}{i}.bin")
+    with open(file_path, "wb") as file:
+      written = 0
+      while written < size:
+        written += file.write(block[:size - written])
+    file_paths.append(file_path)
+  return file_paths
+
+def _measure(name: str, file_paths: list[str], hash_all: Callable[[list[str]], None]):
+  hash_all(file_paths) # warm up page cache
+  total_bytes = sum(os.path.getsize(p) for p in file_paths)
+  begin = time.perf_counter()
+  hash_all(file_paths)
+  duration = time.perf_counter() - begin
+  print(f"{name:>24}: {total_bytes / duration / 1024 / 1024:8.1f} MiB/s, {len(file_paths) / duration:8.1f} files/s")
+
+def main():
+  large_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+  with tempfile.TemporaryDirectory() as temp_path:
+    for title, file_paths in (
+      (f"{_LARGE_FILES} files of {large_mib} MiB", _write_files(temp_path, "large", _LARGE_FILES, large_mib * 1024 * 1024)),
+      (f"{_SMALL_FILES} files of {_SMALL_FILE_BYTES // 1024} KiB", _write_files(temp_path, "small", _SMALL_FILES, _SMALL_FILE_BYTES)),
+    ):
+      print(title)
+      _measure("sha512 4 KiB reads", file_paths, lambda paths: [_hash_with_small_reads(p) for p in paths])
+      _measure("sha512", file_paths, lambda paths: [hash_file(p) for p in paths])
+      _measure("blake2b", file_paths, lambda paths: [hash_file(p, HashAlgorithm.BLAKE2B) for p in paths])
+      _measure("sha512 4 threads", file_paths, lambda paths: list(hash_files(paths)))
+      _measure("blake2b 4 threads", file_paths, lambda paths: list(hash_files(paths, HashAlgorithm.BLAKE2B)))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,75 @@
+# pages/s of ingesting pdfs in tests/assets, opening source and every page file (before) vs single pass.
+# run from the root of project: python -m benchmarks.pdf_ingestion [rounds]
+import io
+import os
+import sys
+import glob
+import time
+import tempfile
+import pikepdf
+import pdfplumber
+
+from typing import Callable
+from index_package.parser.pdf import PdfParser
+from index_package.parser.page_layout import page_file_path
+from index_package.parser.pdf_extractor import extract_metadata, PdfExtractor, PageContent
+from index_package.utils import hash_bytes, hash_file
+
+_ASSETS_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "assets")
+
+# metadata is read by pdfplumber, pages are split by pikepdf into files and each file is parsed again
+def _ingest_with_reopening(cache_path: str, file_path: str) -> list[PageContent]:
+  pages_path = os.path.join(cache_path, "pages")
+  with pdfplumber.open(file_path) as pdf_file:
+    extract_metadata(pdf_file.metadata)
+
+  page_hashes: list[str] = []
+  with pikepdf.Pdf.open(file_path) as pdf_file:
+    for page in pdf_file.pages:
+      buffer = io.BytesIO()
+      with pikepdf.Pdf.new() as page_file:
+        page_file.pages.append(page)
+        page_file.save(buffer, deterministic_id=True)
+      page_data = buffer.getvalue()
+      page_hash = hash_bytes(page_data)
+      page_path = page_file_path(pages_path, page_hash)
+      os.makedirs(os.path.dirname(page_path), exist_ok=True)
+      with open(page_path, "wb") as file:
+        file.write(page_data)
+      page_hashes.append(page_hash)
+
+  extractor = PdfExtractor(pages_path)
+  return [extractor.extract_page(page_hash) for page_hash in page_hashes]
+
+def _ingest_in_single_pass(cache_path: str, file_path: str) -> list[PageContent]:
+  os.makedirs(cache_path, exist_ok=True)
+  pdf = PdfParser(cache_path).pdf(hash_file(file_path), file_path, lambda _: None)
+  return [PageContent(p.hash, p.snapshot, p.annotations) for p in pdf.pages]
+
+def _measure(name: str, file_paths: list[str], rounds: int, ingest: Callable[[str, str], list[PageContent]]) -> list[PageContent]:
+  pages_count = 0
+  duration = 0.0
+  contents: list[PageContent] = []
+
+  for _ in range(rounds):
+    with tempfile.TemporaryDirectory() as temp_path:
+      cache_path = os.path.join(temp_path, "cache")
+      begin = time.perf_counter()
+      contents = []
+      for file_path in file_paths:
+        contents.extend(ingest(cache_path, file_path))
+      duration += time.perf_counter() - begin
+      pages_count += len(contents)
+
+  print(f"{name:>16}: {pages_count} pages in {duration:.2f}s, {pages_count / duration:8.1f} pages/s")
+  return contents
+
+def main():
+  rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+  file_paths = sorted(glob.glob(os.path.join(_ASSETS_PATH, "*.pdf")))
+  reopening = _measure("reopening", file_paths, rounds, _ingest_with_reopening)
+  single_pass = _measure("single pass", file_paths, rounds, _ingest_in_single_pass)
+  print(f"same page contents: {reopening == single_pass}")
+
+if __name__ == "__main__":
+  main()
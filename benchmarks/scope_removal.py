@@ -0,0 +1,85 @@
+# time of removing a synthetic scope from scanner database, row by row vs set-based SQL.
+# run from the root of project: python -m benchmarks.scope_removal [rows]
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+from index_package.scanner import Scanner, EventTarget
+from index_package.scanner.events import record_removed_event, record_removed_events_of_files
+
+_FILES_PER_FOLDER = 100
+_PENDING_EVENTS_RATE = 10 # one of every 10 files has an event which is not handled yet
+
+def _fill_scope(db_path: str, scope: str, rows: int):
+  conn = sqlite3.connect(db_path)
+  try:
+    cursor = conn.cursor()
+    cursor.execute("BEGIN TRANSACTION")
+    cursor.execute("INSERT INTO scopes (name, path) VALUES (?, ?)", (scope, f"/{scope}"))
+    folders = max(1, rows // (_FILES_PER_FOLDER + 1))
+    cursor.execute(
+      "INSERT INTO files (scope, path, mtime, is_dir, parent_id) VALUES (?, ?, ?, 1, NULL)",
+      (scope, "/", 0.0),
+    )
+    root_id = cursor.lastrowid
+    for i in range(folders):
+      names = [f"file{j}.pdf" for j in range(_FILES_PER_FOLDER)]
+      cursor.execute(
+        "INSERT INTO files (scope, path, mtime, is_dir, parent_id) VALUES (?, ?, ?, 1, ?)",
+        (scope, f"/dir{i}", 0.0, root_id),
+      )
+      folder_id = cursor.lastrowid
+      cursor.executemany(
+        "INSERT INTO files (scope, path, mtime, is_dir, parent_id) VALUES (?, ?, ?, 0, ?)",
+        [(scope, f"/dir{i}/{name}", 0.0, folder_id) for name in names],
+      )
+      cursor.executemany(
+        "INSERT INTO events (kind, target, path, scope, mtime) VALUES (0, 0, ?, ?, 0.0)",
+        [(f"/dir{i}/{name}", scope) for name in names[::_PENDING_EVENTS_RATE]],
+      )
+    conn.commit()
+  finally:
+    conn.close()
+
+def _remove_row_by_row(cursor: sqlite3.Cursor, scope: str):
+  cursor.execute("SELECT path, mtime, is_dir FROM files WHERE scope = ?", (scope,))
+  rows = cursor.fetchall()
+  for path, mtime, is_dir in rows:
+    target = EventTarget.Directory if is_dir else EventTarget.File
+    record_removed_event(cursor, target, path, scope, mtime)
+  cursor.execute("DELETE FROM files WHERE scope = ?", (scope,))
+
+def _measure(name: str, rows: int, remove) -> tuple[float, int]:
+  with tempfile.TemporaryDirectory() as temp_path:
+    db_path = os.path.join(temp_path, "scanner.sqlite3")
+    Scanner(db_path) # creates tables
+    _fill_scope(db_path, name, rows)
+
+    conn = sqlite3.connect(db_path)
+    try:
+      cursor = conn.cursor()
+      begin = time.perf_counter()
+      cursor.execute("BEGIN TRANSACTION")
+      remove(cursor, name)
+      conn.commit()
+      duration = time.perf_counter() - begin
+      cursor.execute("SELECT COUNT(*) FROM events")
+      events_count = cursor.fetchone()[0]
+    finally:
+      conn.close()
+
+  return duration, events_count
+
+def main():
+  rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+  for name, remove in (
+    ("row_by_row", _remove_row_by_row),
+    ("set_based", record_removed_events_of_files),
+  ):
+    duration, events_count = _measure(name, rows, remove)
+    print(f"{name:>10}: removed {rows} rows in {duration:.2f}s, {events_count} events left")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+# query latency of a reader while a writer commits scanner-like small transactions.
+# run from the root of project: python -m benchmarks.sqlite3_profile
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+from sqlite3_pool import register_table_creators, set_connection_profile, ConnectionProfile, SQLite3Pool
+
+_WRITE_TRANSACTIONS = 2000
+_ROWS_PER_TRANSACTION = 50
+
+_PROFILES: dict[str, ConnectionProfile] = {
+  "legacy": ConnectionProfile(
+    journal_mode="DELETE",
+    synchronous="FULL",
+    mmap_size=0,
+    cache_size=-2000,
+    temp_store="DEFAULT",
+    busy_timeout=0,
+  ),
+  "tuned": ConnectionProfile(),
+}
+
+def _create_tables(cursor: sqlite3.Cursor):
+  cursor.execute("""
+    CREATE TABLE files (
+      id INTEGER PRIMARY KEY,
+      scope TEXT NOT NULL,
+      path TEXT NOT NULL,
+      mtime REAL NOT NULL
+    )
+  """)
+  cursor.execute("CREATE INDEX idx_files ON files (scope, path)")
+
+for _name, _profile in _PROFILES.items():
+  register_table_creators(f"bench_{_name}", _create_tables)
+  set_connection_profile(f"bench_{_name}", _profile)
+
+def _write(db: SQLite3Pool, done: threading.Event):
+  with db.connect() as (cursor, conn):
+    for i in range(_WRITE_TRANSACTIONS):
+      while True:
+        try:
+          cursor.execute("BEGIN TRANSACTION")
+          for j in range(_ROWS_PER_TRANSACTION):
+            cursor.execute(
+              "INSERT INTO files (scope, path, mtime) VALUES (?, ?, ?)",
+              ("bench", f"/dir{i}/file{j}", time.time()),
+            )
+          conn.commit()
+          break
+        except sqlite3.OperationalError:
+          conn.rollback()
+  done.set()
+
+def _read(db: SQLite3Pool, done: threading.Event) -> tuple[list[float], int]:
+  latencies: list[float] = []
+  errors: int = 0
+  i = 0
+  with db.connect() as (cursor, _):
+    while not done.is_set():
+      i += 1
+      begin = time.perf_counter()
+      try:
+        cursor.execute(
+          "SELECT mtime FROM files WHERE scope = ? AND path = ?",
+          ("bench", f"/dir{i % _WRITE_TRANSACTIONS}/file0"),
+        )
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - begin)
+      except sqlite3.OperationalError:
+        errors += 1
+  return latencies, errors
+
+def _percentile(values: list[float], rate: float) -> float:
+  if len(values) == 0:
+    return float("nan")
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * rate))]
+
+def main():
+  with tempfile.TemporaryDirectory() as temp_path:
+    for name in _PROFILES.keys():
+      db = SQLite3Pool(f"bench_{name}", os.path.join(temp_path, f"{name}.sqlite3"))
+      done = threading.Event()
+      writer = threading.Thread(target=lambda: _write(db, done))
+      begin = time.perf_counter()
+      writer.start()
+      latencies, errors = _read(db, done)
+      writer.join()
+      duration = time.perf_counter() - begin
+
+      print(
+        f"{name:>8}: write {duration:.2f}s, "
+        f"{len(latencies)} reads, "
+        f"p50 {_percentile(latencies, 0.5) * 1000:.3f}ms, "
+        f"p99 {_percentile(latencies, 0.99) * 1000:.3f}ms, "
+        f"max {max(latencies, default=0.0) * 1000:.3f}ms, "
+        f"{errors} locked errors"
+      )
+
+if __name__ == "__main__":
+  main()
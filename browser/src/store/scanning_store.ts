@@ -13,6 +13,12 @@ type Event = {
 } | {
   readonly kind: "scanCompleted";
   readonly count: number;
+  readonly final: boolean;
+} | {
+  readonly kind: "scanScopeProgress";
+  readonly scope: string;
+  readonly count: number;
+  readonly completed: boolean;
 } | {
   readonly kind: "startHandingFile";
   readonly path: string;
@@ -32,11 +38,15 @@ type Event = {
 } | {
   readonly kind: "failure";
   readonly error: string;
+} | {
+  readonly kind: "watchingFailure";
+  readonly error: string;
 };
 
 export type ScanningStore$ = {
   readonly phase: ReadonlyVal<ScanningPhase>;
   readonly scanCount: ReadonlyVal<number>;
+  readonly scanningScopes: ReadonlyVal<readonly ScanningScope[]>;
   readonly handlingFile: ReadonlyVal<HandingFile | null>;
   readonly completedFiles: ReadonlyVal<readonly File[]>;
   readonly error: ReadonlyVal<string | null>;
@@ -52,6 +62,12 @@ export enum ScanningPhase {
   Completed,
 }
 
+export type ScanningScope = {
+  readonly scope: string;
+  readonly count: number;
+  readonly completed: boolean;
+};
+
 export type File = {
   readonly path: string;
   readonly operation: FileOperation;
@@ -75,6 +91,7 @@ export class ScanningStore {
 
   readonly #phase$: Val<ScanningPhase> = val(ScanningPhase.Ready);
   readonly #scanCount$: Val<number> = val(0);
+  readonly #scanningScopes$: Val<readonly ScanningScope[]> = val<readonly ScanningScope[]>([]);
   readonly #handlingFile$: Val<HandingFile | null> = val<HandingFile | null>(null);
   readonly #completedFiles$: Val<readonly File[]> = val<readonly File[]>([]);
   readonly #error$: Val<string | null> = val<string | null>(null);
@@ -87,6 +104,7 @@ export class ScanningStore {
     this.$ = {
       phase: derive(this.#phase$),
       scanCount: derive(this.#scanCount$),
+      scanningScopes: derive(this.#scanningScopes$),
       handlingFile: derive(this.#handlingFile$),
       completedFiles: derive(this.#completedFiles$),
       error: derive(this.#error$),
@@ -152,6 +170,7 @@ export class ScanningStore {
         case "scanning": {
           this.#phase$.set(ScanningPhase.Scanning);
           this.#scanCount$.set(0);
+          this.#scanningScopes$.set([]);
           this.#handlingFile$.set(null);
           this.#completedFiles$.set([]);
           this.#error$.set(null);
@@ -163,6 +182,20 @@ export class ScanningStore {
           this.#scanCount$.set(event.count);
           break;
         }
+        case "scanScopeProgress": {
+          const scope: ScanningScope = {
+            scope: event.scope,
+            count: event.count,
+            completed: event.completed,
+          };
+          const scopes = this.#scanningScopes$.value;
+          if (scopes.some((s) => s.scope === event.scope)) {
+            this.#scanningScopes$.set(scopes.map((s) => s.scope === event.scope ? scope : s));
+          } else {
+            this.#scanningScopes$.set([...scopes, scope]);
+          }
+          break;
+        }
         case "startHandingFile": {
           this.#handlingFile$.set({
             path: event.path,
@@ -209,6 +242,11 @@ export class ScanningStore {
           this.#error$.set(event.error);
           break;
         }
+        case "watchingFailure": {
+          // scanning is not failed, changes are found by next full scan
+          message.warning(event.error);
+          break;
+        }
         case "interrupting": {
           this.#isInterrupting$.set(true);
           break;
@@ -96,6 +96,7 @@ const ScanningPanel: React.FC<ScanningPanelProps> = ({ store }) => {
   const records: Record[] = [];
   const phase = useVal(store.$.phase);
   const scanCount = useVal(store.$.scanCount);
+  const scanningScopes = useVal(store.$.scanningScopes);
   const completedFiles = useVal(store.$.completedFiles);
   const handlingFile = useVal(store.$.handlingFile);
   const error = useVal(store.$.error);
@@ -137,6 +138,16 @@ const ScanningPanel: React.FC<ScanningPanelProps> = ({ store }) => {
       loading: false,
     });
   }
+  for (const scope of scanningScopes) {
+    records.push({
+      icon: <ProfileTwoTone />,
+      title: `扫描 ${scope.scope}`,
+      content: scope.completed ?
+        `扫描完成，共 ${scope.count} 个文件` :
+        `已扫描 ${scope.count} 个文件……`,
+      loading: !scope.completed,
+    });
+  }
   for (const file of completedFiles) {
     records.push({
       icon: <FilePdfTwoTone />,
@@ -1,2 +1,21 @@
-from .service import Service, ServiceScanJob, QueryResult, PdfQueryItem, PageQueryItem, PagePDFFile, PageAnnoQueryItem, PageHighlightSegment
-from .progress_events import *
\ No newline at end of file
+from typing import TYPE_CHECKING
+from .progress_events import *
+from .scanner import ScanFilter
+from .parser import set_page_cache_size, page_cache_statistics
+from .utils import HashAlgorithm
+
+if TYPE_CHECKING:
+  from .service import Service, ServiceScanJob, QueryResult, PdfQueryItem, PageQueryItem, PagePDFFile, PageAnnoQueryItem, PageHighlightSegment
+
+# service imports models (spacy, chromadb, torch), so it's imported when it's used at first.
+# processes which extract pages of pdf import this package too, but never load models.
+_SERVICE_NAMES = (
+  "Service", "ServiceScanJob", "QueryResult", "PdfQueryItem", "PageQueryItem",
+  "PagePDFFile", "PageAnnoQueryItem", "PageHighlightSegment",
+)
+
+def __getattr__(name: str):
+  if name in _SERVICE_NAMES:
+    from . import service
+    return getattr(service, name)
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
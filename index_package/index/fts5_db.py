@@ -3,7 +3,7 @@ import json
 
 from typing import Generator
 from sqlite3 import Cursor
-from sqlite3_pool import register_table_creators, SQLite3Pool
+from sqlite3_pool import register_table_creators, SQLite3Pool, SQLite3BatchSession
 from .types import IndexNode, IndexSegment, IndexNodeMatching
 from ..segmentation import Segment
 
@@ -31,7 +31,7 @@ class FTS5DB:
     if len(query_tokens) == 0:
       return
 
-    with self._db.connect() as (cursor, _):
+    with self._db.connect(readonly=True) as (cursor, _):
       query_with_and = " AND ".join(query_tokens)
       if is_or_condition:
         query_with_or = " OR ".join(query_tokens)
@@ -74,39 +74,33 @@ class FTS5DB:
     if len(encoded_segments) == 0:
       return
 
-    with self._db.connect() as (cursor, conn):
-      try:
-        document = " ".join(tokens)
-        cursor.execute("BEGIN TRANSACTION")
-        cursor.execute("INSERT INTO contents (content) VALUES (?)", (document,))
-        content_id = cursor.lastrowid
-        type = metadata.get("type", None)
-        metadata_json = json.dumps(metadata)
-        cursor.execute(
-          "INSERT INTO nodes (node_id, type, metadata, segments, content_id) VALUES (?, ?, ?, ?, ?)",
-          (node_id, type, metadata_json, encoded_segments, content_id),
-        )
-        conn.commit()
-
-      except Exception as e:
-        conn.rollback()
-        raise e
+    with self._db.write() as cursor:
+      document = " ".join(tokens)
+      cursor.execute("INSERT INTO contents (content) VALUES (?)", (document,))
+      content_id = cursor.lastrowid
+      type = metadata.get("type", None)
+      metadata_json = json.dumps(metadata)
+      cursor.execute(
+        "INSERT INTO nodes (node_id, type, metadata, segments, content_id) VALUES (?, ?, ?, ?, ?)",
+        (node_id, type, metadata_json, encoded_segments, content_id),
+      )
 
   def remove(self, node_id: str):
-    with self._db.connect() as (cursor, conn):
-      try:
-        cursor.execute("SELECT content_id FROM nodes WHERE node_id = ?", (node_id,))
-        row = cursor.fetchone()
-        if row is not None:
-          cursor.execute("BEGIN TRANSACTION")
-          content_id = row[0]
-          cursor.execute("DELETE FROM contents WHERE rowid = ?", (content_id,))
-          cursor.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
-          conn.commit()
-
-      except Exception as e:
-        conn.rollback()
-        raise e
+    # write lock is taken only if there is a node to remove
+    with self._db.read() as cursor:
+      cursor.execute("SELECT content_id FROM nodes WHERE node_id = ?", (node_id,))
+      row = cursor.fetchone()
+    if row is None:
+      return
+
+    with self._db.write() as cursor:
+      content_id = row[0]
+      cursor.execute("DELETE FROM contents WHERE rowid = ?", (content_id,))
+      cursor.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+  # save() and remove() called in current thread are committed together until it closed
+  def batch(self) -> SQLite3BatchSession:
+    return self._db.batch()
 
   def _analysis_segments(
       self,
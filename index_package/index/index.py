@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import os
 import io
+import threading
 
 from typing import Optional
 from sqlite3 import Cursor
-from sqlite3_pool import register_table_creators, SQLite3Pool
+from sqlite3_pool import register_table_creators, register_migration, SQLite3Pool, SQLite3BatchSession
 from .fts5_db import FTS5DB
 from .vector_db import VectorDB
 from .index_db import IndexDB
@@ -13,7 +14,7 @@ from .types import IndexNode, PageRelativeToPDF
 from ..parser import PdfParser, PdfMetadata, PdfPage
 from ..scanner import Scope, Event, EventKind, EventTarget
 from ..segmentation import Segment, Segmentation
-from ..utils import hash_sha512, ensure_parent_dir, is_empty_string, assert_continue, InterruptException
+from ..utils import hash_file, hash_files, hash_algorithm_of, HashAlgorithm, ensure_parent_dir, is_empty_string, assert_continue, InterruptException
 from ..progress_events import (
   FileFormat,
   PDFFileProgressEvent,
@@ -24,6 +25,28 @@ from ..progress_events import (
   ProgressEventListener,
 )
 
+# size of a page in average, pages of pdf are guessed by size of file
+_AVERAGE_PAGE_BYTES = 100 * 1024
+
+# hashing bytes of file costs about the same as extracting one page
+_HASHED_BYTES_PER_PAGE = 32 * 1024 * 1024
+
+# files of other hash algorithm are hashed again by this count at a time, their aliases are committed together
+_ALIASED_FILES_PER_COMMIT = 64
+
+# (device, inode, size, mtime_ns) of file, content hash is reused while it never changed
+_Fingerprint = tuple[int, int, int, int]
+
+def _fingerprint(path: str) -> _Fingerprint:
+  stat = os.stat(path)
+  return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+def _fingerprint_or_none(path: str) -> Optional[_Fingerprint]:
+  try:
+    return _fingerprint(path)
+  except OSError:
+    return None
+
 class Index:
   def __init__(
     self,
@@ -33,8 +56,10 @@ class Index:
     segmentation: Segmentation,
     fts5_db: FTS5DB,
     vector_db: VectorDB,
+    hash_algorithm: HashAlgorithm = HashAlgorithm.SHA512,
   ):
     self._scope: Scope = scope
+    self._hash_algorithm: HashAlgorithm = hash_algorithm
     self._pdf_parser: PdfParser = pdf_parser
     self._segmentation: Segmentation = segmentation
     self._index_db: IndexDB = IndexDB(fts5_db, vector_db)
@@ -43,9 +68,10 @@ class Index:
       path=ensure_parent_dir(os.path.join(index_dir_path, "index.sqlite3")),
     )
     self._db: SQLite3Pool = db.assert_format("index")
+    self._did_alias_hashes: bool = False
 
   def get_paths(self, file_hash: str) -> list[str]:
-    with self._db.connect() as (cursor, _):
+    with self._db.connect(readonly=True) as (cursor, _):
       cursor.execute("SELECT scope, path FROM files WHERE hash = ?", (file_hash,))
       paths: list[str] = []
 
@@ -57,7 +83,7 @@ class Index:
       return paths
 
   def get_page_relative_to_pdf(self, page_hash: str) -> list[PageRelativeToPDF]:
-    with self._db.connect() as (cursor, _):
+    with self._db.connect(readonly=True) as (cursor, _):
       cursor.execute("SELECT pdf_hash, page_index FROM pages WHERE hash = ?", (page_hash,))
       page_infos: list[tuple[str, int]] = []
       pages: list[PageRelativeToPDF] = []
@@ -108,6 +134,30 @@ class Index:
 
     return query_nodes, keywords
 
+  # estimated cost of handling event, in pages.
+  # removing is almost free, and extracting pages costs most.
+  # it's called for every event before any event is handled, so it never opens the file.
+  def estimate_cost(self, event: Event) -> float:
+    if event.kind == EventKind.Removed:
+      return 0.0
+
+    path = self._filter_and_get_abspath(event)
+    if path is None:
+      return 0.0
+
+    try:
+      fingerprint = _fingerprint(path)
+    except OSError:
+      return 0.0
+
+    with self._db.connect(readonly=True) as (cursor, _):
+      if self._cached_hash(cursor, fingerprint) is not None:
+        # unchanged, moved or renamed file, its index will be reused
+        return 0.0
+
+    size = fingerprint[2]
+    return size / _AVERAGE_PAGE_BYTES + size / _HASHED_BYTES_PER_PAGE
+
   def handle_event(self, event: Event, listener: ProgressEventListener):
     path = self._filter_and_get_abspath(event)
     if path is None:
@@ -129,7 +179,8 @@ class Index:
       format=FileFormat.PDF,
       operation=operation,
     ))
-    with self._db.connect() as (cursor, conn):
+    # writes of fts5 are committed in batch, and they must be flushed before index committed
+    with self._db.connect() as (cursor, conn), self._index_db.batch() as index_batch:
       try:
         cursor.execute("BEGIN TRANSACTION")
         new_hash, origin_id_hash = self._update_file_with_event(cursor, path, event)
@@ -140,16 +191,17 @@ class Index:
         if new_hash is not None:
           cursor.execute("SELECT COUNT(*) FROM files WHERE hash = ?", (new_hash,))
           num_rows = cursor.fetchone()[0]
-          if num_rows == 1:
-            self._handle_found_pdf_hash(cursor, new_hash, path, listener)
+          if num_rows == 1 and not self._revive_lost_hash(cursor, new_hash):
+            self._handle_found_pdf_hash(cursor, index_batch, new_hash, path, listener)
 
-        # process that commit deleted pages is not breakable.
+        # index of lost file is kept until purge_lost_files(), a moved file may find it again.
         if origin_id_hash is not None:
-          _, origin_hash = origin_id_hash
+          _, origin_hash, origin_fingerprint = origin_id_hash
           cursor.execute("SELECT * FROM files WHERE hash = ? LIMIT 1", (origin_hash,))
           if cursor.fetchone() is None:
-            self._handle_lost_pdf_hash(cursor, origin_hash)
+            self._record_lost_hash(cursor, origin_hash, origin_fingerprint)
 
+        index_batch.flush()
         conn.commit()
         listener(CompleteHandleFileEvent(path=path))
 
@@ -174,33 +226,58 @@ class Index:
 
     return path
 
-  def _update_file_with_event(self, cursor: Cursor, path: str, event: Event) -> tuple[Optional[str], Optional[tuple[int, str]]]:
-    cursor.execute("SELECT id, hash FROM files WHERE scope = ? AND path = ?", (event.scope, event.path,))
+  def _update_file_with_event(
+      self,
+      cursor: Cursor,
+      path: str,
+      event: Event,
+    ) -> tuple[Optional[str], Optional[tuple[int, str, Optional[_Fingerprint]]]]:
+
+    cursor.execute(
+      "SELECT id, hash, device, inode, size, mtime_ns FROM files WHERE scope = ? AND path = ?",
+      (event.scope, event.path,),
+    )
     row = cursor.fetchone()
     new_hash: Optional[str] = None
-    origin_id_hash: Optional[tuple[int, str]] = None
+    origin_id_hash: Optional[tuple[int, str, Optional[_Fingerprint]]] = None
     did_update = False
 
     if row is not None:
-      id, hash = row
-      origin_id_hash = (id, hash)
+      id, hash, device, inode, size, mtime_ns = row
+      origin_fingerprint: Optional[_Fingerprint] = None
+      if device is not None:
+        origin_fingerprint = (device, inode, size, mtime_ns)
+      origin_id_hash = (id, hash, origin_fingerprint)
 
     if event.kind != EventKind.Removed:
-      new_hash = hash_sha512(path)
+      # stat before hashing, a change during hashing will be found by next scan
+      fingerprint = _fingerprint(path)
+      if origin_id_hash is not None and origin_id_hash[2] == fingerprint:
+        new_hash = origin_id_hash[1]
+      else:
+        new_hash = self._cached_hash(cursor, fingerprint)
+      if new_hash is None:
+        # ids of another algorithm are kept while their files never change,
+        # so that changing algorithm never rebuilds indexes of all files at once.
+        new_hash = self._origin_hash(cursor, hash_file(path, self._hash_algorithm))
+
       if origin_id_hash is None:
         cursor.execute(
-          "INSERT INTO files (type, scope, path, hash) VALUES (?, ?, ?, ?)",
-          ("pdf", event.scope, event.path, new_hash),
+          "INSERT INTO files (type, scope, path, hash, device, inode, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+          ("pdf", event.scope, event.path, new_hash, *fingerprint),
         )
         did_update = True
       else:
-        origin_id, origin_hash = origin_id_hash
+        origin_id, origin_hash, _ = origin_id_hash
+        cursor.execute(
+          "UPDATE files SET hash = ?, device = ?, inode = ?, size = ?, mtime_ns = ? WHERE id = ?",
+          (new_hash, *fingerprint, origin_id),
+        )
         if new_hash != origin_hash:
-          cursor.execute("UPDATE files SET hash = ? WHERE id = ?", (new_hash, origin_id,))
           did_update = True
 
     elif origin_id_hash is not None:
-      origin_id, _ = origin_id_hash
+      origin_id, _, _ = origin_id_hash
       cursor.execute("DELETE FROM files WHERE id = ?", (origin_id,))
       did_update = True
 
@@ -209,14 +286,119 @@ class Index:
 
     return new_hash, origin_id_hash
 
-  def _handle_found_pdf_hash(self, cursor: Cursor, hash: str, path: str, listener: ProgressEventListener):
+  # a new copy of file which has an id of another algorithm gets the same id
+  def _origin_hash(self, cursor: Cursor, hash: str) -> str:
+    cursor.execute("SELECT origin_hash FROM hash_aliases WHERE hash = ?", (hash,))
+    row = cursor.fetchone()
+    if row is None:
+      return hash
+    return row[0]
+
+  # contents of files which have ids of another algorithm are hashed by current algorithm once, in parallel.
+  # it should be called before events are handled, aliases of ids find new copies of these files.
+  def alias_hashes(self, interrupted: threading.Event):
+    if self._did_alias_hashes:
+      return
+
+    targets: dict[str, tuple[str, _Fingerprint]] = {}
+    with self._db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT hash, origin_hash FROM hash_aliases")
+      aliased_hashes: set[str] = set(
+        origin_hash for hash, origin_hash in cursor.fetchall()
+        if hash_algorithm_of(hash) == self._hash_algorithm
+      )
+      cursor.execute("SELECT hash, scope, path, device, inode, size, mtime_ns FROM files WHERE device IS NOT NULL")
+      for hash, scope, path, device, inode, size, mtime_ns in cursor.fetchall():
+        if hash in aliased_hashes or hash in targets or hash_algorithm_of(hash) == self._hash_algorithm:
+          continue
+        abs_path = self._get_abs_path(scope, path)
+        if abs_path is not None:
+          targets[hash] = (abs_path, (device, inode, size, mtime_ns))
+
+    target_list = list(targets.items())
+    for begin in range(0, len(target_list), _ALIASED_FILES_PER_COMMIT):
+      if interrupted.is_set():
+        return
+      chunk = target_list[begin:begin + _ALIASED_FILES_PER_COMMIT]
+      aliases: list[tuple[str, str]] = []
+      hashes = hash_files((path for _, (path, _) in chunk), self._hash_algorithm)
+
+      for (origin_hash, (path, fingerprint)), hash in zip(chunk, hashes):
+        # file changed since it was recorded has another content, its event will handle it
+        if hash is not None and _fingerprint_or_none(path) == fingerprint:
+          aliases.append((hash, origin_hash))
+
+      with self._db.connect() as (cursor, conn):
+        try:
+          cursor.execute("BEGIN TRANSACTION")
+          cursor.executemany("INSERT OR IGNORE INTO hash_aliases (hash, origin_hash) VALUES (?, ?)", aliases)
+          conn.commit()
+        except Exception as e:
+          conn.rollback()
+          raise e
+
+    self._did_alias_hashes = True
+
+  # hash of file which has the same fingerprint, it may be at another path (moved or renamed) or lost.
+  def _cached_hash(self, cursor: Cursor, fingerprint: _Fingerprint) -> Optional[str]:
+    for table in ("files", "lost_files"):
+      cursor.execute(
+        f"SELECT hash FROM {table} WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ? LIMIT 1",
+        fingerprint,
+      )
+      row = cursor.fetchone()
+      if row is not None:
+        return row[0]
+    return None
+
+  def _record_lost_hash(self, cursor: Cursor, hash: str, fingerprint: Optional[_Fingerprint]):
+    cursor.execute(
+      "INSERT OR REPLACE INTO lost_files (hash, device, inode, size, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+      (hash, *(fingerprint or (None, None, None, None))),
+    )
+
+  # returns True if the hash was lost and its index is still there
+  def _revive_lost_hash(self, cursor: Cursor, hash: str) -> bool:
+    cursor.execute("DELETE FROM lost_files WHERE hash = ?", (hash,))
+    return cursor.rowcount > 0
+
+  # removes indexes of files which were lost and never found again.
+  # it should be called when a scan job completed, moved files which were handled have been found by then.
+  def purge_lost_files(self):
+    with self._db.connect() as (cursor, conn), self._index_db.batch() as index_batch:
+      try:
+        cursor.execute("BEGIN TRANSACTION")
+        cursor.execute("SELECT hash FROM lost_files")
+        lost_hashes: list[str] = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM lost_files")
+
+        for hash in lost_hashes:
+          cursor.execute("SELECT * FROM files WHERE hash = ? LIMIT 1", (hash,))
+          if cursor.fetchone() is None:
+            self._handle_lost_pdf_hash(cursor, hash)
+
+        index_batch.flush()
+        conn.commit()
+
+      except Exception as e:
+        conn.rollback()
+        raise e
+
+  def _handle_found_pdf_hash(
+      self,
+      cursor: Cursor,
+      index_batch: SQLite3BatchSession,
+      hash: str,
+      path: str,
+      listener: ProgressEventListener,
+    ):
     pdf = self._pdf_parser.pdf(hash, path, listener)
     for page in pdf.pages:
       cursor.execute(
         "INSERT INTO pages (pdf_hash, page_index, hash) VALUES (?, ?, ?)",
         (hash, page.index, page.hash),
       )
-    index_context = _IndexContext(self._segmentation, self._index_db)
+    index_context = _IndexContext(self._segmentation, self._index_db, index_batch)
     index_context.save(hash, "pdf", self._pdf_metadata_to_document(pdf.metadata))
 
     try:
@@ -253,6 +435,7 @@ class Index:
       page_hashes.append(row[0])
 
     cursor.execute("DELETE FROM pages WHERE pdf_hash = ?", (hash,))
+    cursor.execute("DELETE FROM hash_aliases WHERE origin_hash = ?", (hash,))
     self._index_db.remove(hash)
 
     for page_hash in page_hashes:
@@ -300,12 +483,15 @@ class Index:
         )
 
 class _IndexContext:
-  def __init__(self, segmentation: Segmentation, index_db: IndexDB):
+  def __init__(self, segmentation: Segmentation, index_db: IndexDB, index_batch: SQLite3BatchSession):
     self._segmentation: Segmentation = segmentation
     self._index_db: IndexDB = index_db
+    self._index_batch: SQLite3BatchSession = index_batch
     self._added_ids: list[str] = []
 
   def save(self, id: str, type: str, text: str, properties: Optional[dict] = None):
+    # segmentation and embedding are long, fts5 must not keep write lock meanwhile
+    self._index_batch.flush_if_due()
     segments: list[Segment] = []
     for segment in self._segmentation.split(text):
       if is_empty_string(segment.text):
@@ -355,4 +541,53 @@ def _create_tables(cursor: Cursor):
     CREATE INDEX idx_parent_pages ON pages (pdf_hash, page_index)
   """)
 
-register_table_creators("index", _create_tables)
\ No newline at end of file
+def _migrate_add_covering_indexes(cursor: Cursor):
+  cursor.execute("DROP INDEX IF EXISTS idx_files")
+  cursor.execute("DROP INDEX IF EXISTS idx_pages")
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_files ON files (hash, scope, path)
+  """)
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_scope_files ON files (scope, path)
+  """)
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_pages ON pages (hash, pdf_hash, page_index)
+  """)
+
+def _migrate_add_fingerprints(cursor: Cursor):
+  # NULL means the file was recorded before, it will be hashed again once
+  for column in ("device", "inode", "size", "mtime_ns"):
+    cursor.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+  cursor.execute("""
+    CREATE INDEX idx_inode_files ON files (device, inode)
+  """)
+  # hashes which lost all their files, indexes of them are kept until purged
+  cursor.execute("""
+    CREATE TABLE lost_files (
+      hash TEXT PRIMARY KEY,
+      device INTEGER,
+      inode INTEGER,
+      size INTEGER,
+      mtime_ns INTEGER
+    )
+  """)
+  cursor.execute("""
+    CREATE INDEX idx_inode_lost_files ON lost_files (device, inode)
+  """)
+
+def _migrate_add_hash_aliases(cursor: Cursor):
+  # hash of current algorithm -> id of same content recorded by another algorithm
+  cursor.execute("""
+    CREATE TABLE hash_aliases (
+      hash TEXT PRIMARY KEY,
+      origin_hash TEXT NOT NULL
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("""
+    CREATE INDEX idx_origin_hash_aliases ON hash_aliases (origin_hash)
+  """)
+
+register_table_creators("index", _create_tables)
+register_migration("index", 1, _migrate_add_covering_indexes)
+register_migration("index", 2, _migrate_add_fingerprints)
+register_migration("index", 3, _migrate_add_hash_aliases)
\ No newline at end of file
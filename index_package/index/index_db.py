@@ -1,3 +1,4 @@
+from sqlite3_pool import SQLite3BatchSession
 from .types import IndexNode, IndexNodeMatching
 from .fts5_db import FTS5DB
 from .vector_db import VectorDB, Embedding
@@ -8,14 +9,18 @@ class IndexDB:
     self._fts5_db: FTS5DB = fts5_db
     self._vector_db: VectorDB = vector_db
 
+  # embedding is computed before writing fts5, which takes write lock of its batch
   def save(self, node_id: str, segments: list[Segment], metadata: dict):
-    self._fts5_db.save(node_id, segments, metadata)
     self._vector_db.save(node_id, segments, metadata)
+    self._fts5_db.save(node_id, segments, metadata)
 
   def remove(self, node_id: str):
     self._fts5_db.remove(node_id)
     self._vector_db.remove(node_id)
 
+  def batch(self) -> SQLite3BatchSession:
+    return self._fts5_db.batch()
+
   def query(self, query: str, results_limit: int) -> list[IndexNode]:
     matched_node_ids: set[str] = set()
     matched_nodes: list[IndexNode] = []
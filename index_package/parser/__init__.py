@@ -1,2 +1,3 @@
 from .pdf import Pdf, PdfMetadata, PdfParser, PdfPage, PdfParserListeners
-from .pdf_extractor import Annotation
\ No newline at end of file
+from .pdf_extractor import Annotation
+from .page_cache import PageCacheStatistics, set_page_cache_size, page_cache_statistics
\ No newline at end of file
@@ -0,0 +1,15 @@
+import sys
+
+from .page_layout import migrate_flat_pages
+
+# python -m index_package.parser.migrate_pages <workspace>/parser/pdf_cache/pages
+# caches are also migrated when the service starts, this tool is to do it ahead of time.
+def main():
+  if len(sys.argv) != 2:
+    print("usage: python -m index_package.parser.migrate_pages <pages dir>")
+    sys.exit(1)
+  moved_count = migrate_flat_pages(sys.argv[1])
+  print(f"moved {moved_count} page files into shards")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import sys
+import threading
+
+from typing import Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from .pdf_extractor import Annotation
+
+_DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+_ANNOTATION_BYTES = 256 # rough size of an annotation object without its texts
+
+@dataclass
+class PageCacheStatistics:
+  hits: int
+  misses: int
+  evictions: int
+  entries: int
+  bytes: int
+  max_bytes: int
+
+# snapshots and annotations of hot pages are kept in memory of process, because PdfPage
+# instances are created again by every query. pages are content-addressed, so hash of page is the key.
+# cached annotations are shared by pages of same hash, they must not be modified.
+class PageCache:
+  def __init__(self, max_bytes: int = _DEFAULT_MAX_BYTES):
+    self._lock: threading.Lock = threading.Lock()
+    self._max_bytes: int = max_bytes
+    self._bytes: int = 0
+    # page hash -> (snapshot, annotations, bytes), least recently used first
+    self._entries: OrderedDict[str, tuple[str, list[Annotation], int]] = OrderedDict()
+    self._hits: int = 0
+    self._misses: int = 0
+    self._evictions: int = 0
+
+  def get(self, page_hash: str) -> Optional[tuple[str, list[Annotation]]]:
+    with self._lock:
+      entry = self._entries.get(page_hash, None)
+      if entry is None:
+        self._misses += 1
+        return None
+      self._entries.move_to_end(page_hash)
+      self._hits += 1
+      snapshot, annotations, _ = entry
+      return snapshot, annotations
+
+  def put(self, page_hash: str, snapshot: str, annotations: list[Annotation]):
+    size = _content_bytes(snapshot, annotations)
+    with self._lock:
+      if size > self._max_bytes:
+        return
+      self._remove(page_hash)
+      self._entries[page_hash] = (snapshot, annotations, size)
+      self._bytes += size
+      self._evict()
+
+  def invalidate(self, page_hash: str):
+    with self._lock:
+      self._remove(page_hash)
+
+  def resize(self, max_bytes: int):
+    with self._lock:
+      self._max_bytes = max_bytes
+      self._evict()
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def statistics(self) -> PageCacheStatistics:
+    with self._lock:
+      return PageCacheStatistics(
+        hits=self._hits,
+        misses=self._misses,
+        evictions=self._evictions,
+        entries=len(self._entries),
+        bytes=self._bytes,
+        max_bytes=self._max_bytes,
+      )
+
+  def _remove(self, page_hash: str):
+    entry = self._entries.pop(page_hash, None)
+    if entry is not None:
+      self._bytes -= entry[2]
+
+  def _evict(self):
+    while self._bytes > self._max_bytes:
+      _, (_, _, size) = self._entries.popitem(last=False)
+      self._bytes -= size
+      self._evictions += 1
+
+_PAGE_CACHE: PageCache = PageCache()
+
+def page_cache() -> PageCache:
+  return _PAGE_CACHE
+
+# 0 disables the cache
+def set_page_cache_size(max_bytes: int) -> None:
+  _PAGE_CACHE.resize(max_bytes)
+
+def page_cache_statistics() -> PageCacheStatistics:
+  return _PAGE_CACHE.statistics()
+
+def _content_bytes(snapshot: str, annotations: list[Annotation]) -> int:
+  size = sys.getsizeof(snapshot)
+  for annotation in annotations:
+    size += _ANNOTATION_BYTES
+    for text in (annotation.title, annotation.content, annotation.uri, annotation.extracted_text):
+      if text is not None:
+        size += sys.getsizeof(text)
+    if annotation.quad_points is not None:
+      size += 8 * len(annotation.quad_points)
+  return size
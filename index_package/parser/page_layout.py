@@ -0,0 +1,39 @@
+import os
+
+# page files are sharded by first two characters of hash, 64 * 64 folders at most.
+# directory operations of a folder slow down badly with hundreds of thousands entries.
+_SHARD_LEVELS = 2
+
+def page_file_path(pages_path: str, page_hash: str) -> str:
+  shards = [page_hash[i] for i in range(_SHARD_LEVELS)]
+  return os.path.join(pages_path, *shards, f"{page_hash}.pdf")
+
+# moves page files of flat layout (old versions) into shards, returns count of moved files.
+# other files are left, snapshots and annotations beside them are imported by page store.
+# it can be interrupted and run again. once pages were moved, it only lists the shard folders.
+def migrate_flat_pages(pages_path: str) -> int:
+  moved_count: int = 0
+  if not os.path.isdir(pages_path):
+    return moved_count
+
+  with os.scandir(pages_path) as entries:
+    for entry in entries:
+      if not entry.is_file():
+        continue
+      page_hash, ext_name = os.path.splitext(entry.name)
+      if ext_name == ".tmp":
+        # written partly by an interrupted process
+        os.remove(entry.path)
+        continue
+      if ext_name != ".pdf" or len(page_hash) < _SHARD_LEVELS:
+        continue
+
+      target_path = page_file_path(pages_path, page_hash)
+      if os.path.exists(target_path):
+        os.remove(entry.path)
+      else:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(entry.path, target_path)
+      moved_count += 1
+
+  return moved_count
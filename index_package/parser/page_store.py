@@ -0,0 +1,179 @@
+import os
+import json
+import zlib
+
+from typing import Optional
+from sqlite3 import Cursor
+from sqlite3_pool import SQLite3Pool
+
+from .pdf_extractor import Annotation, PageContent
+from .page_cache import page_cache
+
+# snapshots and annotations of all pages are packed in one table of pdf database, instead of
+# two loose files per page. reading both of a page is one lookup of primary key.
+class PageStore:
+  def __init__(self, db: SQLite3Pool, compress: bool = False):
+    self._db: SQLite3Pool = db
+    self._compress: bool = compress
+
+  # it's written in transaction of caller, together with the state of page
+  def save(self, cursor: Cursor, content: PageContent):
+    snapshot: Optional[bytes] = None
+    annotations: Optional[bytes] = None
+
+    if content.snapshot != "":
+      snapshot = content.snapshot.encode("utf-8")
+    if len(content.annotations) > 0:
+      annotation_json = [_annotation_to_json(a) for a in content.annotations]
+      annotations = json.dumps(annotation_json, ensure_ascii=False).encode("utf-8")
+    if self._compress:
+      snapshot = _compress(snapshot)
+      annotations = _compress(annotations)
+
+    cursor.execute(
+      "INSERT OR REPLACE INTO page_artifacts (hash, snapshot, annotations, compressed) VALUES (?, ?, ?, ?)",
+      (content.hash, snapshot, annotations, self._compress),
+    )
+    page_cache().invalidate(content.hash)
+
+  # caller invalidates cached page after its transaction was committed
+  def remove(self, cursor: Cursor, page_hash: str):
+    cursor.execute("DELETE FROM page_artifacts WHERE hash = ?", (page_hash,))
+
+  def read(self, page_hash: str) -> tuple[str, list[Annotation]]:
+    cached = page_cache().get(page_hash)
+    if cached is not None:
+      return cached
+
+    page = self._read_from_db(page_hash)
+    if page is None:
+      # page may be saved later, a cached miss would hide it
+      return "", []
+
+    snapshot, annotations = page
+    page_cache().put(page_hash, snapshot, annotations)
+    return snapshot, annotations
+
+  def _read_from_db(self, page_hash: str) -> Optional[tuple[str, list[Annotation]]]:
+    with self._db.connect(readonly=True) as (cursor, _):
+      cursor.execute(
+        "SELECT snapshot, annotations, compressed FROM page_artifacts WHERE hash = ?",
+        (page_hash,),
+      )
+      row = cursor.fetchone()
+
+    if row is None:
+      return None
+
+    snapshot, annotations, compressed = row
+    if compressed:
+      snapshot = _decompress(snapshot)
+      annotations = _decompress(annotations)
+
+    snapshot_text: str = ""
+    annotation_list: list[Annotation] = []
+    if snapshot is not None:
+      snapshot_text = snapshot.decode("utf-8")
+    if annotations is not None:
+      annotation_list = [_annotation_from_json(j) for j in json.loads(annotations)]
+
+    return snapshot_text, annotation_list
+
+  # loose files of a cache created by old version are removed once they were imported
+  def remove_legacy_files(self, pages_path: str):
+    with self._db.connect() as (cursor, conn):
+      cursor.execute("SELECT name FROM legacy_page_files")
+      names: list[str] = [row[0] for row in cursor.fetchall()]
+      if len(names) == 0:
+        return
+
+      for name in names:
+        file_path = os.path.join(pages_path, name)
+        if os.path.exists(file_path):
+          os.remove(file_path)
+      try:
+        cursor.execute("DELETE FROM legacy_page_files")
+        conn.commit()
+      except Exception as e:
+        conn.rollback()
+        raise e
+
+def _compress(data: Optional[bytes]) -> Optional[bytes]:
+  if data is None:
+    return None
+  return zlib.compress(data)
+
+def _decompress(data: Optional[bytes]) -> Optional[bytes]:
+  if data is None:
+    return None
+  return zlib.decompress(data)
+
+def _annotation_to_json(annotation: Annotation) -> dict:
+  to_json = {}
+  if annotation.type is not None:
+    to_json["type"] = annotation.type
+  if annotation.title is not None:
+    to_json["title"] = annotation.title
+  if annotation.content is not None:
+    to_json["content"] = annotation.content
+  if annotation.uri is not None:
+    to_json["uri"] = annotation.uri
+  if annotation.created_at is not None:
+    to_json["createdAt"] = annotation.created_at
+  if annotation.updated_at is not None:
+    to_json["updatedAt"] = annotation.updated_at
+  if annotation.quad_points is not None:
+    to_json["quadPoints"] = annotation.quad_points
+  if annotation.extracted_text is not None:
+    to_json["extractedText"] = annotation.extracted_text
+  return to_json
+
+def _annotation_from_json(json_data: dict) -> Annotation:
+  return Annotation(
+    type=json_data.get("type", None),
+    title=json_data.get("title", None),
+    content=json_data.get("content", None),
+    uri=json_data.get("uri", None),
+    created_at=json_data.get("createdAt", None),
+    updated_at=json_data.get("updatedAt", None),
+    quad_points=json_data.get("quadPoints", None),
+    extracted_text=json_data.get("extractedText", None),
+  )
+
+# imports snapshot and annotation files which were written beside page files by old versions.
+# databases which were just created have nothing to import. the files are removed by
+# PageStore after this transaction was committed.
+def migrate_to_page_store(cursor: Cursor):
+  # pages are looked up by hash only, so the table is clustered by it
+  cursor.execute("""
+    CREATE TABLE page_artifacts (
+      hash TEXT PRIMARY KEY,
+      snapshot BLOB,
+      annotations BLOB,
+      compressed INTEGER NOT NULL
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("""
+    CREATE TABLE legacy_page_files (
+      name TEXT PRIMARY KEY
+    ) WITHOUT ROWID
+  """)
+  cursor.execute("PRAGMA database_list")
+  db_path: str = next(row[2] for row in cursor.fetchall() if row[1] == "main")
+  pages_path = os.path.join(os.path.dirname(db_path), "pages")
+  if not os.path.isdir(pages_path):
+    return
+
+  for name in os.listdir(pages_path):
+    for ext_name, column in ((".snapshot.txt", "snapshot"), (".annotation.json", "annotations")):
+      if not name.endswith(ext_name):
+        continue
+      with open(os.path.join(pages_path, name), "rb") as file:
+        data = file.read()
+      # column is one of two constants above
+      cursor.execute(
+        f"INSERT INTO page_artifacts (hash, {column}, compressed) VALUES (?, ?, 0) " +
+        f"ON CONFLICT (hash) DO UPDATE SET {column} = excluded.{column}",
+        (name[:-len(ext_name)], data),
+      )
+      cursor.execute("INSERT OR IGNORE INTO legacy_page_files (name) VALUES (?)", (name,))
@@ -1,18 +1,23 @@
 from __future__ import annotations
 
+import io
 import os
 import json
 import shutil
+import threading
 import pikepdf
 
 from typing import cast, Optional, Callable
 from sqlite3 import Cursor, Connection
-from sqlite3_pool import register_table_creators, SQLite3Pool
+from sqlite3_pool import register_table_creators, register_migration, SQLite3Pool
 from dataclasses import dataclass
 
-from .pdf_extractor import extract_metadata_with_pdf, PdfExtractor, Annotation
+from .pdf_extractor import extract_metadata, source_stat, PdfExtractor, Annotation, SourceStat
+from .page_store import PageStore, migrate_to_page_store
+from .page_layout import page_file_path, migrate_flat_pages
+from .page_cache import page_cache
 from ..progress_events import PDFFileProgressEvent, PDFFileStep, ProgressEventListener
-from ..utils import hash_sha512, assert_continue, TempFolderHub, InterruptException
+from ..utils import hash_bytes, assert_continue
 
 @dataclass
 class Pdf:
@@ -37,21 +42,24 @@ class PdfPage:
 
   @property
   def page_file_path(self) -> str:
-    return os.path.join(self._parent._pages_path, f"{self.hash}.pdf")
+    return page_file_path(self._parent._pages_path, self.hash)
 
   @property
   def annotations(self) -> list[Annotation]:
     if self._annotations is None:
-      extractor = cast(PdfExtractor, self._parent._extractor)
-      self._annotations = extractor.read_annotations(self.hash)
-    return self._annotations
+      self._read_content()
+    return cast(list[Annotation], self._annotations)
 
   @property
   def snapshot(self) -> str:
     if self._snapshot is None:
-      extractor = cast(PdfExtractor, self._parent._extractor)
-      self._snapshot = extractor.read_snapshot(self.hash)
-    return self._snapshot
+      self._read_content()
+    return cast(str, self._snapshot)
+
+  # both of them are read with one lookup
+  def _read_content(self):
+    store = cast(PageStore, self._parent._store)
+    self._snapshot, self._annotations = store.read(self.hash)
 
   def load_pdf(self) -> Pdf:
     return cast(Pdf, self._parent._load_cached_pdf(self._pdf_id))
@@ -66,8 +74,9 @@ class PdfParser:
   def __init__(
     self,
     cache_dir_path: str,
-    temp_dir_path: str,
     listeners: PdfParserListeners = PdfParserListeners(),
+    extract_processes: int = 0, # 0 means pages are extracted in the calling thread
+    compress_pages: bool = False, # snapshots and annotations are compressed by zlib
   ) -> None:
     db = SQLite3Pool(
       format_name="pdf",
@@ -79,19 +88,26 @@ class PdfParser:
     self._pages_path: str = os.path.abspath(
       os.path.join(cache_dir_path, "pages"),
     )
-    self._temp_folders: TempFolderHub = TempFolderHub(temp_dir_path)
-    self._extractor: PdfExtractor = PdfExtractor(self._pages_path)
+    self._extractor: PdfExtractor = PdfExtractor(self._pages_path, extract_processes)
+    self._store: PageStore = PageStore(self._db, compress_pages)
     self._listeners: PdfParserListeners = listeners
 
     if not os.path.exists(self._pages_path):
       os.makedirs(self._pages_path, exist_ok=True)
+    # loose snapshots and annotations are removed before page files are moved into shards
+    self._store.remove_legacy_files(self._pages_path)
+    migrate_flat_pages(self._pages_path)
 
   @property
   def name(self) -> str:
     return "pdf"
 
+  # processes which extract pages are shut down, parser still can be used later
+  def close(self):
+    self._extractor.close()
+
   def page(self, page_hash: str) -> Optional[PdfPage]:
-    with self._db.connect() as (cursor, _):
+    with self._db.connect(readonly=True) as (cursor, _):
       cursor.execute("SELECT pdf_id, idx FROM pages WHERE hash = ? LIMIT 1", (page_hash,))
       row = cursor.fetchone()
       if row is not None:
@@ -102,17 +118,22 @@ class PdfParser:
 
   def pdf(self, hash: str, file_path: str, listener: ProgressEventListener) -> Pdf:
     with self._db.connect() as (cursor, conn):
-      cursor.execute("SELECT id, meta FROM pdfs WHERE hash = ? LIMIT 1", (hash,))
+      cursor.execute("SELECT id, meta, complete FROM pdfs WHERE hash = ? LIMIT 1", (hash,))
       row = cursor.fetchone()
+      complete: bool = False
+      # it was split by an earlier run if it's unknown, source may have been changed since then
+      split_stat: Optional[SourceStat] = None
 
       if row is None:
-        pdf_id, metadata = self._create_and_split_pdf(
-          cursor, conn, hash, file_path, listener,
-        )
+        pdf_id, metadata, split_stat = self._create_and_split_pdf(cursor, conn, hash, file_path)
       else:
-        pdf_id, meta_json = row
+        pdf_id, meta_json, complete = row
         metadata = PdfMetadata(**json.loads(meta_json))
 
+      if not complete:
+        # it continues from the first page which was not extracted, if it was interrupted
+        self._extract_pages(cursor, conn, pdf_id, file_path, split_stat, listener)
+
       return Pdf(
         hash=hash,
         metadata=metadata,
@@ -120,7 +141,7 @@ class PdfParser:
       )
 
   def pdf_or_none(self, hash: str) -> Optional[Pdf]:
-   with self._db.connect() as (cursor, _):
+   with self._db.connect(readonly=True) as (cursor, _):
       pdf_id = self._pdf_id(cursor, hash)
       if pdf_id is None:
         return None
@@ -140,7 +161,7 @@ class PdfParser:
       )
 
   def pdf_has_cached(self, hash: str) -> bool:
-    with self._db.connect() as (cursor, _):
+    with self._db.connect(readonly=True) as (cursor, _):
       pdf_id = self._pdf_id(cursor, hash)
       return pdf_id is not None
 
@@ -157,60 +178,111 @@ class PdfParser:
 
     return pdf_pages
 
+  # pages are split and recorded at first, and they will be extracted one by one later.
+  # the pdf is not complete until all its pages were extracted.
   def _create_and_split_pdf(
       self,
       cursor: Cursor,
       conn: Connection,
       hash: str,
       file_path: str,
-      listener: ProgressEventListener,
-    ) -> tuple[int, PdfMetadata]:
-    metadata = PdfMetadata(**extract_metadata_with_pdf(file_path))
+    ) -> tuple[int, PdfMetadata, Optional[SourceStat]]:
+    # stat is taken before splitting, so that any change since then is found later
+    split_stat = source_stat(file_path)
+    metadata, page_hashes = self._split_pdf(file_path)
     metadata_json = json.dumps(metadata.__dict__)
-    added_page_hashes: list[str] = []
     try:
       cursor.execute("BEGIN TRANSACTION")
-      cursor.execute("INSERT INTO pdfs (hash, meta) VALUES (?, ?)", (hash, metadata_json))
+      cursor.execute(
+        "INSERT INTO pdfs (hash, meta, complete) VALUES (?, ?, 0)",
+        (hash, metadata_json),
+      )
       pdf_id = cast(int, cursor.lastrowid)
 
-      for index, page_hash in enumerate(self._extract_page_hashes(file_path)):
+      for index, page_hash in enumerate(page_hashes):
+        # page may have been extracted with another pdf
+        cursor.execute("SELECT extracted FROM pages WHERE hash = ? AND extracted = 1 LIMIT 1", (page_hash,))
+        extracted = cursor.fetchone() is not None
         cursor.execute(
-          "INSERT INTO pages (pdf_id, hash, idx) VALUES (?, ?, ?)",
-          (pdf_id, page_hash, index),
+          "INSERT INTO pages (pdf_id, hash, idx, extracted) VALUES (?, ?, ?, ?)",
+          (pdf_id, page_hash, index, extracted),
         )
-        cursor.execute("SELECT COUNT(*) FROM pages WHERE hash = ?", (page_hash,))
-        num_rows = cursor.fetchone()[0]
-        if num_rows == 1:
-          added_page_hashes.append(page_hash)
+      conn.commit()
+      return pdf_id, metadata, split_stat
 
-      for i, page_hash in enumerate(added_page_hashes):
-        assert_continue()
-        self._extractor.extract_page(page_hash)
-        self._listeners.on_page_added(page_hash)
+    except Exception as e:
+      conn.rollback()
+      raise e
+
+  # every page is committed once it has been extracted, so that
+  # an interrupted pdf never extracts its pages again.
+  def _extract_pages(
+      self,
+      cursor: Cursor,
+      conn: Connection,
+      pdf_id: int,
+      file_path: str,
+      split_stat: Optional[SourceStat],
+      listener: ProgressEventListener,
+    ):
+    cursor.execute("SELECT COUNT(DISTINCT hash) FROM pages WHERE pdf_id = ?", (pdf_id,))
+    pages_count: int = cursor.fetchone()[0]
+    cursor.execute(
+      "SELECT hash, idx FROM pages WHERE pdf_id = ? AND extracted = 0 ORDER BY idx",
+      (pdf_id,),
+    )
+    # same page may appear many times in a pdf, it's extracted from its first index only
+    page_indexes: dict[str, int] = {}
+    for page_hash, index in cursor.fetchall():
+      page_indexes.setdefault(page_hash, index)
+    completed = pages_count - len(page_indexes)
+
+    assert_continue()
+    page_contents = self._extractor.extract_pages(
+      source_path=file_path,
+      split_stat=split_stat,
+      pages=[(index, page_hash) for page_hash, index in page_indexes.items()],
+    )
+    try:
+      for page_content in page_contents:
+        try:
+          cursor.execute("BEGIN TRANSACTION")
+          self._store.save(cursor, page_content)
+          cursor.execute("UPDATE pages SET extracted = 1 WHERE hash = ?", (page_content.hash,))
+          conn.commit()
+        except Exception as e:
+          conn.rollback()
+          raise e
+
+        completed += 1
+        self._listeners.on_page_added(page_content.hash)
         listener(PDFFileProgressEvent(
           step=PDFFileStep.Parse,
-          completed=i + 1,
-          total=len(added_page_hashes),
+          completed=completed,
+          total=pages_count,
         ))
-      pages_count = len(added_page_hashes)
-      listener(PDFFileProgressEvent(
-        step=PDFFileStep.Parse,
-        completed=pages_count,
-        total=pages_count,
-        ))
-      conn.commit()
-      return pdf_id, metadata
+        assert_continue()
+    finally:
+      # cancels pages which have not been extracted
+      page_contents.close()
 
-    except InterruptException as e:
-      for page_hash in added_page_hashes:
-        self._extractor.remove_page(page_hash)
+    try:
+      cursor.execute("UPDATE pdfs SET complete = 1 WHERE id = ?", (pdf_id,))
+      conn.commit()
+    except Exception as e:
       conn.rollback()
       raise e
 
+    listener(PDFFileProgressEvent(
+      step=PDFFileStep.Parse,
+      completed=pages_count,
+      total=pages_count,
+    ))
+
   # to clean useless cache files
   def fire_file_removed(self, hash: str):
     with self._db.connect() as (cursor, conn):
-      pdf_id = self._pdf_id(cursor, hash)
+      pdf_id = self._pdf_id(cursor, hash, only_complete=False)
       if pdf_id is None:
         return
 
@@ -225,63 +297,78 @@ class PdfParser:
         cursor.execute("BEGIN TRANSACTION")
         cursor.execute("DELETE FROM pdfs WHERE id = ?", (pdf_id,))
         cursor.execute("DELETE FROM pages WHERE pdf_id = ?", (pdf_id,))
+        for page_hash in page_hashes:
+          cursor.execute("SELECT id FROM pages WHERE hash = ? LIMIT 1", (page_hash,))
+          if cursor.fetchone() is None:
+            self._store.remove(cursor, page_hash)
+            removed_page_hashes.append(page_hash)
         conn.commit()
       except Exception as e:
         conn.rollback()
         raise e
 
-      for page_hash in page_hashes:
-        cursor.execute("SELECT id FROM pages WHERE hash = ? LIMIT 1", (page_hash,))
-        if cursor.fetchone() is None:
-          removed_page_hashes.append(page_hash)
-
       for page_hash in removed_page_hashes:
-        self._extractor.remove_page(page_hash)
+        page_cache().invalidate(page_hash)
+        page_path = page_file_path(self._pages_path, page_hash)
+        if os.path.exists(page_path):
+          os.remove(page_path)
         self._listeners.on_page_removed(page_hash)
 
-  def _extract_page_hashes(self, file_path: str) -> list[str]:
+  # metadata is read with same parse which splits pages.
+  # pages are split and hashed in memory, only pages which were never cached are written.
+  def _split_pdf(self, file_path: str) -> tuple[PdfMetadata, list[str]]:
     page_hashes: list[str] = []
 
-    with self._temp_folders.create() as folder:
-      folder_path = folder.path
-      pages_count: int = 0
-
-      # https://pikepdf.readthedocs.io/en/latest/
-      with pikepdf.Pdf.open(file_path) as pdf_file:
-        for i, page in enumerate(pdf_file.pages):
-          page_file = pikepdf.Pdf.new()
+    # https://pikepdf.readthedocs.io/en/latest/
+    with pikepdf.Pdf.open(file_path) as pdf_file:
+      docinfo: dict[str, str] = {}
+      for key, value in pdf_file.docinfo.items():
+        if isinstance(value, pikepdf.String):
+          docinfo[key.lstrip("/")] = str(value)
+      metadata = PdfMetadata(**extract_metadata(docinfo))
+
+      for page in pdf_file.pages:
+        buffer = io.BytesIO()
+        with pikepdf.Pdf.new() as page_file:
           page_file.pages.append(page)
-          page_file_path = os.path.join(folder_path, f"{i}.pdf")
-          page_file.save(
-            page_file_path,
-            # make sure hash of file never changes
-            deterministic_id=True,
-          )
-        pages_count = len(pdf_file.pages)
-
-      for i in range(pages_count):
-        page_file_path = os.path.join(folder_path, f"{i}.pdf")
-        page_hash = hash_sha512(page_file_path)
+          # make sure hash of file never changes
+          page_file.save(buffer, deterministic_id=True)
+
+        page_data = buffer.getvalue()
+        page_hash = hash_bytes(page_data)
         page_hashes.append(page_hash)
-        target_page_path = os.path.join(self._pages_path, f"{page_hash}.pdf")
+        self._save_page_file(page_hash, page_data)
 
-        if os.path.exists(target_page_path):
-          if os.path.isdir(target_page_path):
-            shutil.rmtree(target_page_path)
-          else:
-            os.remove(target_page_path)
+    return metadata, page_hashes
 
-        shutil.move(page_file_path, target_page_path)
+  def _save_page_file(self, page_hash: str, page_data: bytes):
+    target_page_path = page_file_path(self._pages_path, page_hash)
+    if os.path.isfile(target_page_path):
+      return
+    if os.path.isdir(target_page_path):
+      shutil.rmtree(target_page_path)
+    os.makedirs(os.path.dirname(target_page_path), exist_ok=True)
 
-    return page_hashes
+    # a file which was written partly must never have the name of page
+    temp_page_path = f"{target_page_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+      with open(temp_page_path, "wb") as file:
+        file.write(page_data)
+      os.replace(temp_page_path, target_page_path)
+    except BaseException as e:
+      if os.path.exists(temp_page_path):
+        os.remove(temp_page_path)
+      raise e
 
-  def _pdf_id(self, cursor: Cursor, hash: str) -> Optional[int]:
-    cursor.execute("SELECT id FROM pdfs WHERE hash = ? LIMIT 1", (hash,))
+  def _pdf_id(self, cursor: Cursor, hash: str, only_complete: bool = True) -> Optional[int]:
+    cursor.execute("SELECT id, complete FROM pdfs WHERE hash = ? LIMIT 1", (hash,))
     row = cursor.fetchone()
     if row is None:
       return None
-    else:
-      return row[0]
+    pdf_id, complete = row
+    if only_complete and not complete:
+      return None
+    return pdf_id
 
 def _create_tables(cursor: Cursor):
   cursor.execute("""
@@ -309,4 +396,22 @@ def _create_tables(cursor: Cursor):
     CREATE INDEX idx__hash_pages ON pages (hash)
   """)
 
-register_table_creators("pdf", _create_tables)
\ No newline at end of file
+def _migrate_add_covering_indexes(cursor: Cursor):
+  cursor.execute("DROP INDEX IF EXISTS idx_pdf_pages")
+  cursor.execute("DROP INDEX IF EXISTS idx__hash_pages")
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_pdf_pages ON pages (pdf_id, idx, hash)
+  """)
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx__hash_pages ON pages (hash, pdf_id, idx)
+  """)
+
+def _migrate_add_progress(cursor: Cursor):
+  # pdfs and pages recorded before were always extracted completely in one transaction
+  cursor.execute("ALTER TABLE pdfs ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+  cursor.execute("ALTER TABLE pages ADD COLUMN extracted INTEGER NOT NULL DEFAULT 1")
+
+register_table_creators("pdf", _create_tables)
+register_migration("pdf", 1, _migrate_add_covering_indexes)
+register_migration("pdf", 2, _migrate_add_progress)
+register_migration("pdf", 3, migrate_to_page_store)
\ No newline at end of file
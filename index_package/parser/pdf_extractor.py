@@ -1,20 +1,24 @@
+from __future__ import annotations
+
 import os
 import io
 import re
+import signal
+import threading
+import multiprocessing
+import numpy as np
 import pdfplumber
-import json
 
-from typing import Optional
+from typing import Optional, Generator
+from collections import deque
 from datetime import datetime, timedelta
 from dataclasses import dataclass
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pdfplumber.page import Page
-from shapely.geometry import Polygon
+from .page_layout import page_file_path
 from ..utils import is_empty_string
 
-_PDF_EXT = "pdf"
-_SNAPSHOT_EXT = "snapshot.txt"
-_ANNOTATION_EXT = "annotation.json"
-
 @dataclass
 class Annotation:
   type: Optional[str]
@@ -26,18 +30,71 @@ class Annotation:
   quad_points: Optional[list[float]]
   extracted_text: Optional[str]
 
-def extract_metadata_with_pdf(pdf_path: str) -> dict:
-  with pdfplumber.open(pdf_path) as pdf_file:
-    origin = pdf_file.metadata
-    modified_at = origin.get("ModDate", None)
-    if modified_at is not None:
-      modified_at = _convert_to_utc(modified_at)
-
-    return {
-      "author": origin.get("Author", None),
-      "modified_at": modified_at,
-      "producer": origin.get("Producer", None),
-    }
+@dataclass
+class PageContent:
+  hash: str
+  snapshot: str
+  annotations: list[Annotation]
+
+# origin is document info dictionary without leading slashes of keys
+def extract_metadata(origin: dict[str, str]) -> dict:
+  modified_at = origin.get("ModDate", None)
+  if modified_at is not None:
+    modified_at = _convert_to_utc(modified_at)
+
+  return {
+    "author": origin.get("Author", None),
+    "modified_at": modified_at,
+    "producer": origin.get("Producer", None),
+  }
+
+def _process_context():
+  if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+    # processes are forked from a server which imported this module once, instead of importing it
+    # again in every process. models of package are imported lazily, so they are never loaded here.
+    context.set_forkserver_preload([__name__])
+    return context
+  return multiprocessing.get_context("spawn")
+
+def _init_process():
+  # Ctrl-C is handled by main process, it cancels pages by itself
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# (size, mtime_ns) of source pdf, it tells whether source is still the version which was split
+SourceStat = tuple[int, int]
+
+def source_stat(source_path: str) -> Optional[SourceStat]:
+  try:
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime_ns
+  except OSError:
+    return None
+
+# every process keeps the source pdf open, which it extracted pages from last time
+_process_source: Optional[tuple[tuple[str, int, int], pdfplumber.PDF]] = None
+
+def _extract_page_in_process(
+    pages_path: str,
+    source_path: str,
+    split_stat: Optional[SourceStat],
+    index: int,
+    page_hash: str,
+  ) -> PageContent:
+
+  global _process_source
+  extractor = PdfExtractor(pages_path)
+  if split_stat is None or source_stat(source_path) != split_stat:
+    return extractor.extract_page(page_hash)
+
+  key = (source_path, *split_stat)
+  if _process_source is not None and _process_source[0] != key:
+    _process_source[1].close()
+    _process_source = None
+  if _process_source is None:
+    _process_source = (key, pdfplumber.open(source_path))
+
+  return extractor.extract_source_page(_process_source[1], source_path, split_stat, index, page_hash)
 
 def _convert_to_utc(timestamp: str):
   pattern = r"D:(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})([\+\-]\d{2})'(\d{2})"
@@ -52,76 +109,147 @@ def _convert_to_utc(timestamp: str):
       return None
 
 class PdfExtractor:
-  def __init__(self, pages_path: str):
+  def __init__(self, pages_path: str, max_processes: int = 0):
     self._pages_path: str = pages_path
-
-  def extract_page(self, page_hash: str):
-    global _PDF_EXT, _SNAPSHOT_EXT, _ANNOTATION_EXT
-    annotations: list[Annotation] = []
-    snapshot: str = ""
-
-    with pdfplumber.open(os.path.join(self._pages_path, f"{page_hash}.{_PDF_EXT}")) as pdf_file:
-      if len(pdf_file.pages) == 0:
+    self._max_processes: int = max_processes
+    self._executor: Optional[ProcessPoolExecutor] = None
+    self._executor_lock: threading.Lock = threading.Lock()
+
+  # pages is list of (index in source pdf, page hash). yields contents of pages in order.
+  # source pdf is parsed once for all its pages, instead of parsing fonts and resources again for every page file.
+  # split_stat is stat of source when it was split, None means unknown. pages are extracted from page files
+  # if source is not that version anymore, otherwise content of another version would be stored under the hash.
+  # pdfplumber is CPU-bound pure Python, so pages are extracted by processes if max_processes > 0.
+  # pages which have not started are cancelled when the generator is closed.
+  def extract_pages(
+      self,
+      source_path: str,
+      split_stat: Optional[SourceStat],
+      pages: list[tuple[int, str]],
+    ) -> Generator[PageContent, None, None]:
+
+    if len(pages) == 0:
+      return
+
+    if self._max_processes <= 0:
+      if split_stat is None or source_stat(source_path) != split_stat:
+        for _, page_hash in pages:
+          yield self.extract_page(page_hash)
         return
-      page = pdf_file.pages[0]
-      # TODO: 将错误反馈到前端，而不是仅仅在控制台报错
-      try:
-        annotations = self._extract_annotations(page)
-      except Exception as e:
-        print(f"Failed to extract annotations from {page_hash}: {e}")
+      with pdfplumber.open(source_path) as pdf_file:
+        for index, page_hash in pages:
+          yield self.extract_source_page(pdf_file, source_path, split_stat, index, page_hash)
+      return
+
+    executor = self._process_executor()
+    pending: deque[Future[PageContent]] = deque()
+    next_index: int = 0
+
+    try:
+      while next_index < len(pages) or len(pending) > 0:
+        # only a few pages are submitted ahead, so that cancelling is cheap
+        while next_index < len(pages) and len(pending) < self._max_processes * 2:
+          index, page_hash = pages[next_index]
+          pending.append(executor.submit(
+            _extract_page_in_process,
+            self._pages_path, source_path, split_stat, index, page_hash,
+          ))
+          next_index += 1
+
+        yield pending.popleft().result()
+
+    except BrokenProcessPool as e:
+      # a process crashed, next extraction starts new processes
+      with self._executor_lock:
+        if self._executor is executor:
+          self._executor = None
+      raise e
+
+    finally:
+      for future in pending:
+        future.cancel()
+
+  def _process_executor(self) -> ProcessPoolExecutor:
+    with self._executor_lock:
+      if self._executor is None:
+        self._executor = ProcessPoolExecutor(
+          max_workers=self._max_processes,
+          mp_context=_process_context(),
+          initializer=_init_process,
+        )
+      return self._executor
+
+  # shuts processes down, they are started again if pages are extracted later
+  def close(self):
+    with self._executor_lock:
+      executor = self._executor
+      self._executor = None
+    if executor is not None:
+      executor.shutdown(wait=True, cancel_futures=True)
+
+  def extract_page(self, page_hash: str) -> PageContent:
+    with pdfplumber.open(page_file_path(self._pages_path, page_hash)) as pdf_file:
+      if len(pdf_file.pages) == 0:
+        return PageContent(hash=page_hash, snapshot="", annotations=[])
+      return self._extract_from_page(pdf_file.pages[0], page_hash)
+
+  def extract_source_page(
+      self,
+      pdf_file: pdfplumber.PDF,
+      source_path: str,
+      split_stat: SourceStat,
+      index: int,
+      page_hash: str,
+    ) -> PageContent:
+
+    if index < len(pdf_file.pages) and source_stat(source_path) == split_stat:
+      page = pdf_file.pages[index]
       try:
-        snapshot = page.extract_text_simple()
-        snapshot = self._standardize_text(snapshot)
-      except Exception as e:
-        print(f"Failed to extract snapshot from {page_hash}: {e}")
-
-      for annotation in annotations:
-        quad_points = annotation.quad_points
-        if quad_points is not None:
-          text = self._extract_selected_text(page, quad_points)
-          if text is not None:
-            annotation.extracted_text = self._standardize_text(text)
-
-    if not is_empty_string(snapshot):
-      with open(os.path.join(self._pages_path, f"{page_hash}.{_SNAPSHOT_EXT}"), "w", encoding="utf-8") as file:
-        file.write(snapshot)
-
-    if len(annotations) > 0:
-      with open(os.path.join(self._pages_path, f"{page_hash}.{_ANNOTATION_EXT}"), 'w', encoding='utf-8') as file:
-        annotation_json: list[dict] = []
-        for annotation in annotations:
-          to_json = self._annotation_to_json(annotation)
-          annotation_json.append(to_json)
-        json.dump(annotation_json, file, ensure_ascii=False)
-
-  def remove_page(self, page_hash: str):
-    global _PDF_EXT, _SNAPSHOT_EXT, _ANNOTATION_EXT
-    for ext_name in (_PDF_EXT, _SNAPSHOT_EXT, _ANNOTATION_EXT):
-      file_path = os.path.join(self._pages_path, f"{page_hash}.{ext_name}")
-      if os.path.exists(file_path):
-        os.remove(file_path)
-
-  def read_annotations(self, page_hash: str) -> list[Annotation]:
-    global _ANNOTATION_EXT
+        content = self._extract_from_page(page, page_hash)
+      finally:
+        # releases parsed objects of page, source pdf may have thousands of pages
+        page.close()
+      # source may be changed while the page was extracted
+      if source_stat(source_path) == split_stat:
+        return content
+
+    # source was changed after splitting, page file is still the truth
+    return self.extract_page(page_hash)
+
+  def _extract_from_page(self, page: Page, page_hash: str) -> PageContent:
     annotations: list[Annotation] = []
-    file_path = os.path.join(self._pages_path, f"{page_hash}.{_ANNOTATION_EXT}")
-    if not os.path.exists(file_path):
-      return annotations
-
-    with open(file_path, "r", encoding="utf-8") as file:
-      annotation_json = json.load(file)
-      for json_data in annotation_json:
-        annotations.append(self._annotation_from_json(json_data))
-    return annotations
-
-  def read_snapshot(self, page_hash: str) -> str:
-    global _SNAPSHOT_EXT
-    file_path = os.path.join(self._pages_path, f"{page_hash}.{_SNAPSHOT_EXT}")
-    if not os.path.exists(file_path):
-      return ""
+    snapshot: str = ""
 
-    with open(file_path, "r", encoding="utf-8") as file:
-      return file.read()
+    # TODO: 将错误反馈到前端，而不是仅仅在控制台报错
+    try:
+      annotations = self._extract_annotations(page)
+    except Exception as e:
+      print(f"Failed to extract annotations from {page_hash}: {e}")
+    try:
+      snapshot = page.extract_text_simple()
+      snapshot = self._standardize_text(snapshot)
+    except Exception as e:
+      print(f"Failed to extract snapshot from {page_hash}: {e}")
+
+    # boxes of text are collected once for all annotations of page
+    text_boxes: Optional[_TextBoxes] = None
+    for annotation in annotations:
+      quad_points = annotation.quad_points
+      if quad_points is not None:
+        if text_boxes is None:
+          text_boxes = _TextBoxes(page)
+        text = self._extract_selected_text(page, quad_points, text_boxes)
+        if text is not None:
+          annotation.extracted_text = self._standardize_text(text)
+
+    if is_empty_string(snapshot):
+      snapshot = ""
+
+    return PageContent(
+      hash=page_hash,
+      snapshot=snapshot,
+      annotations=annotations,
+    )
 
   def _extract_annotations(self, page: Page) -> list[Annotation]:
     annotations: list[Annotation] = []
@@ -160,37 +288,18 @@ class PdfExtractor:
         annotations.append(annotation)
     return annotations
 
-  def _extract_selected_text(self, page: Page, quad_points: list[float]) -> Optional[str]:
-    annotation_polygon = _AnnotationPolygon(quad_points)
-    if not annotation_polygon.is_valid:
+  def _extract_selected_text(
+      self,
+      page: Page,
+      quad_points: list[float],
+      text_boxes: Optional[_TextBoxes] = None,
+    ) -> Optional[str]:
+    quads = _quad_boxes(quad_points)
+    if len(quads) == 0:
       return None
-
-    line_tuples: list[tuple[float, str]] = []
-    height = page.height
-
-    for line in page.extract_text_lines(char=False):
-      x0, y0, x1, y1 = line["x0"], line["top"], line["x1"], line["bottom"]
-      # coordinate system is from bottom-left
-      y0 = height - y0
-      y1 = height - y1
-      if not annotation_polygon.intersects(x0, y0, x1, y1):
-        continue
-
-      line_chars: list[str] = []
-      for char in line["chars"]:
-        x0, y0, x1, y1 = char["x0"], char["y0"], char["x1"], char["y1"]
-        if annotation_polygon.contains(x0, y0, x1, y1):
-          line_chars.append(char["text"])
-      line_tuples.append((-y0, "".join(line_chars)))
-
-    lines: list[str] = []
-    for (_, line) in sorted(line_tuples, key=lambda x: x[0]):
-      lines.append(line)
-
-    if len(lines) == 0:
-      return None
-    else:
-      return "\n".join(lines)
+    if text_boxes is None:
+      text_boxes = _TextBoxes(page)
+    return text_boxes.selected_text(quads)
 
   def _standardize_text(self, input_str: str) -> str:
     buffer = io.StringIO()
@@ -210,80 +319,91 @@ class PdfExtractor:
         state = 0
     return buffer.getvalue()
 
-  def _annotation_to_json(self, annotation: Annotation) -> dict:
-    to_json = {}
-    if annotation.type is not None:
-      to_json["type"] = annotation.type
-    if annotation.title is not None:
-      to_json["title"] = annotation.title
-    if annotation.content is not None:
-      to_json["content"] = annotation.content
-    if annotation.uri is not None:
-      to_json["uri"] = annotation.uri
-    if annotation.created_at is not None:
-      to_json["createdAt"] = annotation.created_at
-    if annotation.updated_at is not None:
-      to_json["updatedAt"] = annotation.updated_at
-    if annotation.quad_points is not None:
-      to_json["quadPoints"] = annotation.quad_points
-    if annotation.extracted_text is not None:
-      to_json["extractedText"] = annotation.extracted_text
-    return to_json
-
-  def _annotation_from_json(self, json_data: dict) -> Annotation:
-    return Annotation(
-      type=json_data.get("type", None),
-      title=json_data.get("title", None),
-      content=json_data.get("content", None),
-      uri=json_data.get("uri", None),
-      created_at=json_data.get("createdAt", None),
-      updated_at=json_data.get("updatedAt", None),
-      quad_points=json_data.get("quadPoints", None),
-      extracted_text=json_data.get("extractedText", None),
-    )
-
-class _AnnotationPolygon:
-  def __init__(self, quad_points: list[float]):
-    self._polygons: list[Polygon] = []
-    for i in range(int(len(quad_points) / 8)):
-      x0 = float("inf")
-      x1 = -float("inf")
-      y0 = float("inf")
-      y1 = -float("inf")
-      for j in range(4):
-        index = i*8 + j*2
-        x = quad_points[index]
-        y = quad_points[index + 1]
-        x0 = min(x0, x)
-        x1 = max(x1, x)
-        y0 = min(y0, y)
-        y1 = max(y1, y)
-      polygon = Polygon(((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
-      if polygon.is_valid:
-        self._polygons.append(polygon)
-
-  @property
-  def is_valid(self) -> bool:
-    return len(self._polygons) > 0
-
-  def intersects(self, x0: float, y0: float, x1: float, y1: float) -> bool:
-    target_polygon = Polygon(((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
-    for polygon in self._polygons:
-      if polygon.overlaps(target_polygon):
-        return True
-    return False
-
-  def contains(self, x0: float, y0: float, x1: float, y1: float) -> bool:
-    # make target smaller to be contained
-    rate = 0.01
-    center_x = (x0 + x1) / 2.0
-    center_y = (y0 + y1) / 2.0
-    x0 += (center_x - x0) * rate
-    y0 += (center_y - y0) * rate
-    x1 += (center_x - x1) * rate
-    y1 += (center_y - y1) * rate
-    target_polygon = Polygon([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
-    for polygon in self._polygons:
-      if polygon.contains(target_polygon):
-        return True
-    return False
+# boxes are rows of (x0, y0, x1, y1) with x0 <= x1 and y0 <= y1, in coordinate system from bottom-left.
+# annotation quads are tested against all boxes of lines and chars at once, instead of
+# building a polygon for every line and char.
+def _quad_boxes(quad_points: list[float]) -> np.ndarray:
+  count = len(quad_points) // 8
+  points = np.array(quad_points[:count * 8], dtype=np.float64).reshape(count, 4, 2)
+  boxes = np.concatenate((points.min(axis=1), points.max(axis=1)), axis=1)
+  # a quad without area is not a valid polygon
+  valid = (boxes[:, 0] < boxes[:, 2]) & (boxes[:, 1] < boxes[:, 3])
+  return boxes[valid]
+
+class _TextBoxes:
+  def __init__(self, page: Page):
+    height = page.height
+    line_boxes: list[tuple[float, float, float, float]] = []
+    char_boxes: list[tuple[float, float, float, float]] = []
+    char_lines: list[int] = []
+    self._line_keys: list[float] = []
+    self._char_texts: list[str] = []
+
+    for line_index, line in enumerate(page.extract_text_lines(char=False)):
+      # coordinate system of lines is from top-left
+      y0 = height - line["top"]
+      y1 = height - line["bottom"]
+      line_boxes.append((line["x0"], min(y0, y1), line["x1"], max(y0, y1)))
+      for char in line["chars"]:
+        char_boxes.append((char["x0"], char["y0"], char["x1"], char["y1"]))
+        char_lines.append(line_index)
+        self._char_texts.append(char["text"])
+        y0 = char["y0"]
+      # lines are sorted by bottom of their last char from top to bottom
+      self._line_keys.append(-y0)
+
+    self._line_boxes: np.ndarray = np.array(line_boxes, dtype=np.float64).reshape(-1, 4)
+    self._char_boxes: np.ndarray = _shrink(np.array(char_boxes, dtype=np.float64).reshape(-1, 4))
+    self._char_lines: np.ndarray = np.array(char_lines, dtype=np.int64)
+    self._char_line_list: list[int] = char_lines
+
+  def selected_text(self, quads: np.ndarray) -> Optional[str]:
+    selected_lines = _overlaps(quads, self._line_boxes).any(axis=0)
+    selected_chars = _contains(quads, self._char_boxes).any(axis=0)
+    selected_chars &= selected_lines[self._char_lines]
+
+    line_chars: dict[int, list[str]] = {}
+    line_indexes = np.flatnonzero(selected_lines).tolist()
+    for line_index in line_indexes:
+      line_chars[line_index] = []
+    for char_index in np.flatnonzero(selected_chars).tolist():
+      line_chars[self._char_line_list[char_index]].append(self._char_texts[char_index])
+
+    if len(line_indexes) == 0:
+      return None
+    line_indexes.sort(key=lambda i: self._line_keys[i])
+    return "\n".join("".join(line_chars[i]) for i in line_indexes)
+
+# chars are made 1% smaller to be contained by quads
+def _shrink(boxes: np.ndarray) -> np.ndarray:
+  rate = 0.01
+  center_x = (boxes[:, 0] + boxes[:, 2]) / 2.0
+  center_y = (boxes[:, 1] + boxes[:, 3]) / 2.0
+  shrunk = boxes.copy()
+  shrunk[:, 0] += (center_x - boxes[:, 0]) * rate
+  shrunk[:, 1] += (center_y - boxes[:, 1]) * rate
+  shrunk[:, 2] += (center_x - boxes[:, 2]) * rate
+  shrunk[:, 3] += (center_y - boxes[:, 3]) * rate
+  return shrunk
+
+# matrices of quads (rows) x boxes (columns)
+def _split(quads: np.ndarray, boxes: np.ndarray):
+  return (
+    quads[:, 0, None], quads[:, 1, None], quads[:, 2, None], quads[:, 3, None],
+    boxes[None, :, 0], boxes[None, :, 1], boxes[None, :, 2], boxes[None, :, 3],
+  )
+
+# same as overlaps of shapely: interiors intersect, and neither of them is within another
+def _overlaps(quads: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+  qx0, qy0, qx1, qy1, bx0, by0, bx1, by1 = _split(quads, boxes)
+  intersects = (qx0 < bx1) & (bx0 < qx1) & (qy0 < by1) & (by0 < qy1)
+  quad_within = (bx0 <= qx0) & (qx1 <= bx1) & (by0 <= qy0) & (qy1 <= by1)
+  box_within = (qx0 <= bx0) & (bx1 <= qx1) & (qy0 <= by0) & (by1 <= qy1)
+  return intersects & ~quad_within & ~box_within
+
+# same as contains of shapely: box is within quad, and touches interior of quad
+def _contains(quads: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+  qx0, qy0, qx1, qy1, bx0, by0, bx1, by1 = _split(quads, boxes)
+  box_within = (qx0 <= bx0) & (bx1 <= qx1) & (qy0 <= by0) & (by1 <= qy1)
+  touches_interior = (bx0 < qx1) & (qx0 < bx1) & (by0 < qy1) & (qy0 < by1)
+  return box_within & touches_interior
@@ -7,6 +7,14 @@ from enum import Enum
 @dataclass
 class ScanCompletedEvent:
   updated_files: int
+  # False means scanning is still running and updated_files is a running count
+  final: bool = True
+
+@dataclass
+class ScanScopeProgressEvent:
+  scope: str
+  scanned_files: int
+  completed: bool
 
 @dataclass
 class StartHandleFileEvent:
@@ -36,11 +44,18 @@ class PDFFileStep(Enum):
   Parse = "parse"
   Index = "index"
 
+# watcher failed to record changes, they will be found by next full scan
+@dataclass
+class WatchingErrorEvent:
+  error: str
+
 ProgressEvent = Union[
   ScanCompletedEvent,
+  ScanScopeProgressEvent,
   StartHandleFileEvent,
   CompleteHandleFileEvent,
   PDFFileProgressEvent,
+  WatchingErrorEvent,
 ]
 
 ProgressEventListener = Callable[[ProgressEvent], None]
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .scanner import Scanner
 from .scope import Scope
+from .filter import ScanFilter
+from .watcher import Watcher, is_watching_supported
 from .events import EventKind, EventTarget
 from .event_parser import Event, EventParser
\ No newline at end of file
@@ -1,6 +1,8 @@
+import os
+
 from sqlite3 import Cursor
 from enum import Enum
-from typing import Generator
+from typing import Generator, Iterable, Optional
 
 class EventKind(Enum):
   Added = 0
@@ -105,4 +107,83 @@ def record_removed_event(cursor: Cursor, target: EventTarget, path: str, scope:
       cursor.execute(
         "UPDATE events SET mtime = ? WHERE scope = ? AND path = ? AND target = ?",
         (mtime, scope, path, target.value),
-      )
\ No newline at end of file
+      )
+
+# same as calling record_removed_event() for every row of files in scope whose path is under folder_path
+# (folder itself is excluded), and deletes these rows. folder_path is None means the whole scope.
+def record_removed_events_of_files(cursor: Cursor, scope: str, folder_path: Optional[str] = None):
+  condition = "scope = ?"
+  params: tuple = (scope,)
+
+  if folder_path is not None:
+    # descendants of "/foo" are in ("/foo/", "/foo0"), because "0" is next to "/".
+    # the lower bound is exclusive, so folder "/" itself is not in ("/", "0") while its descendants are.
+    prefix = folder_path.rstrip(os.path.sep) + os.path.sep
+    condition = "scope = ? AND path > ? AND path < ?"
+    params = (scope, prefix, prefix[:-1] + chr(ord(os.path.sep) + 1))
+
+  _record_removed_events(cursor, condition, params)
+
+# children of folder (parent_id) whose paths are not in child_paths are removed with their subtrees,
+# as record_removed_event() was called for every one of them. the listing is diffed in SQL.
+def record_removed_events_of_children(cursor: Cursor, scope: str, parent_id: int, child_paths: Iterable[str]):
+  cursor.execute("CREATE TEMP TABLE IF NOT EXISTS listed_children (path TEXT PRIMARY KEY) WITHOUT ROWID")
+  cursor.execute("DELETE FROM temp.listed_children")
+  cursor.executemany(
+    "INSERT OR IGNORE INTO temp.listed_children (path) VALUES (?)",
+    ((path,) for path in child_paths),
+  )
+  removed_children = "SELECT path FROM files WHERE parent_id = ? AND path NOT IN (SELECT path FROM temp.listed_children)"
+
+  cursor.execute(f"{removed_children} AND is_dir", (parent_id,))
+  for (folder_path,) in cursor.fetchall():
+    record_removed_events_of_files(cursor, scope, folder_path)
+
+  _record_removed_events(
+    cursor,
+    condition=f"scope = ? AND path IN ({removed_children})",
+    params=(scope, parent_id),
+  )
+  cursor.execute("DELETE FROM temp.listed_children")
+
+# condition selects rows by scope and path, it's used on both files and events
+def _record_removed_events(cursor: Cursor, condition: str, params: tuple):
+  file_matches_event = f"""
+    files.scope = events.scope AND files.path = events.path AND
+    (CASE WHEN files.is_dir THEN {EventTarget.Directory.value} ELSE {EventTarget.File.value} END) = events.target
+  """
+  # Updated -> Removed, Removed keeps removed with new mtime
+  cursor.execute(
+    f"""
+      UPDATE events SET kind = {EventKind.Removed.value}, mtime = (
+        SELECT files.mtime FROM files WHERE {file_matches_event}
+      )
+      WHERE {condition} AND kind != {EventKind.Added.value}
+      AND EXISTS (SELECT 1 FROM files WHERE {file_matches_event})
+    """,
+    params,
+  )
+  cursor.execute(
+    f"""
+      INSERT INTO events (kind, target, path, scope, mtime)
+      SELECT
+        {EventKind.Removed.value},
+        CASE WHEN is_dir THEN {EventTarget.Directory.value} ELSE {EventTarget.File.value} END,
+        path, scope, mtime
+      FROM files WHERE {condition}
+      AND NOT EXISTS (
+        SELECT 1 FROM events WHERE {file_matches_event}
+      )
+    """,
+    params,
+  )
+  # Added then Removed means nothing happened
+  cursor.execute(
+    f"""
+      DELETE FROM events
+      WHERE {condition} AND kind = {EventKind.Added.value}
+      AND EXISTS (SELECT 1 FROM files WHERE {file_matches_event})
+    """,
+    params,
+  )
+  cursor.execute(f"DELETE FROM files WHERE {condition}", params)
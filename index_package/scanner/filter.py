@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+
+from dataclasses import dataclass, fields
+from typing import Iterable, Optional
+
+# rules of which files are recorded by scanner, they are applied while walking
+# so that excluded files are never stat'ed into database or turned into events.
+@dataclass(frozen=True)
+class ScanFilter:
+  include_extensions: Optional[tuple[str, ...]] = None # None means every file
+  exclude_extensions: tuple[str, ...] = (".epub",) # applies to folders too
+  include_globs: tuple[str, ...] = () # files only, empty means every file
+  exclude_globs: tuple[str, ...] = () # applies to folders too
+  ignore_files: tuple[str, ...] = () # names of .gitignore-style files
+  max_depth: Optional[int] = None # entries of scope folder have depth 1
+
+  def __post_init__(self):
+    if self.include_extensions is not None:
+      object.__setattr__(self, "include_extensions", _normalize_extensions(self.include_extensions))
+    object.__setattr__(self, "exclude_extensions", _normalize_extensions(self.exclude_extensions))
+    object.__setattr__(self, "include_globs", tuple(self.include_globs))
+    object.__setattr__(self, "exclude_globs", tuple(self.exclude_globs))
+    object.__setattr__(self, "ignore_files", tuple(self.ignore_files))
+    if self.max_depth is not None and self.max_depth <= 0:
+      raise ValueError(f"Invalid scan filter max_depth: {self.max_depth}, expected positive")
+
+  @classmethod
+  def from_config(cls, config: dict, base: Optional[ScanFilter] = None) -> ScanFilter:
+    names = set(field.name for field in fields(cls))
+    values: dict = {}
+    if base is not None:
+      values.update(base.__dict__)
+
+    for name, value in config.items():
+      if name not in names:
+        raise ValueError(f"Unknown scan filter option: {name}")
+      values[name] = value
+
+    return cls(**values)
+
+  # scope is scanned again from scratch when fingerprint of its filter changed
+  @property
+  def fingerprint(self) -> str:
+    return json.dumps(self.__dict__, sort_keys=True)
+
+class IgnoreRules:
+  def __init__(self, parent: Optional[IgnoreRules] = None, patterns: Optional[list[_Pattern]] = None):
+    # patterns of ancestors come first, the last matched pattern wins like git
+    self._patterns: list[_Pattern] = []
+    if parent is not None:
+      self._patterns.extend(parent._patterns)
+    if patterns is not None:
+      self._patterns.extend(patterns)
+
+  def is_ignored(self, relative_path: str, is_dir: bool) -> bool:
+    ignored = False
+    for pattern in self._patterns:
+      if pattern.match(relative_path, is_dir):
+        ignored = not pattern.negative
+    return ignored
+
+class ScopeFilter:
+  def __init__(self, scan_filter: ScanFilter, scope_path: str):
+    self._filter: ScanFilter = scan_filter
+    self._scope_path: str = scope_path
+    self._include_globs: list[_Pattern] = [_Pattern.parse(g, "") for g in scan_filter.include_globs]
+    self._exclude_globs: list[_Pattern] = [_Pattern.parse(g, "") for g in scan_filter.exclude_globs]
+    # absolute path of ignore file -> (mtime_ns, patterns)
+    self._ignore_files: dict[str, tuple[int, list[_Pattern]]] = {}
+
+  @property
+  def ignore_files(self) -> tuple[str, ...]:
+    return self._filter.ignore_files
+
+  def accepts(self, rules: IgnoreRules, relative_path: str, is_dir: bool) -> bool:
+    if relative_path == os.path.sep:
+      return True
+
+    path = relative_path.strip(os.path.sep).replace(os.path.sep, "/")
+    max_depth = self._filter.max_depth
+    if max_depth is not None and path.count("/") + 1 > max_depth:
+      return False
+
+    name = os.path.basename(path)
+    _, ext_name = os.path.splitext(name)
+    ext_name = ext_name.lower()
+
+    if ext_name in self._filter.exclude_extensions:
+      return False
+    if any(p.match(path, is_dir) for p in self._exclude_globs):
+      return False
+    if rules.is_ignored(path, is_dir):
+      return False
+
+    if not is_dir:
+      if name in self._filter.ignore_files:
+        # always recorded, so that changes of rules can be found
+        return True
+      include_extensions = self._filter.include_extensions
+      if include_extensions is not None and ext_name not in include_extensions:
+        return False
+      if len(self._include_globs) > 0 and not any(p.match(path, False) for p in self._include_globs):
+        return False
+
+    return True
+
+  # rules for children of folder, names are children of the folder
+  def rules_for_children(self, rules: IgnoreRules, relative_dir: str, names: Iterable[str]) -> IgnoreRules:
+    patterns: list[_Pattern] = []
+    for name in names:
+      if name in self._filter.ignore_files:
+        patterns.extend(self._read_ignore_file(relative_dir, name))
+    if len(patterns) == 0:
+      return rules
+    return IgnoreRules(rules, patterns)
+
+  # rules for children of folder which is not walked from scope folder.
+  # returns None if the folder itself or one of its ancestors is excluded.
+  def rules_of(self, relative_dir: str) -> Optional[IgnoreRules]:
+    rules = IgnoreRules()
+    parts = [p for p in relative_dir.split(os.path.sep) if p != ""]
+    current = os.path.sep
+
+    for i in range(len(parts) + 1):
+      if i > 0:
+        current = os.path.join(current, parts[i - 1])
+        if not self.accepts(rules, current, True):
+          return None
+      abs_dir = os.path.join(self._scope_path, f".{current}")
+      names = [n for n in self._filter.ignore_files if os.path.isfile(os.path.join(abs_dir, n))]
+      rules = self.rules_for_children(rules, current, names)
+
+    return rules
+
+  def _read_ignore_file(self, relative_dir: str, name: str) -> list[_Pattern]:
+    abs_path = os.path.abspath(os.path.join(self._scope_path, f".{relative_dir}", name))
+    try:
+      mtime_ns = os.stat(abs_path).st_mtime_ns
+      cached = self._ignore_files.get(abs_path, None)
+      if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+      with open(abs_path, "r", encoding="utf-8", errors="replace") as file:
+        lines = file.read().splitlines()
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError, PermissionError):
+      return []
+
+    base = relative_dir.strip(os.path.sep).replace(os.path.sep, "/")
+    patterns: list[_Pattern] = []
+    for line in lines:
+      line = line.rstrip()
+      if line == "" or line.startswith("#"):
+        continue
+      patterns.append(_Pattern.parse(line, base))
+
+    self._ignore_files[abs_path] = (mtime_ns, patterns)
+    return patterns
+
+# a pattern of .gitignore, paths are relative to scope without leading "/"
+class _Pattern:
+  def __init__(self, regex: re.Pattern, base: str, negative: bool, dir_only: bool):
+    self.negative: bool = negative
+    self._regex: re.Pattern = regex
+    self._base: str = base
+    self._dir_only: bool = dir_only
+
+  @classmethod
+  def parse(cls, line: str, base: str) -> _Pattern:
+    negative = False
+    if line.startswith("!"):
+      negative = True
+      line = line[1:]
+    elif line.startswith("\\"):
+      line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    # a pattern with "/" at beginning or middle is relative to folder of ignore file,
+    # otherwise it matches names at any level
+    anchored = "/" in line
+    line = line.lstrip("/")
+    regex = _translate(line)
+    if not anchored:
+      regex = f"(?:.*/)?{regex}"
+
+    return cls(re.compile(f"{regex}$"), base, negative, dir_only)
+
+  def match(self, path: str, is_dir: bool) -> bool:
+    if self._dir_only and not is_dir:
+      return False
+    if self._base != "":
+      if not path.startswith(self._base + "/"):
+        return False
+      path = path[len(self._base) + 1:]
+    return self._regex.match(path) is not None
+
+def _translate(pattern: str) -> str:
+  regex = ""
+  i = 0
+  while i < len(pattern):
+    char = pattern[i]
+    if pattern.startswith("**/", i):
+      regex += "(?:.*/)?"
+      i += 3
+    elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+      regex += "/.*"
+      i += 3
+    elif pattern.startswith("**", i):
+      regex += ".*"
+      i += 2
+    elif char == "*":
+      regex += "[^/]*"
+      i += 1
+    elif char == "?":
+      regex += "[^/]"
+      i += 1
+    elif char == "[":
+      end = pattern.find("]", i + 1)
+      if end == -1:
+        regex += re.escape(char)
+        i += 1
+      else:
+        content = pattern[i + 1:end]
+        if content.startswith("!"):
+          content = "^" + content[1:]
+        regex += f"[{content}]"
+        i = end + 1
+    elif char == "\\" and i + 1 < len(pattern):
+      regex += re.escape(pattern[i + 1])
+      i += 2
+    else:
+      regex += re.escape(char)
+      i += 1
+  return regex
+
+def _normalize_extensions(extensions: Iterable[str]) -> tuple[str, ...]:
+  normalized: list[str] = []
+  for ext_name in extensions:
+    ext_name = ext_name.lower()
+    if not ext_name.startswith("."):
+      ext_name = f".{ext_name}"
+    normalized.append(ext_name)
+  return tuple(normalized)
@@ -1,40 +1,157 @@
 import os
 import sqlite3
+import threading
 
 from dataclasses import dataclass
-from typing import cast, Optional
+from typing import cast, Callable, Generator, Iterable, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_EXCEPTION
 from sqlite3 import Cursor
-from sqlite3_pool import register_table_creators, SQLite3Pool
+from sqlite3_pool import register_table_creators, register_migration, SQLite3Pool, SQLite3BatchSession
 from .scope import Scope, ScopeManager
-from .events import scan_events, record_added_event, record_updated_event, record_removed_event
+from .events import scan_events, record_added_event, record_updated_event, record_removed_event, record_removed_events_of_files, record_removed_events_of_children
 from .event_parser import Event, EventTarget, EventParser
-from ..utils import assert_continue
+from .walker import stat_file, DirWalker, DirChildren, FileStat
+from .filter import ScanFilter, ScopeFilter, IgnoreRules
+from ..utils import assert_continue, interrupted_event, bind_interrupted_event, InterruptException
+from ..progress_events import ProgressEventListener, ScanScopeProgressEvent
+
+_SCOPE_PROGRESS_STEP = 1000
+_STREAM_POLL_SECONDS = 0.25
+
+# a scope is never scanned by two threads at the same time, even through different scanners
+_scope_locks: dict[tuple[str, str], threading.Lock] = {}
+_scope_locks_lock: threading.Lock = threading.Lock()
+
+def _scope_lock(db_path: str, scope: str) -> threading.Lock:
+  key = (os.path.abspath(db_path), scope)
+  with _scope_locks_lock:
+    lock = _scope_locks.get(key, None)
+    if lock is None:
+      lock = threading.Lock()
+      _scope_locks[key] = lock
+    return lock
+
+@dataclass
+class _WalkToken:
+  relative_path: str
+  stat: FileStat
+  parent_id: Optional[int]
+  rules: IgnoreRules # rules inherited from ancestors of the folder
+  force: bool # diffs children of the folder even if its mtime never changed
 
 @dataclass
 class _File:
+  id: int
   scope: str
   path: str
   mtime: float
-  children: Optional[list[str]]
-
-  @property
-  def is_dir(self) -> bool:
-    return self.children is not None
+  is_dir: bool
 
   @property
   def event_target(self) -> EventTarget:
-    if self.children is None:
-      return EventTarget.File
-    else:
+    if self.is_dir:
       return EventTarget.Directory
+    else:
+      return EventTarget.File
+
+# all files of scope are read once into memory before scanning it
+class _SnapshotFiles:
+  def __init__(self, cursor: sqlite3.Cursor, scope: str):
+    self._scope: str = scope
+    # path -> (id, mtime, is_dir)
+    self._files: dict[str, tuple[int, float, bool]] = {}
+    # id of folder -> paths of children
+    self._children: dict[int, list[str]] = {}
+    cursor.execute("SELECT id, path, mtime, is_dir, parent_id FROM files WHERE scope = ?", (scope,))
+    while True:
+      rows = cursor.fetchmany(size=1000)
+      if len(rows) == 0:
+        break
+      for id, path, mtime, is_dir, parent_id in rows:
+        self._files[path] = (id, mtime, bool(is_dir))
+        if parent_id is not None:
+          self._add_child(parent_id, path)
+
+  def get(self, relative_path: str) -> Optional[_File]:
+    row = self._files.get(relative_path, None)
+    if row is None:
+      return None
+    id, mtime, is_dir = row
+    return _File(id, self._scope, relative_path, mtime, is_dir)
+
+  def children(self, folder: _File) -> list[_File]:
+    children: list[_File] = []
+    for path in self._children.get(folder.id, ()):
+      file = self.get(path)
+      if file is not None:
+        children.append(file)
+    return children
+
+  def inserted(self, file: _File, parent_id: Optional[int]):
+    self._files[file.path] = (file.id, file.mtime, file.is_dir)
+    if parent_id is not None:
+      self._add_child(parent_id, file.path)
+
+  def _add_child(self, parent_id: int, path: str):
+    children = self._children.get(parent_id, None)
+    if children is None:
+      children = []
+      self._children[parent_id] = children
+    children.append(path)
+
+# selects file from database when it's needed, costs less memory but one query per path
+class _DatabaseFiles:
+  def __init__(self, cursor: sqlite3.Cursor, scope: str):
+    self._cursor: sqlite3.Cursor = cursor
+    self._scope: str = scope
+
+  def get(self, relative_path: str) -> Optional[_File]:
+    self._cursor.execute(
+      "SELECT id, mtime, is_dir FROM files WHERE scope = ? AND path = ?",
+      (self._scope, relative_path),
+    )
+    row = self._cursor.fetchone()
+    if row is None:
+      return None
+    id, mtime, is_dir = row
+    return _File(id, self._scope, relative_path, mtime, bool(is_dir))
+
+  def children(self, folder: _File) -> list[_File]:
+    self._cursor.execute(
+      "SELECT id, path, mtime, is_dir FROM files WHERE parent_id = ?",
+      (folder.id,),
+    )
+    return [
+      _File(id, self._scope, path, mtime, bool(is_dir))
+      for id, path, mtime, is_dir in self._cursor.fetchall()
+    ]
+
+  def inserted(self, file: _File, parent_id: Optional[int]):
+    pass
+
+_Files = Union[_SnapshotFiles, _DatabaseFiles]
 
 class Scanner:
-  def __init__(self, db_path: str) -> None:
+  def __init__(
+    self,
+    db_path: str,
+    in_memory_snapshot: bool = True,
+    walker_workers: int = 4,
+    max_concurrent_scopes: int = 4,
+    scan_filters: Optional[dict[str, ScanFilter]] = None,
+    default_scan_filter: ScanFilter = ScanFilter(),
+  ) -> None:
     db = SQLite3Pool(
       format_name="scanner",
       path=db_path,
     )
     self._db: SQLite3Pool = db.assert_format("scanner")
+    self._db_path: str = db_path
+    self._in_memory_snapshot: bool = in_memory_snapshot
+    self._walker_workers: int = walker_workers
+    self._max_concurrent_scopes: int = max_concurrent_scopes
+    self._scan_filters: dict[str, ScanFilter] = scan_filters or {}
+    self._default_scan_filter: ScanFilter = default_scan_filter
     self._event_parser: EventParser = EventParser(self._db)
     self._scope_manager: ScopeManager = ScopeManager(self._db)
 
@@ -49,16 +166,98 @@ class Scanner:
       row = cursor.fetchone()
       return row[0]
 
-  def scan(self) -> list[int]:
-    with self._db.connect() as (cursor, conn):
-      event_ids: list[int] = []
-      for scope in self._scope_manager.scopes:
-        self._scan_scope(conn, cursor, scope)
+  def scan(self, listener: ProgressEventListener = lambda _: None) -> list[int]:
+    return list(self.scan_stream(listener))
+
+  # yields ids of events once they are committed, while scopes are still being walked.
+  # events left by last scan are yielded at the end, since this scan may still change them.
+  # scopes are scanned concurrently, at most max_concurrent_scopes at the same time,
+  # and walker_workers threads list folders for each scope.
+  # scanning stops when interrupted is set or the generator is closed.
+  def scan_stream(
+    self,
+    listener: ProgressEventListener = lambda _: None,
+    interrupted: Optional[threading.Event] = None,
+  ) -> Generator[int, None, None]:
+    scopes = self._scope_manager.scopes
+    own_interrupted = False
+
+    if interrupted is None:
+      interrupted = interrupted_event()
+    if interrupted is None:
+      interrupted = threading.Event()
+      own_interrupted = True
+
+    with self._db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+      last_id: int = cursor.fetchone()[0]
+      origin_last_id = last_id
+
+    with ThreadPoolExecutor(
+      max_workers=max(1, min(len(scopes), self._max_concurrent_scopes)),
+      thread_name_prefix="scanner_scope",
+    ) as executor:
+      futures: set[Future] = {
+        executor.submit(self._scan_scope_in_thread, interrupted, scope, listener)
+        for scope in scopes
+      }
+      try:
+        while len(futures) > 0:
+          done, futures = wait(futures, timeout=_STREAM_POLL_SECONDS, return_when=FIRST_EXCEPTION)
+          for future in done:
+            future.result()
+          for event_id in self._committed_event_ids(last_id):
+            last_id = event_id
+            yield event_id
+          assert_continue()
+
+      except BaseException as e:
+        # stops other scope threads when generator was closed or raised
+        if own_interrupted:
+          interrupted.set()
+        raise e
+
+    for event_id in self._committed_event_ids(last_id):
+      yield event_id
+
+    with self._db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT id FROM events WHERE id <= ? ORDER BY id", (origin_last_id,))
+      event_ids = [row[0] for row in cursor.fetchall()]
+    yield from event_ids
+
+  def _committed_event_ids(self, last_id: int) -> list[int]:
+    with self._db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT id FROM events WHERE id > ? ORDER BY id", (last_id,))
+      return [row[0] for row in cursor.fetchall()]
+
+  # only scans the given paths, and walks into the folders which were not scanned before.
+  # it's used to record changes reported by file system notification.
+  def scan_paths(self, scope: str, relative_paths: Iterable[str]) -> list[int]:
+    scan_path = self._scope_manager.scope_path(scope)
+    if scan_path is not None:
+      scope_filter = self.scope_filter(scope)
+      with _scope_lock(self._db_path, scope), self._db.batch() as batch:
+        files = _DatabaseFiles(batch.cursor, scope)
+        self._walk(
+          batch, files, scope, scan_path, scope_filter,
+          roots=[(path, False) for path in relative_paths],
+          only_new_children=True,
+        )
+
+    return self.event_ids()
+
+  def scope_filter(self, scope: str) -> ScopeFilter:
+    return ScopeFilter(
+      scan_filter=self._scan_filter(scope),
+      scope_path=cast(str, self._scope_manager.scope_path(scope)),
+    )
 
-      for event_id in list(scan_events(cursor)):
-        event_ids.append(event_id)
+  def _scan_filter(self, scope: str) -> ScanFilter:
+    return self._scan_filters.get(scope, self._default_scan_filter)
 
-      return event_ids
+  def event_ids(self) -> list[int]:
+    with self._db.connect() as (cursor, _):
+      return list(scan_events(cursor))
 
   def parse_event(self, event_id: int) -> Event:
     return self._event_parser.parse(event_id)
@@ -66,196 +265,305 @@ class Scanner:
   def commit_sources(self, sources: dict[str, str]):
     self._scope_manager.commit_sources(sources)
 
-  def _scan_scope(
+  def _scan_scope_in_thread(
     self,
-    conn: sqlite3.Connection,
-    cursor: sqlite3.Cursor,
+    event: Optional[threading.Event],
     scope: str,
+    listener: ProgressEventListener,
   ):
-    next_relative_paths: list[str] = [os.path.sep]
-
-    while len(next_relative_paths) > 0:
-      assert_continue()
-      relative_path = next_relative_paths.pop()
-      children = self._scan_and_report(conn, cursor, scope, relative_path)
-      if children is not None:
-        for child in children:
-          next_relative_path = os.path.join(relative_path, child)
-          next_relative_paths.insert(0, next_relative_path)
+    bind_interrupted_event(event)
+    # every scope has its own connection.
+    # every changed folder is still written atomically as one unit of the batch.
+    with _scope_lock(self._db_path, scope), self._db.batch() as batch:
+      self._scan_scope(batch, scope, listener)
 
-  def _scan_and_report(
+  def _scan_scope(
     self,
-    conn: sqlite3.Connection,
-    cursor: sqlite3.Cursor,
+    batch: SQLite3BatchSession,
     scope: str,
-    relative_path: str
-  ) -> Optional[list[str]]:
+    listener: ProgressEventListener,
+  ):
+    files: _Files
+    if self._in_memory_snapshot:
+      files = _SnapshotFiles(batch.cursor, scope)
+    else:
+      files = _DatabaseFiles(batch.cursor, scope)
 
     scan_path = cast(str, self._scope_manager.scope_path(scope))
-    abs_path = os.path.join(scan_path, f".{relative_path}")
-    abs_path = os.path.abspath(abs_path)
-    old_file = self._select_file(cursor, scope, relative_path)
-    new_file: Optional[_File] = None
-    file_never_change = False
-
-    if os.path.exists(abs_path):
-      is_dir = os.path.isdir(abs_path)
-      if is_dir and self._ignore_dir(abs_path):
-        return None
+    scanned_files: int = 1 # the scope folder itself
+    fingerprint = self._scan_filter(scope).fingerprint
+    # files which are excluded by new filter must be removed, and included ones must be added
+    filter_changed = self._scope_manager.filter_fingerprint(batch.cursor, scope) != fingerprint
+    roots: list[tuple[str, bool]] = [(os.path.sep, filter_changed)]
+    frontier = self._frontier(batch.cursor, scope)
+
+    if not filter_changed and len(frontier) > 0:
+      # last scan was interrupted, folders out of its frontier have been scanned already
+      roots = frontier
+
+    def on_listed(dir_children: DirChildren):
+      nonlocal scanned_files
+      next_scanned_files = scanned_files + len(dir_children)
+      if next_scanned_files // _SCOPE_PROGRESS_STEP != scanned_files // _SCOPE_PROGRESS_STEP:
+        listener(ScanScopeProgressEvent(
+          scope=scope,
+          scanned_files=next_scanned_files,
+          completed=False,
+        ))
+      scanned_files = next_scanned_files
+
+    def on_interrupted(tokens: list[_WalkToken]):
+      with batch.write() as cursor:
+        self._save_frontier(cursor, scope, [(t.relative_path, t.force) for t in tokens])
+        # folders out of frontier have been scanned with this filter,
+        # and folders of frontier keep their own force flags
+        self._scope_manager.set_filter_fingerprint(cursor, scope, fingerprint)
+
+    self._walk(
+      batch, files, scope, scan_path, self.scope_filter(scope),
+      roots=roots,
+      only_new_children=False,
+      on_listed=on_listed,
+      on_interrupted=on_interrupted,
+    )
+    if filter_changed or len(frontier) > 0:
+      with batch.write() as cursor:
+        self._save_frontier(cursor, scope, [])
+        self._scope_manager.set_filter_fingerprint(cursor, scope, fingerprint)
+    listener(ScanScopeProgressEvent(
+      scope=scope,
+      scanned_files=scanned_files,
+      completed=True,
+    ))
+
+  def _walk(
+    self,
+    batch: SQLite3BatchSession,
+    files: _Files,
+    scope: str,
+    scan_path: str,
+    scope_filter: ScopeFilter,
+    roots: list[tuple[str, bool]], # (relative path, force)
+    only_new_children: bool,
+    on_listed: Callable[[DirChildren], None] = lambda _: None,
+    on_interrupted: Callable[[list[_WalkToken]], None] = lambda _: None,
+  ):
+    walker: DirWalker[_WalkToken]
+
+    with DirWalker(self._walker_workers) as walker:
+      for root, force in roots:
+        rules: Optional[IgnoreRules] = IgnoreRules()
+        parent_id: Optional[int] = None
+        if root != os.path.sep:
+          parent = files.get(os.path.dirname(root))
+          if parent is None:
+            # it will be found when its parent is scanned
+            continue
+          parent_id = parent.id
+          rules = scope_filter.rules_of(os.path.dirname(root))
+        if rules is None:
+          continue
+        abs_path = os.path.abspath(os.path.join(scan_path, f".{root}"))
+        stat = stat_file(abs_path)
+        if not scope_filter.accepts(rules, root, stat is not None and stat.is_dir):
+          continue
+        self._visit(batch, files, walker, scope, scan_path, root, stat, parent_id, rules, force)
+
+      # don't keep the write lock while waiting for slow disks, other scopes need it
+      for token, dir_children in walker.results(on_idle=batch.flush):
+        try:
+          assert_continue()
+        except InterruptException as e:
+          # folders of frontier have not been reported, they are walked at first next time
+          on_interrupted([token, *walker.pending_tokens()])
+          raise e
+
+        relative_path = token.relative_path
+
+        if dir_children is None:
+          # folder disappeared before it was listed
+          self._scan_and_report(batch, files, scope, relative_path, None, token.parent_id, None, False)
+          continue
+
+        rules = scope_filter.rules_for_children(token.rules, relative_path, dir_children.keys())
+        force = token.force or self._ignore_files_changed(files, scope_filter, relative_path, dir_children)
+        dir_children = {
+          name: stat
+          for name, stat in dir_children.items()
+          if scope_filter.accepts(
+            rules=rules,
+            relative_path=os.path.join(relative_path, name),
+            is_dir=stat is not None and stat.is_dir,
+          )
+        }
+        on_listed(dir_children)
+        folder = self._scan_and_report(
+          batch, files, scope, relative_path, token.stat, token.parent_id, dir_children, force,
+        )
+        if folder is not None:
+          folder_id, children = folder
+          for child in children:
+            child_path = os.path.join(relative_path, child)
+            if only_new_children and files.get(child_path) is not None:
+              continue
+            self._visit(
+              batch, files, walker, scope, scan_path,
+              relative_path=child_path,
+              stat=dir_children.get(child, None),
+              parent_id=folder_id,
+              rules=rules,
+              force=force,
+            )
+
+  def _frontier(self, cursor: sqlite3.Cursor, scope: str) -> list[tuple[str, bool]]:
+    cursor.execute("SELECT path, force FROM frontier WHERE scope = ? ORDER BY id", (scope,))
+    return [(path, bool(force)) for path, force in cursor.fetchall()]
+
+  def _save_frontier(self, cursor: sqlite3.Cursor, scope: str, frontier: list[tuple[str, bool]]):
+    cursor.execute("DELETE FROM frontier WHERE scope = ?", (scope,))
+    cursor.executemany(
+      "INSERT INTO frontier (scope, path, force) VALUES (?, ?, ?)",
+      [(scope, path, force) for path, force in frontier],
+    )
 
-      mtime = os.path.getmtime(abs_path)
-      children: Optional[list[str]] = None
+  # rules of the folder's subtree changed, if one of its ignore files changed
+  def _ignore_files_changed(
+    self,
+    files: _Files,
+    scope_filter: ScopeFilter,
+    relative_path: str,
+    dir_children: DirChildren,
+  ) -> bool:
+    for name in scope_filter.ignore_files:
+      stat = dir_children.get(name, None)
+      old_file = files.get(os.path.join(relative_path, name))
+      if stat is None and old_file is None:
+        continue
+      if stat is None or old_file is None or stat.mtime != old_file.mtime:
+        return True
+    return False
 
-      if old_file is not None and \
-         old_file.mtime == mtime and \
-         is_dir == old_file.is_dir:
+  # folders are reported after walker listed them, others are reported at once
+  def _visit(
+    self,
+    batch: SQLite3BatchSession,
+    files: _Files,
+    walker: DirWalker[_WalkToken],
+    scope: str,
+    scan_path: str,
+    relative_path: str,
+    stat: Optional[FileStat],
+    parent_id: Optional[int],
+    rules: IgnoreRules,
+    force: bool,
+  ):
+    if stat is not None and stat.is_dir:
+      abs_path = os.path.join(scan_path, f".{relative_path}")
+      abs_path = os.path.abspath(abs_path)
+      walker.submit(abs_path, _WalkToken(relative_path, stat, parent_id, rules, force))
+    else:
+      self._scan_and_report(batch, files, scope, relative_path, stat, parent_id, None, False)
 
-        children = old_file.children
-        file_never_change = True
+  # returns id and children of folder which should be visited
+  def _scan_and_report(
+    self,
+    batch: SQLite3BatchSession,
+    files: _Files,
+    scope: str,
+    relative_path: str,
+    stat: Optional[FileStat],
+    parent_id: Optional[int],
+    dir_children: Optional[DirChildren],
+    force: bool,
+  ) -> Optional[tuple[int, list[str]]]:
+
+    old_file = files.get(relative_path)
+
+    if stat is None:
+      if old_file is not None:
+        with batch.write() as cursor:
+          self._remove_file(cursor, old_file)
+      return None
 
-      elif is_dir:
-        children = os.listdir(abs_path)
+    if old_file is not None and \
+       old_file.mtime == stat.mtime and \
+       old_file.is_dir == stat.is_dir:
 
-      new_file = _File(scope, relative_path, mtime, children)
+      if not old_file.is_dir:
+        return None
 
-    elif old_file is None:
-      return None
+      if force:
+        # the folder itself never changed, but its children may be excluded or included by filter now
+        with batch.write() as cursor:
+          self._commit_children_events(cursor, old_file, cast(DirChildren, dir_children))
+        return old_file.id, list(cast(DirChildren, dir_children).keys())
 
-    if not file_never_change:
-      try:
-        cursor.execute("BEGIN TRANSACTION")
-        self._commit_file_self_events(cursor, scope, old_file, new_file)
-        self._commit_children_events(cursor, scope, old_file, new_file)
-        conn.commit()
-      except Exception as e:
-        conn.rollback()
-        raise e
+      return old_file.id, [os.path.basename(child.path) for child in files.children(old_file)]
 
-    if new_file is None:
-      return None
+    with batch.write() as cursor:
+      new_file = self._commit_file_self_events(cursor, files, scope, relative_path, stat, parent_id, old_file)
+      if old_file is not None and old_file.is_dir and new_file.is_dir:
+        self._commit_children_events(cursor, old_file, cast(DirChildren, dir_children))
 
-    if new_file.children is None:
+    if not new_file.is_dir:
       return None
 
-    return new_file.children
-
-  def _ignore_dir(self, path: str) -> bool:
-    _, file_extension = os.path.splitext(path)
-    return file_extension.lower() == ".epub"
+    return new_file.id, list(cast(DirChildren, dir_children).keys())
 
   def _commit_file_self_events(
     self,
     cursor: sqlite3.Cursor,
+    files: _Files,
     scope: str,
+    path: str,
+    stat: FileStat,
+    parent_id: Optional[int],
     old_file: Optional[_File],
-    new_file: Optional[_File]
-  ):
-    if new_file is not None:
-      new_path = new_file.path
-      new_mtime = new_file.mtime
-      new_children, new_target = self._file_inserted_children_and_target(new_file)
-
-      if old_file is None:
-        cursor.execute(
-          "INSERT INTO files (scope, path, mtime, children) VALUES (?, ?, ?, ?)",
-          (scope, new_path, new_mtime, new_children),
-        )
-        record_added_event(cursor, new_target, new_path, scope, new_mtime)
-
-      else:
-        cursor.execute(
-          "UPDATE files SET mtime = ?, children = ? WHERE scope = ? AND path = ?",
-          (new_mtime, new_children, scope, new_path),
-        )
-        if old_file.is_dir == new_file.is_dir:
-          record_updated_event(cursor, new_target, new_path, scope, new_mtime)
-        else:
-          old_path = old_file.path
-          old_mtime = old_file.mtime
-          old_target = old_file.event_target
-          record_removed_event(cursor, old_target, old_path, scope, old_mtime)
-          record_added_event(cursor, new_target, new_path, scope, new_mtime)
-
-    elif old_file is not None:
-      old_path = old_file.path
-      old_mtime = old_file.mtime
-      old_target = old_file.event_target
-
-      cursor.execute("DELETE FROM files WHERE scope = ? AND path = ?", (scope, old_path))
-      record_removed_event(cursor, old_target, old_path, scope, old_mtime)
-
+  ) -> _File:
+    target = EventTarget.Directory if stat.is_dir else EventTarget.File
+
+    if old_file is None:
+      cursor.execute(
+        "INSERT INTO files (scope, path, mtime, is_dir, parent_id) VALUES (?, ?, ?, ?, ?)",
+        (scope, path, stat.mtime, stat.is_dir, parent_id),
+      )
+      new_file = _File(cast(int, cursor.lastrowid), scope, path, stat.mtime, stat.is_dir)
+      files.inserted(new_file, parent_id)
+      record_added_event(cursor, target, path, scope, stat.mtime)
+      return new_file
+
+    cursor.execute(
+      "UPDATE files SET mtime = ?, is_dir = ? WHERE id = ?",
+      (stat.mtime, stat.is_dir, old_file.id),
+    )
+    if old_file.is_dir == stat.is_dir:
+      record_updated_event(cursor, target, path, scope, stat.mtime)
+    else:
       if old_file.is_dir:
         self._handle_removed_folder(cursor, old_file)
+      record_removed_event(cursor, old_file.event_target, path, scope, old_file.mtime)
+      record_added_event(cursor, target, path, scope, stat.mtime)
+
+    return _File(old_file.id, scope, path, stat.mtime, stat.is_dir)
+
+  # children which are not in dir_children any more are removed, the listing is diffed in SQL
+  def _commit_children_events(self, cursor: sqlite3.Cursor, folder: _File, dir_children: DirChildren):
+    record_removed_events_of_children(
+      cursor=cursor,
+      scope=folder.scope,
+      parent_id=folder.id,
+      child_paths=(os.path.join(folder.path, name) for name in dir_children.keys()),
+    )
 
-  def _commit_children_events(
-    self,
-    cursor: sqlite3.Cursor,
-    scope: str,
-    old_file: Optional[_File],
-    new_file: Optional[_File]):
-
-    if old_file is None or not old_file.is_dir:
-      return
-
-    to_remove = set(cast(list[str], old_file.children))
-
-    if new_file is not None and new_file.children is not None:
-      for child in new_file.children:
-        if child in to_remove:
-          to_remove.remove(child)
-
-    for removed_file in to_remove:
-      child_path = os.path.join(old_file.path, removed_file)
-      child_file = self._select_file(cursor, scope, child_path)
-
-      if child_file is None:
-        continue
-
-      if child_file.is_dir:
-        self._handle_removed_folder(cursor, child_file)
-
-      cursor.execute("DELETE FROM files WHERE scope = ? AND path = ?", (scope, child_file.path))
-      record_removed_event(cursor, child_file.event_target, child_path, scope, child_file.mtime)
-
-  def _file_inserted_children_and_target(self, file: _File) -> tuple[Optional[str], EventTarget]:
-    children: Optional[str] = None
-    target: EventTarget = EventTarget.File
-
-    if file.children is not None:
-      # "/" is disabled in unix & windows file system, so it's safe to use it as separator
-      children = "/".join(file.children)
-      target = EventTarget.Directory
-
-    return children, target
+  def _remove_file(self, cursor: sqlite3.Cursor, file: _File):
+    cursor.execute("DELETE FROM files WHERE id = ?", (file.id,))
+    record_removed_event(cursor, file.event_target, file.path, file.scope, file.mtime)
+    if file.is_dir:
+      self._handle_removed_folder(cursor, file)
 
+  # removes the whole subtree by set-based SQL, instead of walking children of every folder
   def _handle_removed_folder(self, cursor: sqlite3.Cursor, folder: _File):
-    assert folder.children is not None
-
-    for child in folder.children:
-      path = os.path.join(folder.path, child)
-      file = self._select_file(cursor, folder.scope, path)
-      if file is None:
-        continue
-
-      if file.is_dir:
-        self._handle_removed_folder(cursor, file)
-
-      cursor.execute("DELETE FROM files WHERE id = ?", (file.path,))
-      record_removed_event(cursor, file.event_target, file.path, file.scope, file.mtime)
-
-  def _select_file(self, cursor: sqlite3.Cursor, scope: str, relative_path: str) -> Optional[_File]:
-    cursor.execute("SELECT mtime, children FROM files WHERE scope = ? AND path = ?", (scope, relative_path,))
-    row = cursor.fetchone()
-    if row is None:
-      return None
-    mtime, children_str = row
-    children: Optional[list[str]] = None
-
-    if children_str is not None:
-      # "/" is disabled in unix & windows file system, so it's safe to use it as separator
-      children = children_str.split("/")
-
-    return _File(scope, relative_path, mtime, children)
+    record_removed_events_of_files(cursor, folder.scope, folder.path)
 
 def _create_tables(cursor: Cursor):
   cursor.execute('''
@@ -290,4 +598,93 @@ def _create_tables(cursor: Cursor):
     CREATE UNIQUE INDEX idx_events ON events (scope, path, target)
   """)
 
-register_table_creators("scanner", _create_tables)
\ No newline at end of file
+def _migrate_add_files_index(cursor: Cursor):
+  # idx_files was created on events (scope, path) by mistake,
+  # it makes files lookup a full table scan and forbids events of a path with different targets.
+  cursor.execute("DROP INDEX IF EXISTS idx_files")
+  cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_files ON files (scope, path)
+  """)
+
+def _migrate_events_autoincrement(cursor: Cursor):
+  # ids of events must never be reused, because scan_stream() yields ids greater than the last one,
+  # while handlers delete events at the same time.
+  cursor.execute("""
+    CREATE TABLE events_autoincrement (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      kind INTEGER NOT NULL,
+      target INTEGER NOT NULL,
+      path TEXT NOT NULL,
+      scope TEXT NOT NULL,
+      mtime REAL NOT NULL
+    )
+  """)
+  cursor.execute("""
+    INSERT INTO events_autoincrement (id, kind, target, path, scope, mtime)
+    SELECT id, kind, target, path, scope, mtime FROM events
+  """)
+  cursor.execute("DROP TABLE events")
+  cursor.execute("ALTER TABLE events_autoincrement RENAME TO events")
+  cursor.execute("""
+    CREATE UNIQUE INDEX idx_events ON events (scope, path, target)
+  """)
+
+def _migrate_add_scopes_filter(cursor: Cursor):
+  # NULL means files of scope were recorded without filter
+  cursor.execute("ALTER TABLE scopes ADD COLUMN filter TEXT")
+
+def _migrate_normalize_children(cursor: Cursor):
+  # children were stored as names joined by "/" in their folder's row,
+  # now every row refers to its folder by parent_id.
+  cursor.execute("""
+    CREATE TABLE files_normalized (
+      id INTEGER PRIMARY KEY,
+      scope TEXT NOT NULL,
+      path TEXT NOT NULL,
+      mtime REAL NOT NULL,
+      is_dir INTEGER NOT NULL,
+      parent_id INTEGER
+    )
+  """)
+  cursor.execute("""
+    INSERT INTO files_normalized (id, scope, path, mtime, is_dir)
+    SELECT id, scope, path, mtime, children IS NOT NULL FROM files
+  """)
+  cursor.execute("DROP TABLE files")
+  cursor.execute("ALTER TABLE files_normalized RENAME TO files")
+  cursor.execute("CREATE INDEX idx_files ON files (scope, path)")
+
+  cursor.execute("SELECT id, scope, path FROM files")
+  ids: dict[tuple[str, str], int] = {}
+  for id, scope, path in cursor.fetchall():
+    ids[(scope, path)] = id
+
+  parent_ids: list[tuple[int, int]] = []
+  for (scope, path), id in ids.items():
+    if path == os.path.sep:
+      continue
+    parent_id = ids.get((scope, os.path.dirname(path)), None)
+    if parent_id is not None:
+      parent_ids.append((parent_id, id))
+
+  cursor.executemany("UPDATE files SET parent_id = ? WHERE id = ?", parent_ids)
+  cursor.execute("CREATE INDEX idx_files_parent ON files (parent_id)")
+
+def _migrate_add_frontier(cursor: Cursor):
+  # folders which were waiting to be walked when scan of their scope was interrupted
+  cursor.execute("""
+    CREATE TABLE frontier (
+      id INTEGER PRIMARY KEY,
+      scope TEXT NOT NULL,
+      path TEXT NOT NULL,
+      force INTEGER NOT NULL
+    )
+  """)
+  cursor.execute("CREATE INDEX idx_frontier ON frontier (scope)")
+
+register_table_creators("scanner", _create_tables)
+register_migration("scanner", 1, _migrate_add_files_index)
+register_migration("scanner", 2, _migrate_events_autoincrement)
+register_migration("scanner", 3, _migrate_add_scopes_filter)
+register_migration("scanner", 4, _migrate_normalize_children)
+register_migration("scanner", 5, _migrate_add_frontier)
\ No newline at end of file
@@ -3,8 +3,7 @@ from sqlite3 import Cursor
 from typing import Optional
 from sqlite3_pool import SQLite3Pool
 
-from .event_parser import EventTarget
-from .events import record_removed_event
+from .events import record_removed_events_of_files
 
 class Scope(ABC):
 
@@ -65,6 +64,17 @@ class ScopeManager(Scope):
         conn.rollback()
         raise e
 
+  # fingerprint of filter which was applied by last scan of scope
+  def filter_fingerprint(self, cursor: Cursor, scope: str) -> Optional[str]:
+    cursor.execute("SELECT filter FROM scopes WHERE name = ?", (scope,))
+    row = cursor.fetchone()
+    if row is None:
+      return None
+    return row[0]
+
+  def set_filter_fingerprint(self, cursor: Cursor, scope: str, fingerprint: str):
+    cursor.execute("UPDATE scopes SET filter = ? WHERE name = ?", (fingerprint, scope))
+
   def _fill_sources(self, cursor: Cursor) -> dict[str, str]:
     cursor.execute("SELECT name, path FROM scopes")
     sources: dict[str, str] = {}
@@ -73,15 +83,5 @@ class ScopeManager(Scope):
     return sources
 
   def _record_events_about_scope_removed(self, cursor: Cursor, scope: str):
-    cursor.execute("SELECT path, mtime, children FROM files WHERE scope = ?", (scope,))
-
-    while True:
-      rows = cursor.fetchmany(size=100)
-      if len(rows) == 0:
-        break
-      for row in rows:
-        path, mtime, children = row
-        target = EventTarget.File if children is None else EventTarget.Directory
-        record_removed_event(cursor, target, path, scope, mtime)
-
-    cursor.execute("DELETE FROM files WHERE scope = ?", (scope,))
+    record_removed_events_of_files(cursor, scope)
+    cursor.execute("DELETE FROM frontier WHERE scope = ?", (scope,))
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import stat
+
+from queue import Queue, Empty
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Generic, TypeVar, Optional, Generator, Callable
+
+T = TypeVar("T")
+
+@dataclass
+class FileStat:
+  is_dir: bool
+  mtime: float
+
+# children of a folder, None means the child disappeared while listing it
+DirChildren = dict[str, Optional[FileStat]]
+
+def stat_file(path: str) -> Optional[FileStat]:
+  try:
+    result = os.stat(path)
+  except (FileNotFoundError, NotADirectoryError):
+    return None
+  return FileStat(
+    is_dir=stat.S_ISDIR(result.st_mode),
+    mtime=result.st_mtime,
+  )
+
+# lists folders in threads with os.scandir, so that stat of every child comes from its DirEntry
+# (the only syscall per child on unix, and free on windows) and slow disks are read in parallel.
+class DirWalker(Generic[T]):
+  def __init__(self, max_workers: int):
+    self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+      max_workers=max(1, max_workers),
+      thread_name_prefix="scanner_walker",
+    )
+    self._completed: Queue[tuple[int, Future[Optional[DirChildren]]]] = Queue()
+    # tokens which have been submitted but not yielded yet
+    self._pending: dict[int, T] = {}
+    self._next_key: int = 0
+
+  def submit(self, path: str, token: T):
+    key = self._next_key
+    self._next_key += 1
+    self._pending[key] = token
+    future = self._executor.submit(_list_dir, path)
+    future.add_done_callback(lambda f: self._completed.put((key, f)))
+
+  # folders which are not listed or listed but not yielded, the frontier of walking
+  def pending_tokens(self) -> list[T]:
+    return list(self._pending.values())
+
+  # yields in completed order, and submit() can be called while iterating.
+  # children is None when the folder disappeared before listing.
+  # on_idle is called before waiting for listings which have not completed.
+  def results(self, on_idle: Callable[[], None] = lambda: None) -> Generator[tuple[T, Optional[DirChildren]], None, None]:
+    while len(self._pending) > 0:
+      try:
+        key, future = self._completed.get_nowait()
+      except Empty:
+        on_idle()
+        key, future = self._completed.get()
+      token = self._pending.pop(key)
+      yield token, future.result()
+
+  def close(self):
+    self._executor.shutdown(wait=True, cancel_futures=True)
+
+  def __enter__(self) -> DirWalker[T]:
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+def _list_dir(path: str) -> Optional[DirChildren]:
+  children: DirChildren = {}
+  try:
+    with os.scandir(path) as entries:
+      for entry in entries:
+        children[entry.name] = _entry_stat(entry)
+  except (FileNotFoundError, NotADirectoryError):
+    return None
+  return children
+
+def _entry_stat(entry: os.DirEntry) -> Optional[FileStat]:
+  try:
+    return FileStat(
+      is_dir=entry.is_dir(),
+      mtime=entry.stat().st_mtime,
+    )
+  except FileNotFoundError:
+    return None
@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from typing import Callable, Optional
+from .scanner import Scanner
+from .filter import IgnoreRules
+from ..progress_events import ProgressEventListener, WatchingErrorEvent
+
+# see <sys/inotify.h>
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_EXCL_UNLINK = 0x04000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | \
+              _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | \
+              _IN_ONLYDIR | _IN_DONT_FOLLOW | _IN_EXCL_UNLINK
+
+# entries of the folder changed, so the folder itself must be scanned again
+_CHILDREN_CHANGED_MASK = _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+def is_watching_supported() -> bool:
+  return sys.platform.startswith("linux") and _libc() is not None
+
+# records changes of scopes into events table by inotify, and calls on_changed with ids of events.
+# bursts of changes are recorded together after nothing changed for debounce seconds (or max_delay).
+# full scan is still needed to reconcile changes which happened when it's not watching.
+# when kernel dropped events, on_overflowed is called and the owner should start a full scan job,
+# it never scans in thread of watcher. failures are reported to progress_event_listener.
+class Watcher:
+  def __init__(
+    self,
+    scanner: Scanner,
+    on_changed: Callable[[list[int]], None],
+    debounce: float = 0.5,
+    max_delay: float = 5.0,
+    on_overflowed: Callable[[], None] = lambda: None,
+    progress_event_listener: ProgressEventListener = lambda _: None,
+  ):
+    self._scanner: Scanner = scanner
+    self._on_changed: Callable[[list[int]], None] = on_changed
+    self._on_overflowed: Callable[[], None] = on_overflowed
+    self._listener: ProgressEventListener = progress_event_listener
+    self._debounce: float = debounce
+    self._max_delay: float = max_delay
+    self._fd: int = -1
+    self._thread: Optional[threading.Thread] = None
+    self._stop_event: threading.Event = threading.Event()
+    # watch descriptor -> (scope, relative path of folder)
+    self._watches: dict[int, tuple[str, str]] = {}
+    self._pending: dict[str, set[str]] = {}
+    self._rescan_all: bool = False
+    self._first_pending_at: float = 0.0
+    self._last_pending_at: float = 0.0
+
+  def start(self):
+    if self._thread is not None:
+      raise RuntimeError("watcher already started")
+
+    libc = _libc()
+    if libc is None or not sys.platform.startswith("linux"):
+      raise RuntimeError("watching is only supported on Linux")
+
+    fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+      code = ctypes.get_errno()
+      raise OSError(code, os.strerror(code))
+    self._fd = fd
+
+    for scope in self._scanner.scope.scopes:
+      self._add_watches(scope, os.path.sep)
+
+    self._thread = threading.Thread(target=self._run, name="scanner_watcher", daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._stop_event.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+    if self._fd >= 0:
+      os.close(self._fd)
+      self._fd = -1
+
+  def __enter__(self) -> "Watcher":
+    self.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+
+  def _run(self):
+    while not self._stop_event.is_set():
+      timeout = 0.25
+      if self._has_pending:
+        now = time.monotonic()
+        timeout = min(
+          timeout,
+          max(0.0, self._last_pending_at + self._debounce - now),
+          max(0.0, self._first_pending_at + self._max_delay - now),
+        )
+      readable, _, _ = select.select([self._fd], [], [], timeout)
+      if readable:
+        self._read_events()
+
+      if self._has_pending:
+        now = time.monotonic()
+        if now - self._last_pending_at >= self._debounce or \
+           now - self._first_pending_at >= self._max_delay:
+          try:
+            self._flush()
+          except Exception as e:
+            self._listener(WatchingErrorEvent(
+              error=f"failed to record watched changes: {e}",
+            ))
+
+  @property
+  def _has_pending(self) -> bool:
+    return self._rescan_all or len(self._pending) > 0
+
+  def _read_events(self):
+    try:
+      buffer = os.read(self._fd, 64 * 1024)
+    except BlockingIOError:
+      return
+
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(buffer):
+      wd, mask, _, name_len = _EVENT_HEADER.unpack_from(buffer, offset)
+      offset += _EVENT_HEADER.size
+      name = os.fsdecode(buffer[offset:offset + name_len].rstrip(b"\0"))
+      offset += name_len
+      self._handle_event(wd, mask, name)
+
+  def _handle_event(self, wd: int, mask: int, name: str):
+    if mask & _IN_Q_OVERFLOW:
+      # events were dropped by kernel, only a full scan can find them
+      self._rescan_all = True
+      self._mark_pending()
+      return
+
+    watch = self._watches.get(wd, None)
+    if watch is None:
+      return
+
+    scope, dir_path = watch
+    if mask & _IN_IGNORED:
+      self._watches.pop(wd, None)
+      return
+
+    if name == "":
+      # the watched folder itself was removed or moved
+      if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+        self._add_pending(scope, dir_path)
+      return
+
+    path = os.path.join(dir_path, name)
+    self._add_pending(scope, path)
+
+    if mask & _CHILDREN_CHANGED_MASK:
+      self._add_pending(scope, dir_path)
+
+    if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+      self._add_watches(scope, path)
+
+  def _add_pending(self, scope: str, path: str):
+    paths = self._pending.get(scope, None)
+    if paths is None:
+      paths = set()
+      self._pending[scope] = paths
+    paths.add(path)
+    self._mark_pending()
+
+  def _mark_pending(self):
+    now = time.monotonic()
+    if self._first_pending_at == 0.0:
+      self._first_pending_at = now
+    self._last_pending_at = now
+
+  def _flush(self):
+    rescan_all = self._rescan_all
+    pending = self._pending
+    self._rescan_all = False
+    self._pending = {}
+    self._first_pending_at = 0.0
+
+    if rescan_all:
+      # paths pending are under scopes, the full scan finds them too
+      self._on_overflowed()
+      return
+
+    for scope, paths in pending.items():
+      # parents first, so that new folders are walked once
+      self._scanner.scan_paths(scope, sorted(paths, key=lambda p: (p.count(os.path.sep), p)))
+
+    event_ids = self._scanner.event_ids()
+    if len(event_ids) > 0:
+      self._on_changed(event_ids)
+
+  def _add_watches(self, scope: str, relative_path: str):
+    scope_path = self._scanner.scope.scope_path(scope)
+    if scope_path is None:
+      return
+
+    libc = _libc()
+    assert libc is not None
+    scope_filter = self._scanner.scope_filter(scope)
+    root_rules: Optional[IgnoreRules] = IgnoreRules()
+    if relative_path != os.path.sep:
+      root_rules = scope_filter.rules_of(os.path.dirname(relative_path))
+    if root_rules is None:
+      return
+    if not scope_filter.accepts(root_rules, relative_path, True):
+      return
+
+    folders: list[tuple[str, IgnoreRules]] = [(relative_path, root_rules)]
+
+    while len(folders) > 0:
+      folder, rules = folders.pop()
+      abs_path = os.path.abspath(os.path.join(scope_path, f".{folder}"))
+      wd = libc.inotify_add_watch(self._fd, os.fsencode(abs_path), _WATCH_MASK)
+      if wd < 0:
+        code = ctypes.get_errno()
+        if code == errno.ENOSPC:
+          self._listener(WatchingErrorEvent(
+            error="inotify watches limit reached (fs.inotify.max_user_watches), rest of folders will be found by full scan",
+          ))
+          return
+        continue
+
+      self._watches[wd] = (scope, folder)
+      try:
+        with os.scandir(abs_path) as entries:
+          entries = list(entries)
+      except (FileNotFoundError, NotADirectoryError, PermissionError):
+        continue
+
+      children_rules = scope_filter.rules_for_children(rules, folder, (e.name for e in entries))
+      for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+          child = os.path.join(folder, entry.name)
+          if scope_filter.accepts(children_rules, child, True):
+            folders.append((child, children_rules))
+
+_libc_instance: Optional[ctypes.CDLL] = None
+_libc_loaded: bool = False
+
+def _libc() -> Optional[ctypes.CDLL]:
+  global _libc_instance, _libc_loaded
+  if not _libc_loaded:
+    _libc_loaded = True
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+      libc.inotify_init1.argtypes = [ctypes.c_int]
+      libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+      _libc_instance = libc
+    except (OSError, AttributeError):
+      _libc_instance = None
+  return _libc_instance
@@ -1,9 +1,13 @@
+import time
 import threading
 
-from typing import Callable
+from typing import Callable, Generator, Iterable
+from .scheduler import EventScheduler
 from ..scanner import Event, Scanner
 from ..progress_events import ProgressEventListener, ScanCompletedEvent
-from ..utils import TasksPool, TasksPoolResultState
+from ..utils import TasksPool, TasksPoolResultState, InterruptException
+
+_RUNNING_COUNT_INTERVAL = 0.5
 
 class ServiceScanJob:
   def __init__(
@@ -12,10 +16,18 @@ class ServiceScanJob:
     max_workers: int,
     progress_event_listener: ProgressEventListener,
     handle_event: Callable[[Event], None],
+    estimate_cost: Callable[[Event], float] = lambda _: 0.0,
+    fair_scopes: bool = False,
+    prepare: Callable[[threading.Event], None] = lambda _: None,
+    on_completed: Callable[[], None] = lambda: None,
   ):
     self._scanner: Scanner = scanner
     self._listener: ProgressEventListener = progress_event_listener
     self._handle_event: Callable[[Event], None] = handle_event
+    self._estimate_cost: Callable[[Event], float] = estimate_cost
+    self._fair_scopes: bool = fair_scopes
+    self._prepare: Callable[[threading.Event], None] = prepare
+    self._on_completed: Callable[[], None] = on_completed
     self._interrupter_lock: threading.Lock = threading.Lock()
     self._did_interrupted: bool = False
     self._pool: TasksPool[int] = TasksPool[int](
@@ -27,26 +39,89 @@ class ServiceScanJob:
   # @return True if scan completed, False if scan interrupted
   def start(self, sources: dict[str, str]) -> bool:
     self._scanner.commit_sources(sources)
-    event_ids = self._scanner.scan()
+    # events are handled while scopes are still being walked
+    return self._handle_events(self._scanner.scan_stream(
+      listener=self._listener,
+      interrupted=self._pool.interrupted_event,
+    ))
+
+  # handles events recorded before (e.g. by Watcher) without walking scopes
+  # @return True if handling completed, False if it's interrupted
+  def start_with_recorded_events(self) -> bool:
+    return self._handle_events(self._scanner.event_ids())
+
+  # events are read ahead into scheduler, and dispatcher thread pushes the cheapest one
+  # to pool whenever a worker is free.
+  def _handle_events(self, event_ids: Iterable[int]) -> bool:
     self._pool.start()
+    scheduler = EventScheduler(self._fair_scopes)
+    dispatcher = threading.Thread(
+      target=lambda: self._dispatch_events(scheduler),
+      name="scan_job_dispatcher",
+      daemon=True,
+    )
+    dispatcher.start()
+    count: int = 0
+    reported_at: float = 0.0
 
-    self._listener(ScanCompletedEvent(
-      updated_files=self._scanner.events_count,
-    ))
+    try:
+      # it stops when interrupted event is set, and no event is handled then
+      self._prepare(self._pool.interrupted_event)
+      for event_id in event_ids:
+        if self._pool.is_interrupted:
+          break
+        event = self._scanner.parse_event(event_id)
+        scheduler.add(event_id, event.scope, self._estimate_cost(event))
+        count += 1
+        now = time.monotonic()
+        if now - reported_at >= _RUNNING_COUNT_INTERVAL:
+          reported_at = now
+          self._listener(ScanCompletedEvent(
+            updated_files=count,
+            final=False,
+          ))
+      else:
+        self._listener(ScanCompletedEvent(
+          updated_files=count,
+          final=True,
+        ))
 
-    for event_id in event_ids:
-      success = self._pool.push(event_id)
-      if not success:
-        break
+    except InterruptException:
+      pass
 
+    except BaseException as e:
+      self._pool.interrupt()
+      scheduler.close()
+      dispatcher.join()
+      self._pool.complete()
+      raise e
+
+    finally:
+      # stops scanning which is still running
+      if isinstance(event_ids, Generator):
+        event_ids.close()
+
+    scheduler.close()
+    dispatcher.join()
     state = self._pool.complete()
+
     if state == TasksPoolResultState.RaisedException:
       raise RuntimeError("scan failed with Exception")
     elif state == TasksPoolResultState.Interrupted:
       return False
     else:
+      # it's never called if job was interrupted or failed, events which are not handled yet may need them
+      self._on_completed()
       return True
 
+  def _dispatch_events(self, scheduler: EventScheduler):
+    while True:
+      event_id = scheduler.pop()
+      if event_id is None:
+        break
+      if not self._pool.push(event_id):
+        break
+
   # could be called in another thread safely
   def interrupt(self):
     with self._interrupter_lock:
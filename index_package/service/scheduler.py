@@ -0,0 +1,51 @@
+import heapq
+import threading
+
+from typing import Optional
+from collections import deque
+
+# hands out the cheapest event first, so that more files become searchable sooner during a long scan.
+# events of same cost keep the order of their ids.
+# with fair_scopes, scopes take turns, so that a scope full of large files never starves others.
+class EventScheduler:
+  def __init__(self, fair_scopes: bool = False):
+    self._fair_scopes: bool = fair_scopes
+    self._condition: threading.Condition = threading.Condition()
+    # scope (or "" if not fair) -> heap of (cost, event_id)
+    self._queues: dict[str, list[tuple[float, int]]] = {}
+    self._turns: deque[str] = deque()
+    self._is_closed: bool = False
+
+  def add(self, event_id: int, scope: str, cost: float):
+    key = scope if self._fair_scopes else ""
+    with self._condition:
+      queue = self._queues.get(key, None)
+      if queue is None:
+        queue = []
+        self._queues[key] = queue
+        self._turns.append(key)
+      heapq.heappush(queue, (cost, event_id))
+      self._condition.notify()
+
+  # no more events will be added, pop() returns None after the rest were popped
+  def close(self):
+    with self._condition:
+      self._is_closed = True
+      self._condition.notify_all()
+
+  # blocks until an event was added or scheduler was closed
+  def pop(self) -> Optional[int]:
+    with self._condition:
+      while len(self._turns) == 0:
+        if self._is_closed:
+          return None
+        self._condition.wait()
+
+      key = self._turns.popleft()
+      queue = self._queues[key]
+      _, event_id = heapq.heappop(queue)
+      if len(queue) > 0:
+        self._turns.append(key)
+      else:
+        self._queues.pop(key)
+      return event_id
@@ -1,15 +1,15 @@
 import os
 
-from typing import Optional
+from typing import Callable, Optional
 from dataclasses import dataclass
 from .scan_job import ServiceScanJob
 from .trimmer import trim_nodes, QueryItem
-from ..scanner import Scanner
+from ..scanner import Scanner, ScanFilter, Watcher
 from ..index import Index, VectorDB, FTS5DB
 from ..parser import PdfParser
 from ..segmentation.segmentation import Segmentation
 from ..progress_events import ProgressEventListener
-from ..utils import ensure_dir, ensure_parent_dir
+from ..utils import ensure_dir, ensure_parent_dir, HashAlgorithm
 
 
 @dataclass
@@ -22,6 +22,11 @@ class Service:
     self,
     workspace_path: str,
     embedding_model_id: str,
+    default_scan_filter: ScanFilter = ScanFilter(),
+    scan_filters: Optional[dict[str, ScanFilter]] = None,
+    hash_algorithm: HashAlgorithm = HashAlgorithm.SHA512,
+    pdf_extract_processes: int = 0,
+    pdf_compress_pages: bool = False,
   ):
     index_dir_path: str = ensure_dir(
       os.path.abspath(os.path.join(workspace_path, "vector_db")),
@@ -30,14 +35,15 @@ class Service:
       db_path=ensure_parent_dir(
         os.path.abspath(os.path.join(workspace_path, "scanner.sqlite3"))
       ),
+      default_scan_filter=default_scan_filter,
+      scan_filters=scan_filters,
     )
     self._pdf_parser: PdfParser = PdfParser(
         cache_dir_path=ensure_dir(
           os.path.abspath(os.path.join(workspace_path, "parser", "pdf_cache")),
         ),
-        temp_dir_path=ensure_dir(
-          os.path.abspath(os.path.join(workspace_path, "temp")),
-        ),
+        extract_processes=pdf_extract_processes,
+        compress_pages=pdf_compress_pages,
       )
     self._index: Index = Index(
       scope=self._scanner.scope,
@@ -54,8 +60,12 @@ class Service:
           os.path.abspath(os.path.join(workspace_path, "index_fts5.sqlite3"))
         ),
       ),
+      hash_algorithm=hash_algorithm,
     )
 
+  def close(self):
+    self._pdf_parser.close()
+
   def query(self, text: str, results_limit: int) -> QueryResult:
     nodes, keywords = self._index.query(text, results_limit)
     trimmed_nodes = trim_nodes(self._index, self._pdf_parser, nodes)
@@ -76,7 +86,37 @@ class Service:
     path = os.path.abspath(path)
     return path
 
-  def scan_job(self, max_workers: int = 1, progress_event_listener: Optional[ProgressEventListener] = None) -> ServiceScanJob:
+  # sources are committed at first, so that changes during next full scan are watched too
+  def watcher(
+    self,
+    sources: dict[str, str],
+    on_changed: Callable[[list[int]], None],
+    debounce: float = 0.5,
+    max_delay: float = 5.0,
+    on_overflowed: Callable[[], None] = lambda: None,
+    progress_event_listener: Optional[ProgressEventListener] = None,
+  ) -> Watcher:
+    if progress_event_listener is None:
+      progress_event_listener = lambda _: None
+
+    self._scanner.commit_sources(sources)
+    return Watcher(
+      scanner=self._scanner,
+      on_changed=on_changed,
+      debounce=debounce,
+      max_delay=max_delay,
+      on_overflowed=on_overflowed,
+      progress_event_listener=progress_event_listener,
+    )
+
+  # cheap events (removals, small files) are handled at first.
+  # with fair_scopes, scopes take turns to be handled.
+  def scan_job(
+    self,
+    max_workers: int = 1,
+    progress_event_listener: Optional[ProgressEventListener] = None,
+    fair_scopes: bool = False,
+  ) -> ServiceScanJob:
     if progress_event_listener is None:
       progress_event_listener = lambda _: None
 
@@ -85,4 +125,9 @@ class Service:
       progress_event_listener=progress_event_listener,
       scanner=self._scanner,
       handle_event=lambda event: self._index.handle_event(event, progress_event_listener),
+      estimate_cost=self._index.estimate_cost,
+      fair_scopes=fair_scopes,
+      prepare=self._index.alias_hashes,
+      # lost files are purged only after all events are handled, moved files have been found by then
+      on_completed=self._index.purge_lost_files,
     )
\ No newline at end of file
@@ -49,9 +49,11 @@ def trim_nodes(index: Index, pdf_parser: PdfParser, nodes: list[IndexNode]) -> l
   for node in nodes:
     if node.type == "pdf":
       pdf = pdf_parser.pdf_or_none(node.id)
-      if pdf is not None:
+      pdf_files = index.get_paths(node.id)
+      # index of a removed pdf is kept for a while, in case it was moved
+      if pdf is not None and len(pdf_files) > 0:
         result_items.append(PdfQueryItem(
-          pdf_files=index.get_paths(node.id),
+          pdf_files=pdf_files,
           distance=node.vector_distance,
           metadata=pdf.metadata,
         ))
@@ -117,6 +119,9 @@ def _trim_page_and_child_type(
         device_path=relative_to.device_path,
         page_index=relative_to.page_index,
       ))
+    # page only belongs to removed pdfs
+    if len(page_item.pdf_files) == 0:
+      return None
     page_items_dict[page.hash] = page_item
 
   return page_item
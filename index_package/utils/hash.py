@@ -1,13 +1,69 @@
+import os
 import base64
 import hashlib
 
-def hash_sha512(file_path, chunk_size: int = 4096) -> str:
-  sha512_hash = hashlib.sha512()
+from enum import Enum
+from typing import Optional, Iterable, Generator
+from concurrent.futures import ThreadPoolExecutor
+
+# files are read into one reused buffer. mmap is not used, because a file which is
+# truncated by another process while it's mapped crashes the whole process with SIGBUS.
+_CHUNK_SIZE = 1024 * 1024
+
+class HashAlgorithm(Enum):
+  SHA512 = "sha512"
+  BLAKE2B = "blake2b"
+
+# ids of sha512 have no prefix, they were recorded before the algorithm could be chosen.
+# ids of other algorithms are prefixed by name, so ids of different algorithms never collide
+# and both of them stay valid in databases.
+def hash_file(file_path: str, algorithm: HashAlgorithm = HashAlgorithm.SHA512) -> str:
+  hash = hashlib.new(algorithm.value)
+
   with open(file_path, "rb") as file:
-    while chunk := file.read(chunk_size):
-      sha512_hash.update(chunk)
+    if os.fstat(file.fileno()).st_size <= _CHUNK_SIZE:
+      hash.update(file.read())
+    else:
+      buffer = bytearray(_CHUNK_SIZE)
+      view = memoryview(buffer)
+      while (size := file.readinto(buffer)) > 0:
+        # hashlib releases GIL for large data
+        hash.update(view[:size])
+
+  return _to_id(hash, algorithm)
+
+def hash_bytes(data: bytes, algorithm: HashAlgorithm = HashAlgorithm.SHA512) -> str:
+  hash = hashlib.new(algorithm.value)
+  hash.update(data)
+  return _to_id(hash, algorithm)
+
+# yields in order of file_paths, files are hashed in parallel by threads.
+# None is yielded for a file which cannot be read.
+def hash_files(
+  file_paths: Iterable[str],
+  algorithm: HashAlgorithm = HashAlgorithm.SHA512,
+  max_workers: int = 4,
+) -> Generator[Optional[str], None, None]:
+  with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hash_files") as executor:
+    yield from executor.map(lambda path: _hash_file_or_none(path, algorithm), file_paths)
+
+def hash_algorithm_of(id: str) -> HashAlgorithm:
+  name, separator, _ = id.partition(":")
+  if separator == "":
+    return HashAlgorithm.SHA512
+  return HashAlgorithm(name)
+
+def hash_sha512(file_path: str) -> str:
+  return hash_file(file_path, HashAlgorithm.SHA512)
 
-  bytes = sha512_hash.digest()
-  base64_data = base64.urlsafe_b64encode(bytes)
+def _hash_file_or_none(file_path: str, algorithm: HashAlgorithm) -> Optional[str]:
+  try:
+    return hash_file(file_path, algorithm)
+  except OSError:
+    return None
 
-  return base64_data.decode()
\ No newline at end of file
+def _to_id(hash, algorithm: HashAlgorithm) -> str:
+  id = base64.urlsafe_b64encode(hash.digest()).decode()
+  if algorithm != HashAlgorithm.SHA512:
+    id = f"{algorithm.value}:{id}"
+  return id
@@ -78,6 +78,10 @@ class TasksPool(Generic[E]):
   def is_interrupted(self) -> bool:
     return self._interrupted_event.is_set()
 
+  @property
+  def interrupted_event(self) -> threading.Event:
+    return self._interrupted_event
+
   def start(self) -> TasksPool:
     for index in range(self._max_workers):
       thread = threading.Thread(
@@ -154,6 +158,16 @@ class InterruptException(Exception):
   def __init__(self):
     super().__init__("Interrupt")
 
+# let threads started by a task share interruption of the task
+def interrupted_event() -> Optional[threading.Event]:
+  if not hasattr(_interrupted_event_val, "value"):
+    return None
+  return cast(threading.Event, _interrupted_event_val.value)
+
+def bind_interrupted_event(event: Optional[threading.Event]):
+  if event is not None:
+    _interrupted_event_val.value = event
+
 def assert_continue():
   if not hasattr(_interrupted_event_val, "value"):
     return
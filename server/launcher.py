@@ -5,6 +5,8 @@ import threading
 import webbrowser
 
 from flask import Flask
+from sqlite3_pool import ConnectionProfile, set_connection_profile, set_default_connection_profile, enable_statement_statistics
+from index_package import ScanFilter, HashAlgorithm, set_page_cache_size
 from .routes import routes
 from .sources import Sources
 from .service import ServiceRef
@@ -12,7 +14,10 @@ from .service import ServiceRef
 
 def launch():
   print(f"Server is starting...")
-  port = _load_port()
+  config = _load_config()
+  port = config["port"]
+  _setup_sqlite3(config.get("sqlite3", {}))
+  set_page_cache_size(int(config.get("pdf_page_cache_size", 64 * 1024 * 1024)))
   thread = threading.Thread(target=lambda: _launch_browser(port))
   thread.start()
 
@@ -24,25 +29,65 @@ def launch():
   if not os.path.exists(app_dir):
     os.makedirs(app_dir)
 
+  _setup_sqlite3_statistics(config.get("sqlite3_statistics", {}), app_dir)
+
   sources = Sources(os.path.join(app_dir, "app.sqlite3"))
+  default_scan_filter, scan_filters = _load_scan_filters(config.get("scan_filter", {}))
   service = ServiceRef(
     app=app,
     workspace_path=app_dir,
     sources=sources,
     embedding_model="shibing624/text2vec-base-chinese",
+    watch_config=config.get("watch", {}),
+    default_scan_filter=default_scan_filter,
+    scan_filters=scan_filters,
+    hash_algorithm=HashAlgorithm(config.get("hash_algorithm", "sha512")),
+    pdf_extract_processes=config.get("pdf_extract_processes", 0),
+    pdf_compress_pages=config.get("pdf_compress_pages", False),
+    fair_scopes=config.get("scan_fair_scopes", False),
   )
   routes(app, service)
   app.run(host="0.0.0.0", port=port)
   thread.join()
 
-def _load_port():
+def _load_config() -> dict:
   path = os.path.abspath(__file__)
   path = os.path.join(path, "..", "..", "config.yaml")
   path = os.path.abspath(path)
 
   with open(path, "r", encoding="utf-8") as file:
-    config = yaml.safe_load(file)
-    return config["port"]
+    return yaml.safe_load(file)
+
+def _setup_sqlite3(config: dict):
+  default_profile = ConnectionProfile.from_config(config.get("default", {}))
+  set_default_connection_profile(default_profile)
+
+  for format_name, format_config in config.items():
+    if format_name != "default":
+      set_connection_profile(
+        format_name,
+        ConnectionProfile.from_config(format_config, base=default_profile),
+      )
+
+def _setup_sqlite3_statistics(config: dict, app_dir: str):
+  if not config.get("enabled", False):
+    return
+
+  slow_log_path: str | None = config.get("slow_log", None)
+  if slow_log_path is not None:
+    slow_log_path = os.path.abspath(os.path.join(app_dir, slow_log_path))
+
+  enable_statement_statistics(
+    slow_threshold=float(config.get("slow_threshold", 0.1)),
+    slow_log_path=slow_log_path,
+  )
+
+def _load_scan_filters(config: dict) -> tuple[ScanFilter, dict[str, ScanFilter]]:
+  default_filter = ScanFilter.from_config(config.get("default", {}))
+  scope_filters: dict[str, ScanFilter] = {}
+  for scope, scope_config in config.get("scopes", {}).items():
+    scope_filters[scope] = ScanFilter.from_config(scope_config, base=default_filter)
+  return default_filter, scope_filters
 
 def _launch_browser(port: int):
   time.sleep(0.85)
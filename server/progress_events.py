@@ -6,11 +6,13 @@ from queue import Queue, Empty
 from index_package import (
   ProgressEvent,
   ScanCompletedEvent,
+  ScanScopeProgressEvent,
   StartHandleFileEvent,
   CompleteHandleFileEvent,
   PDFFileProgressEvent,
   PDFFileStep,
   HandleFileOperation,
+  WatchingErrorEvent,
 )
 
 
@@ -42,6 +44,7 @@ class ProgressEvents:
     self._phase: ProgressPhase = ProgressPhase.READY
     self._status_lock: Lock = Lock()
     self._updated_files: int = 0
+    self._scan_final: bool = False
     self._handing_file: HandingFile | None = None
     self._error: str | None = None
     self._interruption_status: InterruptionStatus = InterruptionStatus.No
@@ -53,6 +56,7 @@ class ProgressEvents:
     with self._status_lock:
       if self._phase != ProgressPhase.READY:
         self._updated_files = 0
+        self._scan_final = False
         self._handing_file = None
         self._error = None
         self._interruption_status = InterruptionStatus.No
@@ -75,6 +79,7 @@ class ProgressEvents:
       events.append({
         "kind": "scanCompleted",
         "count": self._updated_files,
+        "final": self._scan_final,
       })
       for file in self._completed_files:
         events.append({
@@ -121,7 +126,9 @@ class ProgressEvents:
 
   def receive_event(self, event: ProgressEvent):
     if isinstance(event, ScanCompletedEvent):
-      self._on_scan_completed(event.updated_files)
+      self._on_scan_completed(event.updated_files, event.final)
+    elif isinstance(event, ScanScopeProgressEvent):
+      self._on_scan_scope_progress(event.scope, event.scanned_files, event.completed)
     elif isinstance(event, StartHandleFileEvent):
       self._on_start_handle_file(event.path, event.operation)
     elif isinstance(event, CompleteHandleFileEvent):
@@ -131,15 +138,31 @@ class ProgressEvents:
         self._on_pdf_parse_progress(event.completed, event.total)
       elif event.step == PDFFileStep.Index:
         self._on_pdf_index_progress(event.completed, event.total)
+    elif isinstance(event, WatchingErrorEvent):
+      self._emit_event({
+        "kind": "watchingFailure",
+        "error": event.error,
+      })
 
-  def _on_scan_completed(self, updated_files: int):
+  # called with running count while scanning, and with final total at last
+  def _on_scan_completed(self, updated_files: int, final: bool):
     with self._status_lock:
       self._phase = ProgressPhase.HANDING_FILES
       self._updated_files = updated_files
+      self._scan_final = final
 
     self._emit_event({
       "kind": "scanCompleted",
       "count": updated_files,
+      "final": final,
+    })
+
+  def _on_scan_scope_progress(self, scope: str, scanned_files: int, completed: bool):
+    self._emit_event({
+      "kind": "scanScopeProgress",
+      "scope": scope,
+      "count": scanned_files,
+      "completed": completed,
     })
 
   def _on_start_handle_file(self, path: str, operation: HandleFileOperation):
@@ -1,6 +1,7 @@
 import os
 
-from sqlite3_pool import build_thread_pool, release_thread_pool
+from sqlite3_pool import build_thread_pool, release_thread_pool, statement_statistics
+from index_package import page_cache_statistics
 from .service import ServiceRef
 from flask import (
   request,
@@ -100,6 +101,14 @@ def routes(app: Flask, service: ServiceRef):
     service.sources.remove(name)
     return jsonify(None), 204
 
+  @app.route("/api/sqlite3/statistics", methods=["GET"])
+  def get_sqlite3_statistics():
+    return jsonify(statement_statistics())
+
+  @app.route("/api/pdf/page_cache/statistics", methods=["GET"])
+  def get_page_cache_statistics():
+    return jsonify(page_cache_statistics())
+
   @app.route("/files/<scope>/<path:path>", methods=["GET"])
   def open_pdf_file(scope: str, path: str):
     device_path = service.ref.device_path(scope, path)
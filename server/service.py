@@ -2,7 +2,8 @@ from threading import Thread, Lock, Event
 from typing import Generator
 from json import dumps
 from flask import Flask
-from index_package import Service, ServiceScanJob
+from index_package import Service, ServiceScanJob, ScanFilter, HashAlgorithm
+from index_package.scanner import Watcher, is_watching_supported
 from .sources import Sources
 from .progress_events import ProgressEvents
 from .signal_handler import SignalHandler
@@ -14,6 +15,13 @@ class ServiceRef:
       sources: Sources,
       workspace_path: str,
       embedding_model: str,
+      watch_config: dict | None = None,
+      default_scan_filter: ScanFilter = ScanFilter(),
+      scan_filters: dict[str, ScanFilter] | None = None,
+      hash_algorithm: HashAlgorithm = HashAlgorithm.SHA512,
+      pdf_extract_processes: int = 0,
+      pdf_compress_pages: bool = False,
+      fair_scopes: bool = False,
     ):
     self._app: Flask = app
     self._sources: Sources = sources
@@ -23,12 +31,19 @@ class ServiceRef:
     self._is_scanning: bool = False
     self._scan_job: ServiceScanJob | None = None
     self._scan_job_event: Event | None = None
+    self._watch_config: dict = watch_config or {}
+    self._default_scan_filter: ScanFilter = default_scan_filter
+    self._scan_filters: dict[str, ScanFilter] = scan_filters or {}
+    self._hash_algorithm: HashAlgorithm = hash_algorithm
+    self._pdf_extract_processes: int = pdf_extract_processes
+    self._pdf_compress_pages: bool = pdf_compress_pages
+    self._fair_scopes: bool = fair_scopes
+    self._watcher: Watcher | None = None
+    self._did_watched_changes: bool = False
+    self._did_watched_overflow: bool = False
     self._progress_events: ProgressEvents = ProgressEvents()
     self._signal_handler = SignalHandler()
-    self._service: Service | None = Service(
-      workspace_path=self._workspace_path,
-      embedding_model_id=self._embedding_model,
-    )
+    self._service: Service | None = self._create_service()
 
   @property
   def ref(self) -> Service:
@@ -54,30 +69,54 @@ class ServiceRef:
     finally:
       print("SSE closed")
 
-  def start_scanning(self):
+  # full_scan is False means only handling changes recorded by watcher,
+  # and the service keeps serving queries meanwhile.
+  def start_scanning(self, full_scan: bool = True):
+    replaced_service: Service | None = None
     with self._lock:
       if self._is_scanning:
+        if not full_scan:
+          self._did_watched_changes = True
         return
       self._is_scanning = True
-      self._service = None
+      if full_scan:
+        self._did_watched_overflow = False
+        replaced_service = self._service
+        self._service = None
       self._scan_job_event = Event()
 
+    # full scan creates a new service, processes of the old one must not be left
+    if replaced_service is not None:
+      replaced_service.close()
+
     try:
-      Thread(target=self._scan).start()
+      Thread(target=lambda: self._scan(full_scan)).start()
 
     except Exception as e:
       with self._lock:
         self._is_scanning = False
       raise e
 
-  def _scan(self):
+  def _scan(self, full_scan: bool):
     self._progress_events.notify_scanning()
-    service = Service(
-      workspace_path=self._workspace_path,
-      embedding_model_id=self._embedding_model,
-    )
+    sources = {
+      name: path
+      for name, path in self._sources.items()
+    }
+    service: Service | None = None
+    if not full_scan:
+      with self._lock:
+        service = self._service
+
+    created_service = service is None
+    if service is None:
+      service = self._create_service()
+      if full_scan:
+        self._restart_watcher(service, sources)
+
     scan_job = service.scan_job(
       progress_event_listener=self._progress_events.receive_event,
+      fair_scopes=self._fair_scopes,
     )
     with self._lock:
       self._scan_job = scan_job
@@ -88,16 +127,23 @@ class ServiceRef:
     success_bind = self._signal_handler.bind_scan_job(scan_job)
     if not success_bind:
       self._progress_events.set_interrupted()
+      with self._lock:
+        self._is_scanning = False
+        self._scan_job = None
       return
 
+    did_watched_changes = False
+    did_watched_overflow = False
     try:
       try:
-        completed = scan_job.start({
-          name: path
-          for name, path in self._sources.items()
-        })
+        if full_scan:
+          completed = scan_job.start(sources)
+        else:
+          completed = scan_job.start_with_recorded_events()
       except Exception as e:
         self._progress_events.fail(str(e))
+        if created_service:
+          service.close()
         raise e
 
       with self._lock:
@@ -113,6 +159,50 @@ class ServiceRef:
       with self._lock:
         self._is_scanning = False
         self._scan_job = None
+        did_watched_changes = self._did_watched_changes
+        did_watched_overflow = self._did_watched_overflow
+        self._did_watched_changes = False
+        self._did_watched_overflow = False
+
+    if did_watched_overflow:
+      self.start_scanning(full_scan=True)
+    elif did_watched_changes:
+      self.start_scanning(full_scan=False)
+
+  # watcher lost events, only a full scan job can find them.
+  # the flag is cleared when a full scan starts, or it starts one after current job.
+  def _on_watched_overflow(self):
+    with self._lock:
+      self._did_watched_overflow = True
+    self.start_scanning(full_scan=True)
+
+  def _create_service(self) -> Service:
+    return Service(
+      workspace_path=self._workspace_path,
+      embedding_model_id=self._embedding_model,
+      default_scan_filter=self._default_scan_filter,
+      scan_filters=self._scan_filters,
+      hash_algorithm=self._hash_algorithm,
+      pdf_extract_processes=self._pdf_extract_processes,
+      pdf_compress_pages=self._pdf_compress_pages,
+    )
+
+  def _restart_watcher(self, service: Service, sources: dict[str, str]):
+    if not self._watch_config.get("enabled", False) or not is_watching_supported():
+      return
+    if self._watcher is not None:
+      self._watcher.stop()
+      self._watcher = None
+
+    self._watcher = service.watcher(
+      sources=sources,
+      on_changed=lambda _: self.start_scanning(full_scan=False),
+      debounce=float(self._watch_config.get("debounce", 0.5)),
+      max_delay=float(self._watch_config.get("max_delay", 5.0)),
+      on_overflowed=self._on_watched_overflow,
+      progress_event_listener=self._progress_events.receive_event,
+    )
+    self._watcher.start()
 
   def _take_scan_job(self) -> ServiceScanJob | None:
     event: Event
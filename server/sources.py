@@ -1,59 +1,34 @@
-import os
-import sqlite3
-
 from typing import Generator
+from sqlite3 import Cursor
+from sqlite3_pool import register_table_creators, SQLite3Pool
 
 
 class Sources:
   def __init__(self, db_path: str) -> None:
-    self._db_path: str = db_path
-    is_first_time = not os.path.exists(db_path)
-    if is_first_time:
-      conn = sqlite3.connect(db_path)
-      cursor = conn.cursor()
-      try:
-        cursor.execute("""
-          CREATE TABLE sources (
-            name TEXT PRIMARY KEY,
-            path TEXT not NULL
-          )
-        """)
-        conn.commit()
-
-      finally:
-        cursor.close()
-        conn.close()
+    db = SQLite3Pool(
+      format_name="sources",
+      path=db_path,
+    )
+    self._db: SQLite3Pool = db.assert_format("sources")
 
   def path(self, name: str) -> str:
-    conn = sqlite3.connect(self._db_path)
-    cursor = conn.cursor()
-    try:
+    with self._db.connect() as (cursor, _):
       cursor.execute("SELECT path FROM sources WHERE name = ?", (name,))
       row = cursor.fetchone()
       assert row is not None, f"Source {name} not found"
       return row[0]
 
-    finally:
-      cursor.close()
-      conn.close()
-
   def items(self) -> Generator[tuple[str, str], None, None]:
-    conn = sqlite3.connect(self._db_path)
-    cursor = conn.cursor()
-    try:
+    with self._db.connect() as (cursor, _):
       cursor.execute("SELECT name, path FROM sources")
-      for row in cursor.fetchall():
-        name, path = row
-        yield name, path
+      rows = cursor.fetchall()
 
-    finally:
-      cursor.close()
-      conn.close()
+    for row in rows:
+      name, path = row
+      yield name, path
 
   def put(self, name: str, path: str) -> None:
-    conn = sqlite3.connect(self._db_path)
-    cursor = conn.cursor()
-    try:
+    with self._db.connect() as (cursor, conn):
       cursor.execute("SELECT path FROM sources WHERE name = ?", (name,))
       row = cursor.fetchone()
       if row is not None:
@@ -62,17 +37,17 @@ class Sources:
         cursor.execute("INSERT INTO sources (name, path) VALUES (?, ?)", (name, path))
       conn.commit()
 
-    finally:
-      cursor.close()
-      conn.close()
-
   def remove(self, name: str) -> None:
-    conn = sqlite3.connect(self._db_path)
-    cursor = conn.cursor()
-    try:
+    with self._db.connect() as (cursor, conn):
       cursor.execute("DELETE FROM sources WHERE name = ?", (name,))
       conn.commit()
 
-    finally:
-      cursor.close()
-      conn.close()
\ No newline at end of file
+def _create_tables(cursor: Cursor):
+  cursor.execute("""
+    CREATE TABLE sources (
+      name TEXT PRIMARY KEY,
+      path TEXT not NULL
+    )
+  """)
+
+register_table_creators("sources", _create_tables)
@@ -1,3 +1,7 @@
 from .pool import SQLite3Pool, SQLite3ConnectionSession
-from .format import register_table_creators
-from .session import build_thread_pool, release_thread_pool
\ No newline at end of file
+from .batch import SQLite3BatchSession
+from .format import register_table_creators, register_migration, set_connection_profile, set_default_connection_profile, release_shared_pools
+from .profile import ConnectionProfile
+from .shared_pool import PoolMetrics
+from .statistics import StatementStatistics, enable_statement_statistics, disable_statement_statistics, statement_statistics
+from .session import build_thread_pool, release_thread_pool
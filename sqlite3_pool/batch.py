@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import time
+import sqlite3
+
+from typing import Optional, Callable
+from .session import SQLite3ConnectionSession
+
+# gathers many small write units into one transaction (group commit).
+# every unit is wrapped in a savepoint, so a unit which raised is rolled back alone
+# and units written before it are still committed by next flush.
+# units which have not been flushed are lost when process crashed, but they are lost
+# as a whole, so that the database stays consistent as the unit-per-transaction way.
+class SQLite3BatchSession:
+  def __init__(
+    self,
+    session: SQLite3ConnectionSession,
+    max_writes: int,
+    max_seconds: float,
+    on_close: Callable[[], None],
+  ):
+    self._session: SQLite3ConnectionSession = session
+    self._max_writes: int = max_writes
+    self._max_seconds: float = max_seconds
+    self._on_close: Callable[[], None] = on_close
+    self._writes: int = 0
+    self._first_write_at: Optional[float] = None
+    self._in_unit: bool = False
+    self._is_closed: bool = False
+
+  @property
+  def conn(self) -> sqlite3.Connection:
+    return self._session.conn
+
+  # reading with it can see writes which have not been flushed
+  @property
+  def cursor(self) -> sqlite3.Cursor:
+    return self._session.cursor
+
+  def write(self) -> BatchWrite:
+    return BatchWrite(self)
+
+  def read(self) -> BatchRead:
+    return BatchRead(self)
+
+  # write lock is held from first unflushed unit until flush. it must be called before long work
+  # which never touches database, or other writers wait for the whole work and time out.
+  def flush_if_due(self):
+    if self._writes >= self._max_writes or (
+      self._first_write_at is not None and \
+      time.monotonic() - self._first_write_at >= self._max_seconds
+    ):
+      self.flush()
+
+  def flush(self):
+    conn = self._session.conn
+    if conn.in_transaction:
+      conn.commit()
+    self._writes = 0
+    self._first_write_at = None
+
+  def close(self):
+    if self._is_closed:
+      return
+    self._is_closed = True
+    try:
+      self.flush()
+    finally:
+      self._session.close()
+      self._on_close()
+
+  def __enter__(self) -> SQLite3BatchSession:
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def _begin_unit(self) -> sqlite3.Cursor:
+    if self._in_unit:
+      raise RuntimeError("Cannot write in batch recursively")
+    if self._is_closed:
+      raise RuntimeError("Batch session has been closed")
+
+    cursor = self._session.cursor
+    if not self._session.conn.in_transaction:
+      # take write lock at first, or a deferred transaction which has read may fail
+      # with SQLITE_BUSY at once when another connection committed meanwhile.
+      cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+      self._first_write_at = time.monotonic()
+    cursor.execute("SAVEPOINT batch_unit")
+    self._in_unit = True
+    return cursor
+
+  def _end_unit(self, success: bool):
+    cursor = self._session.cursor
+    self._in_unit = False
+
+    if not success:
+      cursor.execute("ROLLBACK TO SAVEPOINT batch_unit")
+      cursor.execute("RELEASE SAVEPOINT batch_unit")
+      return
+
+    cursor.execute("RELEASE SAVEPOINT batch_unit")
+    self._writes += 1
+    self.flush_if_due()
+
+class BatchWrite:
+  def __init__(self, batch: SQLite3BatchSession):
+    self._batch: SQLite3BatchSession = batch
+
+  def __enter__(self) -> sqlite3.Cursor:
+    return self._batch._begin_unit()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._batch._end_unit(exc_type is None)
+
+class BatchRead:
+  def __init__(self, batch: SQLite3BatchSession):
+    self._batch: SQLite3BatchSession = batch
+
+  # it reads in transaction of batch if there is one, or it never begins a transaction
+  def __enter__(self) -> sqlite3.Cursor:
+    return self._batch.cursor
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    pass
+
+# unit of SQLite3Pool.read() when current thread has no batch session of the pool
+class StandaloneRead:
+  def __init__(self, session: SQLite3ConnectionSession):
+    self._session: SQLite3ConnectionSession = session
+
+  def __enter__(self) -> sqlite3.Cursor:
+    return self._session.cursor
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._session.close()
+
+# unit of SQLite3Pool.write() when current thread has no batch session of the pool
+class StandaloneWrite:
+  def __init__(self, session: SQLite3ConnectionSession):
+    self._session: SQLite3ConnectionSession = session
+
+  def __enter__(self) -> sqlite3.Cursor:
+    cursor = self._session.cursor
+    cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+    return cursor
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    try:
+      if exc_type is None:
+        self._session.conn.commit()
+      else:
+        self._session.conn.rollback()
+    finally:
+      self._session.close()
@@ -3,29 +3,76 @@ from __future__ import annotations
 import os
 import sqlite3
 
+from pathlib import Path
 from threading import Lock
-from typing import Optional, Callable
+from typing import cast, Optional, Callable
+from .profile import ConnectionProfile
+from .shared_pool import SharedPool
+from .statistics import InstrumentedConnection
 
 _FORMATS_LOCK: Lock = Lock()
 _FORMATS: dict[str, _SQLite3Format] = {}
+_DEFAULT_PROFILE: ConnectionProfile = ConnectionProfile()
 
 def register_table_creators(format_name: str, create_table: Callable[[sqlite3.Cursor], None]) -> None:
   get_format(format_name).register(create_table)
 
+# migrations run in ascending version order on every database whose user_version is lower,
+# including databases which have just been created by table creators.
+def register_migration(format_name: str, version: int, migrate: Callable[[sqlite3.Cursor], None]) -> None:
+  get_format(format_name).register_migration(version, migrate)
+
+# formats without their own profile use the default one
+def set_default_connection_profile(profile: ConnectionProfile) -> None:
+  global _FORMATS_LOCK, _DEFAULT_PROFILE
+  with _FORMATS_LOCK:
+    _DEFAULT_PROFILE = profile
+
+# takes effect on connections created after it is called
+def set_connection_profile(format_name: str, profile: Optional[ConnectionProfile]) -> None:
+  get_format(format_name).profile = profile
+
+# close idle connections of all databases, connections in use are kept
+def release_shared_pools() -> None:
+  global _FORMATS_LOCK, _FORMATS
+  with _FORMATS_LOCK:
+    formats = list(_FORMATS.values())
+  for format in formats:
+    format.release_shared_pools()
+
 def get_format(format_name: str) -> _SQLite3Format:
   global _FORMATS_LOCK, _FORMATS
   with _FORMATS_LOCK:
     pool: Optional[_SQLite3Format] = _FORMATS.get(format_name, None)
     if pool is None:
-      pool = _SQLite3Format()
+      pool = _SQLite3Format(format_name)
       _FORMATS[format_name] = pool
   return pool
 
 class _SQLite3Format:
-  def __init__(self) -> None:
+  def __init__(self, name: str) -> None:
+    self._name: str = name
     self._lock: Lock = Lock()
     self._table_creators: list[Callable[[sqlite3.Cursor], None]] = []
+    self._migrations: dict[int, Callable[[sqlite3.Cursor], None]] = {}
     self._lock_table_creators: bool = False
+    self._profile: Optional[ConnectionProfile] = None
+    self._shared_pools: dict[tuple[str, bool], SharedPool] = {}
+
+  @property
+  def profile(self) -> ConnectionProfile:
+    global _FORMATS_LOCK, _DEFAULT_PROFILE
+    with self._lock:
+      profile = self._profile
+    if profile is None:
+      with _FORMATS_LOCK:
+        profile = _DEFAULT_PROFILE
+    return profile
+
+  @profile.setter
+  def profile(self, profile: Optional[ConnectionProfile]) -> None:
+    with self._lock:
+      self._profile = profile
 
   def register(self, create_table: Callable[[sqlite3.Cursor], None]) -> None:
     with self._lock:
@@ -33,6 +80,16 @@ class _SQLite3Format:
         raise Exception("Cannot register table creator after created any pools")
       self._table_creators.append(create_table)
 
+  def register_migration(self, version: int, migrate: Callable[[sqlite3.Cursor], None]) -> None:
+    with self._lock:
+      if self._lock_table_creators:
+        raise Exception("Cannot register migration after created any pools")
+      if version <= 0:
+        raise ValueError(f"Migration version must be positive, but got {version}")
+      if version in self._migrations:
+        raise ValueError(f"Migration version {version} has been registered")
+      self._migrations[version] = migrate
+
   def create_tables(self, path: str):
     with self._lock:
       self._lock_table_creators = True
@@ -46,3 +103,83 @@ class _SQLite3Format:
           finally:
             cursor.close()
         conn.commit()
+
+    self._migrate(path)
+
+  def shared_pool(self, path: str, readonly: bool) -> SharedPool:
+    path = os.path.abspath(path)
+    key = (path, readonly)
+    with self._lock:
+      shared_pool = self._shared_pools.get(key, None)
+      if shared_pool is None:
+        shared_pool = SharedPool(
+          path=path,
+          profile=lambda: self.profile,
+          connect=self.connect_readonly if readonly else self.connect,
+        )
+        self._shared_pools[key] = shared_pool
+    return shared_pool
+
+  def release_shared_pools(self):
+    with self._lock:
+      shared_pools = list(self._shared_pools.values())
+    for shared_pool in shared_pools:
+      shared_pool.release()
+
+  def connect(self, path: str) -> sqlite3.Connection:
+    # connections are shared by threads, but only one thread uses it at the same time
+    conn = cast(InstrumentedConnection, sqlite3.connect(
+      path,
+      check_same_thread=False,
+      factory=InstrumentedConnection,
+    ))
+    conn.format_name = self._name
+    try:
+      self.profile.apply(conn)
+    except Exception as e:
+      conn.close()
+      raise e
+    return conn
+
+  # read paths can never take a write lock by accident with these connections
+  def connect_readonly(self, path: str) -> sqlite3.Connection:
+    uri = f"{Path(path).as_uri()}?mode=ro"
+    conn = cast(InstrumentedConnection, sqlite3.connect(
+      uri,
+      uri=True,
+      check_same_thread=False,
+      factory=InstrumentedConnection,
+    ))
+    conn.format_name = self._name
+    try:
+      self.profile.apply(conn)
+      conn.execute("PRAGMA query_only = ON")
+    except Exception as e:
+      conn.close()
+      raise e
+    return conn
+
+  def _migrate(self, path: str):
+    conn = self.connect(path)
+    cursor = conn.cursor()
+    try:
+      # journal mode is persistent in database file, so it only needs to be set once
+      self.profile.apply_journal_mode(conn)
+      cursor.execute("PRAGMA user_version")
+      current_version: int = cursor.fetchone()[0]
+
+      for version in sorted(self._migrations.keys()):
+        if version <= current_version:
+          continue
+        try:
+          cursor.execute("BEGIN TRANSACTION")
+          self._migrations[version](cursor)
+          # PRAGMA cannot be bound with parameters, version is checked as int when registered
+          cursor.execute(f"PRAGMA user_version = {int(version)}")
+          conn.commit()
+        except Exception as e:
+          conn.rollback()
+          raise e
+    finally:
+      cursor.close()
+      conn.close()
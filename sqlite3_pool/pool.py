@@ -2,8 +2,10 @@ from __future__ import annotations
 import sqlite3
 import threading
 
-from typing import Optional
+from typing import Union, Optional
 from .format import get_format
+from .batch import SQLite3BatchSession, BatchRead, BatchWrite, StandaloneRead, StandaloneWrite
+from .shared_pool import SharedPool, PoolMetrics
 from .session import get_thread_pool, SQLite3ConnectionSession
 
 
@@ -16,41 +18,92 @@ class SQLite3Pool:
       get_format(format_name).create_tables(path)
     self._format_name: str = format_name
     self._path: str = path
+    self._shared_pool: SharedPool = get_format(format_name).shared_pool(path, readonly=False)
+    self._readonly_shared_pool: SharedPool = get_format(format_name).shared_pool(path, readonly=True)
+    self._shared_pool.prewarm()
+    self._readonly_shared_pool.prewarm()
+    self._batches: threading.local = threading.local()
 
   def assert_format(self, format_name) -> SQLite3Pool:
     if format_name != self._format_name:
       raise ValueError(f"Expected format name {self._format_name}, but got {format_name}")
     return self
 
-  def connect(self) -> SQLite3ConnectionSession:
+  # readonly connections are kept in another pool, they are opened with mode=ro and query_only.
+  # reading with them never waits for a long write transaction in WAL mode.
+  def connect(self, readonly: bool = False) -> SQLite3ConnectionSession:
+    shared_pool = self._readonly_shared_pool if readonly else self._shared_pool
     pool = get_thread_pool()
     conn: Optional[sqlite3.Connection] = None
 
     if pool is not None:
-      conn = pool.get(self._format_name)
+      conn = pool.get(shared_pool)
 
     if conn is None:
-      conn = sqlite3.connect(self._path)
+      conn = shared_pool.get()
 
     return SQLite3ConnectionSession(
       conn,
-      self._send_back,
+      lambda conn: self._send_back(shared_pool, conn),
     )
 
-  def _send_back(self, conn: sqlite3.Connection) -> None:
+  # until the batch session closed, write() of current thread joins it instead of committing alone.
+  # it commits after max_writes units or max_seconds since the first unflushed one.
+  def batch(self, max_writes: int = 256, max_seconds: float = 1.0) -> SQLite3BatchSession:
+    if self._current_batch() is not None:
+      raise RuntimeError("Current thread has opened a batch session of this database")
+
+    batch = SQLite3BatchSession(
+      session=self.connect(),
+      max_writes=max_writes,
+      max_seconds=max_seconds,
+      on_close=lambda: setattr(self._batches, "value", None),
+    )
+    setattr(self._batches, "value", batch)
+    return batch
+
+  # with db.write() as cursor: ... commits (or joins batch of current thread) when exit
+  def write(self) -> Union[BatchWrite, StandaloneWrite]:
+    batch = self._current_batch()
+    if batch is not None:
+      return batch.write()
+    else:
+      return StandaloneWrite(self.connect())
+
+  # with db.read() as cursor: ... reads without write lock. it reads with the batch of current thread
+  # if there is one, so that writes which have not been flushed can be seen.
+  def read(self) -> Union[BatchRead, StandaloneRead]:
+    batch = self._current_batch()
+    if batch is not None:
+      return batch.read()
+    else:
+      return StandaloneRead(self.connect(readonly=True))
+
+  def _current_batch(self) -> Optional[SQLite3BatchSession]:
+    return getattr(self._batches, "value", None)
+
+  def _send_back(self, shared_pool: SharedPool, conn: sqlite3.Connection) -> None:
     pool = get_thread_pool()
     if pool is not None:
-      pool.send_back(self._format_name, conn)
+      pool.send_back(shared_pool, conn)
     else:
-      conn.close()
+      shared_pool.send_back(conn)
 
   @property
   def path(self) -> str:
     return self._path
 
+  @property
+  def metrics(self) -> PoolMetrics:
+    return self._shared_pool.metrics
+
+  @property
+  def readonly_metrics(self) -> PoolMetrics:
+    return self._readonly_shared_pool.metrics
+
   @property
   def table_names(self) -> list[str]:
-    with self.connect() as (cursor, conn):
+    with self.connect(readonly=True) as (cursor, _):
       table_names: list[str] = []
       cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
       tables = cursor.fetchall()
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import sqlite3
+
+from dataclasses import dataclass, fields
+
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+_TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+@dataclass
+class ConnectionProfile:
+  journal_mode: str = "WAL"
+  synchronous: str = "NORMAL"
+  mmap_size: int = 64 * 1024 * 1024 # bytes
+  cache_size: int = -16 * 1024 # negative value means KiB, positive value means pages
+  temp_store: str = "MEMORY"
+  busy_timeout: int = 5000 # milliseconds
+  pool_size: int = 16 # max connections opened by one database at the same time, readonly ones are counted apart
+  prewarm_size: int = 1 # connections opened when pool created, they are never closed by idle_timeout
+  idle_timeout: float = 60.0 # seconds
+  checkout_timeout: float = 30.0 # seconds
+
+  # PRAGMA cannot be bound with parameters, so values must be checked before formatted into SQL
+  def __post_init__(self):
+    self.journal_mode = _check_choice("journal_mode", self.journal_mode, _JOURNAL_MODES)
+    self.synchronous = _check_choice("synchronous", self.synchronous, _SYNCHRONOUS)
+    self.temp_store = _check_choice("temp_store", self.temp_store, _TEMP_STORES)
+    self.mmap_size = int(self.mmap_size)
+    self.cache_size = int(self.cache_size)
+    self.busy_timeout = int(self.busy_timeout)
+    self.pool_size = int(self.pool_size)
+    self.prewarm_size = int(self.prewarm_size)
+    self.idle_timeout = float(self.idle_timeout)
+    self.checkout_timeout = float(self.checkout_timeout)
+    if self.pool_size <= 0:
+      raise ValueError(f"Invalid sqlite3 pool_size: {self.pool_size}, expected positive")
+
+  @classmethod
+  def from_config(cls, config: dict, base: ConnectionProfile | None = None) -> ConnectionProfile:
+    names = set(field.name for field in fields(cls))
+    values: dict = {}
+    if base is not None:
+      values.update(base.__dict__)
+
+    for name, value in config.items():
+      if name not in names:
+        raise ValueError(f"Unknown sqlite3 connection option: {name}")
+      values[name] = value
+
+    return cls(**values)
+
+  def apply_journal_mode(self, conn: sqlite3.Connection):
+    conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+
+  def apply(self, conn: sqlite3.Connection):
+    conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+    conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+    conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+    conn.execute(f"PRAGMA cache_size = {self.cache_size}")
+    conn.execute(f"PRAGMA temp_store = {self.temp_store}")
+
+def _check_choice(name: str, value: str, choices: tuple[str, ...]) -> str:
+  value = str(value).upper()
+  if value not in choices:
+    raise ValueError(f"Invalid sqlite3 {name}: {value}, expected one of {', '.join(choices)}")
+  return value
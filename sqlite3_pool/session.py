@@ -3,6 +3,7 @@ import sqlite3
 import threading
 
 from typing import Callable, Optional
+from .shared_pool import SharedPool
 
 
 _THREAD_POOL = threading.local()
@@ -55,33 +56,35 @@ class SQLite3ConnectionSession:
   def __exit__(self, exc_type, exc_value, traceback):
     self.close()
 
+# keeps connections checked out from shared pools for current thread,
+# so that the thread can reuse them without any lock.
 class _ThreadPool():
   def __init__(self):
-    self._stacks: dict[str, list[sqlite3.Connection]] = {}
+    self._stacks: dict[SharedPool, list[sqlite3.Connection]] = {}
 
-  def get(self, format_name: str) -> Optional[sqlite3.Connection]:
-    stack = self._stack(format_name)
+  def get(self, shared_pool: SharedPool) -> Optional[sqlite3.Connection]:
+    stack = self._stack(shared_pool)
     if len(stack) == 0:
       return None
     return stack.pop()
 
-  def send_back(self, format_name: str, conn: sqlite3.Connection):
+  def send_back(self, shared_pool: SharedPool, conn: sqlite3.Connection):
     global _MAX_STACK_SIZE
-    stack = self._stack(format_name)
+    stack = self._stack(shared_pool)
     if len(stack) >= _MAX_STACK_SIZE:
-      conn.close()
+      shared_pool.send_back(conn)
     else:
       stack.append(conn)
 
   def release(self):
-    for stack in self._stacks.values():
+    for shared_pool, stack in self._stacks.items():
       for conn in stack:
-        conn.close()
+        shared_pool.send_back(conn)
     self._stacks.clear()
 
-  def _stack(self, format_name: str) -> list[sqlite3.Connection]:
-    stack = self._stacks.get(format_name, None)
+  def _stack(self, shared_pool: SharedPool) -> list[sqlite3.Connection]:
+    stack = self._stacks.get(shared_pool, None)
     if stack is None:
       stack = []
-      self._stacks[format_name] = stack
+      self._stacks[shared_pool] = stack
     return stack
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import time
+import sqlite3
+import threading
+
+from dataclasses import dataclass
+from typing import Callable
+from .profile import ConnectionProfile
+
+@dataclass
+class PoolMetrics:
+  size: int
+  idle: int
+  in_use: int
+  created: int
+  closed: int
+  checkouts: int
+  waits: int
+  wait_seconds: float
+  max_wait_seconds: float
+
+# process-wide connections of one database, shared by all threads.
+# a connection is only used by the thread which checked it out until it is sent back.
+class SharedPool:
+  def __init__(
+    self,
+    path: str,
+    profile: Callable[[], ConnectionProfile],
+    connect: Callable[[str], sqlite3.Connection],
+  ) -> None:
+    self._path: str = path
+    self._profile: Callable[[], ConnectionProfile] = profile
+    self._connect: Callable[[str], sqlite3.Connection] = connect
+    self._condition: threading.Condition = threading.Condition()
+    self._idle: list[tuple[sqlite3.Connection, float]] = [] # (conn, idle since)
+    self._size: int = 0 # idle + in use + being created
+    self._in_use: int = 0
+    self._created: int = 0
+    self._closed: int = 0
+    self._checkouts: int = 0
+    self._waits: int = 0
+    self._wait_seconds: float = 0.0
+    self._max_wait_seconds: float = 0.0
+
+  @property
+  def metrics(self) -> PoolMetrics:
+    with self._condition:
+      return PoolMetrics(
+        size=self._size,
+        idle=len(self._idle),
+        in_use=self._in_use,
+        created=self._created,
+        closed=self._closed,
+        checkouts=self._checkouts,
+        waits=self._waits,
+        wait_seconds=self._wait_seconds,
+        max_wait_seconds=self._max_wait_seconds,
+      )
+
+  def prewarm(self):
+    profile = self._profile()
+    prewarm_size = min(profile.prewarm_size, profile.pool_size)
+    while True:
+      with self._condition:
+        if self._size >= prewarm_size:
+          break
+        self._size += 1
+      conn = self._create()
+      with self._condition:
+        self._idle.append((conn, time.monotonic()))
+        self._condition.notify()
+
+  def get(self) -> sqlite3.Connection:
+    profile = self._profile()
+    begin_at = time.monotonic()
+    waited = False
+
+    with self._condition:
+      while True:
+        now = time.monotonic()
+        self._close_expired_idle(profile, now)
+        if len(self._idle) > 0:
+          conn, _ = self._idle.pop()
+          self._checkout(begin_at, now, waited)
+          return conn
+
+        if self._size < profile.pool_size:
+          self._size += 1
+          break
+
+        remain_seconds = profile.checkout_timeout - (now - begin_at)
+        if remain_seconds <= 0.0:
+          raise TimeoutError(f"Timeout to check out sqlite3 connection of {self._path}")
+        waited = True
+        self._condition.wait(remain_seconds)
+
+    conn = self._create()
+    with self._condition:
+      self._checkout(begin_at, time.monotonic(), waited)
+    return conn
+
+  def send_back(self, conn: sqlite3.Connection):
+    profile = self._profile()
+    with self._condition:
+      self._in_use -= 1
+      if self._size > profile.pool_size:
+        self._size -= 1
+        self._closed += 1
+        conn.close()
+      else:
+        self._idle.append((conn, time.monotonic()))
+      self._condition.notify()
+
+  def release(self):
+    with self._condition:
+      for conn, _ in self._idle:
+        conn.close()
+      self._size -= len(self._idle)
+      self._closed += len(self._idle)
+      self._idle.clear()
+      self._condition.notify_all()
+
+  def _create(self) -> sqlite3.Connection:
+    try:
+      conn = self._connect(self._path)
+    except Exception as e:
+      with self._condition:
+        self._size -= 1
+        self._condition.notify()
+      raise e
+    with self._condition:
+      self._created += 1
+    return conn
+
+  def _checkout(self, begin_at: float, now: float, waited: bool):
+    self._in_use += 1
+    self._checkouts += 1
+    if waited:
+      wait_seconds = now - begin_at
+      self._waits += 1
+      self._wait_seconds += wait_seconds
+      self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+
+  # idle list is ordered by idle since, the oldest one is at the head
+  def _close_expired_idle(self, profile: ConnectionProfile, now: float):
+    expired_count = 0
+    keep_size = len(self._idle) - max(profile.prewarm_size, 0)
+    for _, idle_since in self._idle[:max(keep_size, 0)]:
+      if now - idle_since < profile.idle_timeout:
+        break
+      expired_count += 1
+
+    for conn, _ in self._idle[:expired_count]:
+      conn.close()
+
+    del self._idle[:expired_count]
+    self._size -= expired_count
+    self._closed += expired_count
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import re
+import time
+import sqlite3
+import threading
+
+from datetime import datetime
+from collections import deque, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+_SAMPLES_SIZE = 1024
+_NORMALIZED_SQL_CACHE_SIZE = 1024
+_RECORDER_LOCK = threading.Lock()
+_RECORDER: Optional[_Recorder] = None
+
+@dataclass
+class StatementStatistics:
+  format: str
+  sql: str
+  count: int
+  total_seconds: float
+  mean_seconds: float
+  p99_seconds: float
+  max_seconds: float
+
+# opt-in, statements are not timed until it's called.
+# statements slower than slow_threshold (seconds) are appended to slow_log_path if given.
+def enable_statement_statistics(slow_threshold: float = 0.1, slow_log_path: Optional[str] = None) -> None:
+  global _RECORDER_LOCK, _RECORDER
+  with _RECORDER_LOCK:
+    _RECORDER = _Recorder(slow_threshold, slow_log_path)
+
+def disable_statement_statistics() -> None:
+  global _RECORDER_LOCK, _RECORDER
+  with _RECORDER_LOCK:
+    _RECORDER = None
+
+# sorted by total time, the most expensive statement is the first one
+def statement_statistics() -> list[StatementStatistics]:
+  recorder = _RECORDER
+  if recorder is None:
+    return []
+  return recorder.snapshot()
+
+class InstrumentedConnection(sqlite3.Connection):
+  format_name: str = ""
+
+  def cursor(self, factory=None): # type: ignore
+    if factory is None:
+      factory = InstrumentedCursor
+    return super().cursor(factory)
+
+  # methods of connection run statements in C without calling execute() of its cursor
+  def execute(self, sql: str, parameters=(), /): # type: ignore
+    return self.cursor().execute(sql, parameters)
+
+  def executemany(self, sql: str, seq_of_parameters, /): # type: ignore
+    return self.cursor().executemany(sql, seq_of_parameters)
+
+  def executescript(self, sql_script: str, /): # type: ignore
+    return self.cursor().executescript(sql_script)
+
+  def commit(self):
+    recorder = _RECORDER
+    if recorder is None:
+      return super().commit()
+    begin_at = time.perf_counter()
+    try:
+      return super().commit()
+    finally:
+      recorder.record(self.format_name, "COMMIT", time.perf_counter() - begin_at)
+
+  def rollback(self):
+    recorder = _RECORDER
+    if recorder is None:
+      return super().rollback()
+    begin_at = time.perf_counter()
+    try:
+      return super().rollback()
+    finally:
+      recorder.record(self.format_name, "ROLLBACK", time.perf_counter() - begin_at)
+
+class InstrumentedCursor(sqlite3.Cursor):
+  def execute(self, sql: str, parameters=(), /): # type: ignore
+    recorder = _RECORDER
+    if recorder is None:
+      return super().execute(sql, parameters)
+    begin_at = time.perf_counter()
+    try:
+      return super().execute(sql, parameters)
+    finally:
+      recorder.record(self._format_name(), sql, time.perf_counter() - begin_at)
+
+  def executemany(self, sql: str, seq_of_parameters, /): # type: ignore
+    recorder = _RECORDER
+    if recorder is None:
+      return super().executemany(sql, seq_of_parameters)
+    begin_at = time.perf_counter()
+    try:
+      return super().executemany(sql, seq_of_parameters)
+    finally:
+      recorder.record(self._format_name(), sql, time.perf_counter() - begin_at)
+
+  def executescript(self, sql_script: str, /): # type: ignore
+    recorder = _RECORDER
+    if recorder is None:
+      return super().executescript(sql_script)
+    begin_at = time.perf_counter()
+    try:
+      return super().executescript(sql_script)
+    finally:
+      recorder.record(self._format_name(), sql_script, time.perf_counter() - begin_at)
+
+  def _format_name(self) -> str:
+    return getattr(self.connection, "format_name", "")
+
+class _StatementRecord:
+  def __init__(self):
+    self.count: int = 0
+    self.total_seconds: float = 0.0
+    self.max_seconds: float = 0.0
+    self.samples: deque[float] = deque(maxlen=_SAMPLES_SIZE)
+
+class _Recorder:
+  def __init__(self, slow_threshold: float, slow_log_path: Optional[str]):
+    self._lock: threading.Lock = threading.Lock()
+    self._slow_threshold: float = slow_threshold
+    self._slow_log_path: Optional[str] = slow_log_path
+    self._records: dict[tuple[str, str], _StatementRecord] = {}
+    # SQL built with literals may be different every time, so it's a LRU cache
+    self._normalized_sql: OrderedDict[str, str] = OrderedDict()
+
+  def record(self, format_name: str, sql: str, seconds: float):
+    with self._lock:
+      normalized_sql = self._normalized_sql.get(sql, None)
+      if normalized_sql is None:
+        normalized_sql = _normalize_sql(sql)
+        self._normalized_sql[sql] = normalized_sql
+        if len(self._normalized_sql) > _NORMALIZED_SQL_CACHE_SIZE:
+          self._normalized_sql.popitem(last=False)
+      else:
+        self._normalized_sql.move_to_end(sql)
+
+      key = (format_name, normalized_sql)
+      record = self._records.get(key, None)
+      if record is None:
+        record = _StatementRecord()
+        self._records[key] = record
+
+      record.count += 1
+      record.total_seconds += seconds
+      record.max_seconds = max(record.max_seconds, seconds)
+      record.samples.append(seconds)
+
+    if seconds >= self._slow_threshold and self._slow_log_path is not None:
+      self._write_slow_log(format_name, normalized_sql, seconds)
+
+  def snapshot(self) -> list[StatementStatistics]:
+    statistics: list[StatementStatistics] = []
+    with self._lock:
+      for (format_name, sql), record in self._records.items():
+        samples = sorted(record.samples)
+        statistics.append(StatementStatistics(
+          format=format_name,
+          sql=sql,
+          count=record.count,
+          total_seconds=record.total_seconds,
+          mean_seconds=record.total_seconds / record.count,
+          p99_seconds=samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+          max_seconds=record.max_seconds,
+        ))
+    statistics.sort(key=lambda s: s.total_seconds, reverse=True)
+    return statistics
+
+  def _write_slow_log(self, format_name: str, sql: str, seconds: float):
+    line = f"{datetime.now().isoformat()}\t{format_name}\t{seconds * 1000.0:.3f}ms\t{sql}\n"
+    with self._lock:
+      with open(str(self._slow_log_path), "a", encoding="utf-8") as file:
+        file.write(line)
+
+_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+def _normalize_sql(sql: str) -> str:
+  sql = _STRING_PATTERN.sub("?", sql)
+  sql = _NUMBER_PATTERN.sub("?", sql)
+  sql = _SPACE_PATTERN.sub(" ", sql).strip()
+  sql = _IN_LIST_PATTERN.sub("(...)", sql)
+  return sql
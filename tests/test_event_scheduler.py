@@ -0,0 +1,35 @@
+import unittest
+
+from typing import Optional
+from index_package.service.scheduler import EventScheduler
+
+class TestEventScheduler(unittest.TestCase):
+
+  def test_cheapest_first(self):
+    scheduler = EventScheduler()
+    scheduler.add(1, "books", 300.0)
+    scheduler.add(2, "books", 0.0)
+    scheduler.add(3, "papers", 12.5)
+    scheduler.add(4, "papers", 0.0)
+    scheduler.close()
+    self.assertListEqual(self._pop_all(scheduler), [2, 4, 3, 1])
+
+  def test_fair_scopes(self):
+    scheduler = EventScheduler(fair_scopes=True)
+    scheduler.add(1, "books", 300.0)
+    scheduler.add(2, "books", 200.0)
+    scheduler.add(3, "books", 100.0)
+    scheduler.add(4, "papers", 5.0)
+    scheduler.add(5, "papers", 1.0)
+    scheduler.add(6, "notes", 0.0)
+    scheduler.close()
+    self.assertListEqual(self._pop_all(scheduler), [3, 5, 6, 2, 4, 1])
+
+  def _pop_all(self, scheduler: EventScheduler) -> list[int]:
+    event_ids: list[int] = []
+    while True:
+      event_id: Optional[int] = scheduler.pop()
+      if event_id is None:
+        break
+      event_ids.append(event_id)
+    return event_ids
@@ -0,0 +1,60 @@
+import os
+import base64
+import hashlib
+import unittest
+
+from index_package.utils import hash_file, hash_files, hash_bytes, hash_sha512, hash_algorithm_of, HashAlgorithm
+from index_package.utils.hash import _CHUNK_SIZE
+from tests.utils import get_temp_path
+
+class TestHash(unittest.TestCase):
+
+  def test_chunk_boundaries(self):
+    dir_path = get_temp_path("hash/chunks")
+    for size in (0, 1, _CHUNK_SIZE - 1, _CHUNK_SIZE, _CHUNK_SIZE + 1, 3 * _CHUNK_SIZE + 7):
+      file_path = os.path.join(dir_path, f"{size}.bin")
+      data = os.urandom(size)
+      with open(file_path, "wb") as file:
+        file.write(data)
+
+      self.assertEqual(hash_file(file_path), _hash_with_small_reads(file_path), f"size: {size}")
+      self.assertEqual(hash_sha512(file_path), hash_bytes(data), f"size: {size}")
+      self.assertEqual(
+        hash_file(file_path, HashAlgorithm.BLAKE2B),
+        hash_bytes(data, HashAlgorithm.BLAKE2B),
+        f"size: {size}",
+      )
+
+  def test_blake2b_prefix(self):
+    data = b"paper-rag"
+    digest = base64.urlsafe_b64encode(hashlib.blake2b(data).digest()).decode()
+    self.assertEqual(hash_bytes(data, HashAlgorithm.BLAKE2B), f"blake2b:{digest}")
+    self.assertFalse(hash_bytes(data).startswith("sha512:"))
+    self.assertNotEqual(hash_bytes(data), hash_bytes(data, HashAlgorithm.BLAKE2B))
+    self.assertEqual(hash_algorithm_of(hash_bytes(data)), HashAlgorithm.SHA512)
+    self.assertEqual(hash_algorithm_of(hash_bytes(data, HashAlgorithm.BLAKE2B)), HashAlgorithm.BLAKE2B)
+
+  def test_hash_files_in_order(self):
+    dir_path = get_temp_path("hash/files")
+    file_paths: list[str] = []
+    for i in range(20):
+      file_path = os.path.join(dir_path, f"{i}.bin")
+      with open(file_path, "wb") as file:
+        file.write(os.urandom(i * 1024))
+      file_paths.append(file_path)
+    file_paths.insert(3, os.path.join(dir_path, "missing.bin"))
+
+    hashes = list(hash_files(file_paths, HashAlgorithm.BLAKE2B))
+    self.assertIsNone(hashes[3])
+    self.assertListEqual(
+      [h for i, h in enumerate(hashes) if i != 3],
+      [hash_file(p, HashAlgorithm.BLAKE2B) for i, p in enumerate(file_paths) if i != 3],
+    )
+
+# ids recorded by old versions, which read files by 4 KiB
+def _hash_with_small_reads(file_path: str) -> str:
+  sha512_hash = hashlib.sha512()
+  with open(file_path, "rb") as file:
+    while chunk := file.read(4096):
+      sha512_hash.update(chunk)
+  return base64.urlsafe_b64encode(sha512_hash.digest()).decode()
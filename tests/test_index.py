@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 import os
+import shutil
+import sqlite3
+import threading
 import unittest
 
 from typing import Optional
+from unittest.mock import patch
 from index_package.parser import PdfParser
 from index_package.scanner import Scope, Event, EventKind, EventTarget
 from index_package.segmentation import Segment, Segmentation
 from index_package.index import Index, IndexNode, VectorDB, FTS5DB, IndexNodeMatching
 from index_package.index.index_db import IndexDB
+from index_package.service.trimmer import trim_nodes
+from index_package.utils import hash_file, HashAlgorithm
 from tests.utils import get_temp_path
 
 class TestIndex(unittest.TestCase):
@@ -158,7 +166,6 @@ class TestIndex(unittest.TestCase):
     segmentation = Segmentation()
     parser = PdfParser(
       cache_dir_path=get_temp_path("index_vector/parser_cache"),
-      temp_dir_path=get_temp_path("index_vector/temp"),
     )
     fts5_db = FTS5DB(
       db_path=os.path.abspath(os.path.join(
@@ -200,6 +207,225 @@ class TestIndex(unittest.TestCase):
       [(0, len("Identification"))],
     )
 
+class TestIndexFingerprints(unittest.TestCase):
+  def test_reuse_hash_of_unchanged_file(self):
+    index, vector_db, scope_path = self._create_index("fingerprint_unchanged")
+    self._copy_asset(scope_path, "a.pdf")
+
+    with patch("index_package.index.index.hash_file", wraps=hash_file) as hashing:
+      self._handle(index, EventKind.Added, "/a.pdf")
+      self._handle(index, EventKind.Updated, "/a.pdf")
+      self.assertEqual(hashing.call_count, 1)
+
+    os.utime(os.path.join(scope_path, "a.pdf"), ns=(0, 0))
+    with patch("index_package.index.index.hash_file", wraps=hash_file) as hashing:
+      self._handle(index, EventKind.Updated, "/a.pdf")
+      self.assertEqual(hashing.call_count, 1)
+    self.assertEqual(vector_db.saved_count(self._asset_hash), 1)
+
+  def test_revive_moved_file_removed_first(self):
+    index, vector_db, scope_path = self._create_index("fingerprint_removed_first")
+    self._copy_asset(scope_path, "a.pdf")
+    self._handle(index, EventKind.Added, "/a.pdf")
+    os.rename(os.path.join(scope_path, "a.pdf"), os.path.join(scope_path, "b.pdf"))
+
+    with patch("index_package.index.index.hash_file", wraps=hash_file) as hashing:
+      self._handle(index, EventKind.Removed, "/a.pdf")
+      self._handle(index, EventKind.Added, "/b.pdf")
+      self.assertEqual(hashing.call_count, 0)
+
+    index.purge_lost_files()
+    self.assertEqual(vector_db.saved_count(self._asset_hash), 1)
+    self.assertIn(self._asset_hash, vector_db.node_ids)
+    self.assertListEqual(index.get_paths(self._asset_hash), [os.path.join(scope_path, "b.pdf")])
+
+  def test_revive_moved_file_added_first(self):
+    index, vector_db, scope_path = self._create_index("fingerprint_added_first")
+    self._copy_asset(scope_path, "a.pdf")
+    self._handle(index, EventKind.Added, "/a.pdf")
+    os.rename(os.path.join(scope_path, "a.pdf"), os.path.join(scope_path, "b.pdf"))
+
+    with patch("index_package.index.index.hash_file", wraps=hash_file) as hashing:
+      self._handle(index, EventKind.Added, "/b.pdf")
+      self._handle(index, EventKind.Removed, "/a.pdf")
+      self.assertEqual(hashing.call_count, 0)
+
+    index.purge_lost_files()
+    self.assertEqual(vector_db.saved_count(self._asset_hash), 1)
+    self.assertIn(self._asset_hash, vector_db.node_ids)
+    self.assertListEqual(index.get_paths(self._asset_hash), [os.path.join(scope_path, "b.pdf")])
+
+  def test_revive_copy_by_hash(self):
+    index, vector_db, scope_path = self._create_index("fingerprint_copy")
+    self._copy_asset(scope_path, "a.pdf")
+    self._handle(index, EventKind.Added, "/a.pdf")
+    os.remove(os.path.join(scope_path, "a.pdf"))
+    self._handle(index, EventKind.Removed, "/a.pdf")
+
+    # another inode and mtime, it's found by content
+    self._copy_asset(scope_path, "c.pdf")
+    self._handle(index, EventKind.Added, "/c.pdf")
+    index.purge_lost_files()
+
+    self.assertEqual(vector_db.saved_count(self._asset_hash), 1)
+    self.assertIn(self._asset_hash, vector_db.node_ids)
+
+  def test_purge_lost_files(self):
+    index, vector_db, scope_path = self._create_index("fingerprint_purge")
+    self._copy_asset(scope_path, "a.pdf")
+    self._handle(index, EventKind.Added, "/a.pdf")
+    os.remove(os.path.join(scope_path, "a.pdf"))
+    self._handle(index, EventKind.Removed, "/a.pdf")
+
+    self.assertIn(self._asset_hash, vector_db.node_ids)
+    self.assertListEqual(index.get_paths(self._asset_hash), [])
+
+    # index is kept until purged, but it's never a result of query
+    parser: PdfParser = index._pdf_parser
+    pdf = parser.pdf_or_none(self._asset_hash)
+    assert pdf is not None
+    nodes = [
+      IndexNode(id=id, type=type, matching=IndexNodeMatching.Similarity, metadata={}, fts5_rank=0.0, vector_distance=0.0, segments=[])
+      for id, type in ((pdf.hash, "pdf"), (pdf.pages[0].hash, "pdf.page"))
+    ]
+    self.assertListEqual(trim_nodes(index, parser, nodes), [])
+
+    index.purge_lost_files()
+    self.assertNotIn(self._asset_hash, vector_db.node_ids)
+    self.assertEqual(len(vector_db.node_ids), 0)
+
+  def test_alias_hashes_of_other_algorithm(self):
+    index_dir_path = get_temp_path("index_alias/index")
+    scope_path = get_temp_path("index_alias/scope")
+    index, vector_db, _ = self._create_index("alias", index_dir_path, scope_path)
+    self._copy_asset(scope_path, "a.pdf")
+    self._handle(index, EventKind.Added, "/a.pdf")
+
+    index, vector_db, _ = self._create_index("alias", index_dir_path, scope_path, HashAlgorithm.BLAKE2B)
+    index.alias_hashes(threading.Event())
+    self._copy_asset(scope_path, "b.pdf")
+    self._handle(index, EventKind.Added, "/b.pdf")
+
+    # the copy gets id of sha512 which was indexed before, instead of being indexed again
+    self.assertEqual(vector_db.saved_count(self._asset_hash), 0)
+    self.assertEqual(len(vector_db.node_ids), 0)
+    self.assertListEqual(sorted(index.get_paths(self._asset_hash)), [
+      os.path.join(scope_path, "a.pdf"),
+      os.path.join(scope_path, "b.pdf"),
+    ])
+
+    # aliases are removed with the index of their origin
+    for name in ("a.pdf", "b.pdf"):
+      os.remove(os.path.join(scope_path, name))
+      self._handle(index, EventKind.Removed, f"/{name}")
+    index.purge_lost_files()
+    conn = sqlite3.connect(os.path.join(index_dir_path, "index.sqlite3"))
+    try:
+      self.assertEqual(conn.execute("SELECT COUNT(*) FROM hash_aliases").fetchone()[0], 0)
+    finally:
+      conn.close()
+
+  def test_migrate_fingerprints(self):
+    index_dir_path = get_temp_path("index_fingerprint_migration/index")
+    scope_path = get_temp_path("index_fingerprint_migration/scope")
+    self._copy_asset(scope_path, "a.pdf")
+
+    # database of version 1, before fingerprints were recorded
+    conn = sqlite3.connect(os.path.join(index_dir_path, "index.sqlite3"))
+    conn.executescript("""
+      CREATE TABLE files (id INTEGER PRIMARY KEY, type TEXT NOT NULL, scope TEXT NOT NULL, path TEXT NOT NULL, hash TEXT NOT NULL);
+      CREATE TABLE pages (id INTEGER PRIMARY KEY, pdf_hash TEXT NOT NULL, page_index INTEGER NOT NULL, hash TEXT NOT NULL);
+      CREATE INDEX idx_files ON files (hash, scope, path);
+      CREATE INDEX idx_scope_files ON files (scope, path);
+      CREATE INDEX idx_pages ON pages (hash, pdf_hash, page_index);
+      CREATE INDEX idx_parent_pages ON pages (pdf_hash, page_index);
+      PRAGMA user_version = 1;
+    """)
+    conn.execute(
+      "INSERT INTO files (type, scope, path, hash) VALUES (?, ?, ?, ?)",
+      ("pdf", "assets", "/a.pdf", self._asset_hash),
+    )
+    conn.commit()
+    conn.close()
+
+    index, _, _ = self._create_index("fingerprint_migration", index_dir_path, scope_path)
+    with patch("index_package.index.index.hash_file", wraps=hash_file) as hashing:
+      # file recorded before has no fingerprint, it's hashed once
+      self._handle(index, EventKind.Updated, "/a.pdf")
+      self._handle(index, EventKind.Updated, "/a.pdf")
+      self.assertEqual(hashing.call_count, 1)
+
+    self.assertListEqual(index.get_paths(self._asset_hash), [os.path.join(scope_path, "a.pdf")])
+    conn = sqlite3.connect(os.path.join(index_dir_path, "index.sqlite3"))
+    try:
+      self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 3)
+      self.assertEqual(conn.execute("SELECT COUNT(*) FROM files WHERE inode IS NOT NULL").fetchone()[0], 1)
+      self.assertEqual(conn.execute("SELECT COUNT(*) FROM lost_files").fetchone()[0], 0)
+    finally:
+      conn.close()
+
+  @property
+  def _asset_hash(self) -> str:
+    return hash_file(self._asset_path)
+
+  @property
+  def _asset_path(self) -> str:
+    return os.path.abspath(os.path.join(__file__, "../assets/The Analysis of the Transference.pdf"))
+
+  def _copy_asset(self, scope_path: str, name: str):
+    shutil.copyfile(self._asset_path, os.path.join(scope_path, name))
+
+  def _create_index(
+      self,
+      name: str,
+      index_dir_path: Optional[str] = None,
+      scope_path: Optional[str] = None,
+      hash_algorithm: HashAlgorithm = HashAlgorithm.SHA512,
+    ) -> tuple[Index, _VectorDB, str]:
+    if scope_path is None:
+      scope_path = get_temp_path(f"index_{name}/scope")
+    vector_db = _VectorDB()
+    index = Index(
+      pdf_parser=PdfParser(cache_dir_path=get_temp_path(f"index_{name}/parser_cache")),
+      segmentation=_Segmentation(), # type: ignore
+      fts5_db=FTS5DB(db_path=os.path.join(get_temp_path(f"index_{name}/fts5_db"), "db.sqlite3")),
+      vector_db=vector_db, # type: ignore
+      index_dir_path=index_dir_path or get_temp_path(f"index_{name}/index"),
+      scope=_Scope({ "assets": scope_path }),
+      hash_algorithm=hash_algorithm,
+    )
+    return index, vector_db, scope_path
+
+  def _handle(self, index: Index, kind: EventKind, path: str):
+    index.handle_event(Event(
+      id=0,
+      kind=kind,
+      target=EventTarget.File,
+      scope="assets",
+      path=path,
+      mtime=0,
+    ), lambda _: None)
+
+# records ids of nodes instead of embedding them
+class _VectorDB:
+  def __init__(self) -> None:
+    self.node_ids: set[str] = set()
+    self._saved_ids: list[str] = []
+
+  def saved_count(self, node_id: str) -> int:
+    return self._saved_ids.count(node_id)
+
+  def save(self, node_id: str, segments: list[Segment], metadata: dict):
+    self.node_ids.add(node_id)
+    self._saved_ids.append(node_id)
+
+  def remove(self, node_id: str):
+    self.node_ids.discard(node_id)
+
+class _Segmentation:
+  def split(self, text: str) -> list[Segment]:
+    return [Segment(start=0, end=len(text), text=text)]
+
 class _Scope(Scope):
   def __init__(self, sources: dict[str, str]) -> None:
     super().__init__()
@@ -0,0 +1,37 @@
+import unittest
+
+from index_package.parser.page_cache import PageCache
+
+class TestPageCache(unittest.TestCase):
+
+  def test_evict_least_recently_used(self):
+    cache = PageCache()
+    snapshot = "x" * 1000
+    cache.put("a", snapshot, [])
+    entry_bytes = cache.statistics().bytes
+    cache.resize(entry_bytes * 2)
+    cache.put("b", snapshot, [])
+    self.assertIsNotNone(cache.get("a"))
+    cache.put("c", snapshot, [])
+
+    self.assertIsNone(cache.get("b"))
+    self.assertEqual(cache.get("a"), (snapshot, []))
+    self.assertEqual(cache.get("c"), (snapshot, []))
+
+    statistics = cache.statistics()
+    self.assertEqual(statistics.hits, 3)
+    self.assertEqual(statistics.misses, 1)
+    self.assertEqual(statistics.evictions, 1)
+    self.assertEqual(statistics.entries, 2)
+    self.assertEqual(statistics.bytes, entry_bytes * 2)
+
+  def test_invalidate(self):
+    cache = PageCache()
+    cache.put("a", "snapshot", [])
+    cache.invalidate("a")
+    self.assertIsNone(cache.get("a"))
+    self.assertEqual(cache.statistics().bytes, 0)
+
+    cache.resize(0)
+    cache.put("a", "snapshot", [])
+    self.assertEqual(cache.statistics().entries, 0)
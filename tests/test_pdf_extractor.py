@@ -0,0 +1,184 @@
+import os
+import glob
+import random
+import shutil
+import unittest
+import pdfplumber
+
+from typing import Optional
+from shapely.geometry import Polygon
+from index_package.parser import PdfParser
+from index_package.parser.pdf_extractor import source_stat, PdfExtractor
+from tests.utils import get_temp_path
+
+class TestPdfExtractor(unittest.TestCase):
+
+  def test_selected_text_of_assets(self):
+    extractor = PdfExtractor(get_temp_path("pdf_extractor/pages"))
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    random.seed(0)
+
+    for file_path in sorted(glob.glob(os.path.join(assets_path, "*.pdf"))):
+      with pdfplumber.open(file_path) as pdf_file:
+        for page in pdf_file.pages:
+          for quad_points in self._quad_points_of_page(page):
+            self.assertEqual(
+              extractor._extract_selected_text(page, quad_points),
+              _reference_selected_text(page, quad_points),
+            )
+
+  def test_selected_text_of_edges(self):
+    # boxes on a coarse grid share edges often, and quads have no area sometimes.
+    # boxes of text always have area, shapely gives answers depending on orientation
+    # of polygons without area which touch edges.
+    extractor = PdfExtractor(get_temp_path("pdf_extractor/pages"))
+    random.seed(1)
+
+    for _ in range(200):
+      page = _FakePage(random)
+      for _ in range(5):
+        quad_points: list[float] = []
+        for _ in range(random.randint(1, 3)):
+          x0, x1 = sorted(random.randint(0, 10) for _ in range(2))
+          y0, y1 = sorted(random.randint(0, 10) for _ in range(2))
+          quad_points.extend((x0, y1, x1, y1, x0, y0, x1, y0))
+        self.assertEqual(
+          extractor._extract_selected_text(page, quad_points), # type: ignore
+          _reference_selected_text(page, quad_points),
+        )
+
+  def test_source_changed_after_split(self):
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    cache_dir_path = get_temp_path("pdf_extractor_changed/cache")
+    source_path = os.path.join(get_temp_path("pdf_extractor_changed/source"), "source.pdf")
+    shutil.copyfile(os.path.join(assets_path, "纯粹理性批判.pdf"), source_path)
+
+    parser = PdfParser(cache_dir_path)
+    split_stat = source_stat(source_path)
+    _, page_hashes = parser._split_pdf(source_path)
+    pages = list(enumerate(page_hashes))
+
+    # another pdf is written to the path after splitting
+    shutil.copyfile(os.path.join(assets_path, "铁证待判.pdf"), source_path)
+    os.utime(source_path, ns=(0, 0))
+
+    for max_processes in (0, 2):
+      extractor = PdfExtractor(parser._pages_path, max_processes)
+      try:
+        for content in extractor.extract_pages(source_path, split_stat, pages):
+          self.assertEqual(content, extractor.extract_page(content.hash))
+      finally:
+        extractor.close()
+
+    self.assertNotEqual(
+      [c.snapshot for c in PdfExtractor(parser._pages_path).extract_pages(source_path, source_stat(source_path), pages)],
+      [c.snapshot for c in PdfExtractor(parser._pages_path).extract_pages(source_path, split_stat, pages)],
+    )
+
+  def _quad_points_of_page(self, page) -> list[list[float]]:
+    quad_points_list: list[list[float]] = []
+    for anno in page.annots:
+      data = anno.get("data", None) or {}
+      quad_points = data.get("QuadPoints", None)
+      if quad_points is not None:
+        quad_points_list.append(quad_points)
+
+    # highlights over random spans of chars, like the ones made by readers
+    chars = page.chars
+    for _ in range(20):
+      if len(chars) == 0:
+        break
+      quad_points: list[float] = []
+      for _ in range(random.randint(1, 4)):
+        begin = random.randrange(len(chars))
+        span = chars[begin:begin + random.randint(1, 40)]
+        x0 = min(c["x0"] for c in span)
+        x1 = max(c["x1"] for c in span)
+        y0 = min(c["y0"] for c in span)
+        y1 = max(c["y1"] for c in span)
+        quad_points.extend((x0, y1, x1, y1, x0, y0, x1, y0))
+      quad_points_list.append(quad_points)
+    return quad_points_list
+
+class _FakePage:
+  def __init__(self, random: random.Random):
+    self.height = 10
+    self._lines: list[dict] = []
+    for _ in range(random.randint(0, 4)):
+      top, bottom = sorted(random.sample(range(11), 2))
+      chars: list[dict] = []
+      for _ in range(random.randint(0, 4)):
+        x0, x1 = sorted(random.sample(range(11), 2))
+        chars.append({
+          "x0": x0, "x1": x1,
+          "y0": self.height - bottom, "y1": self.height - top,
+          "text": random.choice("abc"),
+        })
+      self._lines.append({
+        "x0": min((c["x0"] for c in chars), default=0),
+        "x1": max((c["x1"] for c in chars), default=10),
+        "top": top,
+        "bottom": bottom,
+        "chars": chars,
+      })
+
+  def extract_text_lines(self, **_) -> list[dict]:
+    return self._lines
+
+# implementation with shapely before arrays were used
+def _reference_selected_text(page, quad_points: list[float]) -> Optional[str]:
+  annotation_polygon = _ReferencePolygon(quad_points)
+  if not annotation_polygon.is_valid:
+    return None
+
+  line_tuples: list[tuple[float, str]] = []
+  height = page.height
+
+  for line in page.extract_text_lines(char=False):
+    x0, y0, x1, y1 = line["x0"], line["top"], line["x1"], line["bottom"]
+    y0 = height - y0
+    y1 = height - y1
+    if not annotation_polygon.intersects(x0, y0, x1, y1):
+      continue
+
+    line_chars: list[str] = []
+    for char in line["chars"]:
+      x0, y0, x1, y1 = char["x0"], char["y0"], char["x1"], char["y1"]
+      if annotation_polygon.contains(x0, y0, x1, y1):
+        line_chars.append(char["text"])
+    line_tuples.append((-y0, "".join(line_chars)))
+
+  lines = [line for _, line in sorted(line_tuples, key=lambda x: x[0])]
+  if len(lines) == 0:
+    return None
+  return "\n".join(lines)
+
+class _ReferencePolygon:
+  def __init__(self, quad_points: list[float]):
+    self._polygons: list[Polygon] = []
+    for i in range(int(len(quad_points) / 8)):
+      xs = [quad_points[i*8 + j*2] for j in range(4)]
+      ys = [quad_points[i*8 + j*2 + 1] for j in range(4)]
+      x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+      polygon = Polygon(((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
+      if polygon.is_valid:
+        self._polygons.append(polygon)
+
+  @property
+  def is_valid(self) -> bool:
+    return len(self._polygons) > 0
+
+  def intersects(self, x0: float, y0: float, x1: float, y1: float) -> bool:
+    target_polygon = Polygon(((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
+    return any(p.overlaps(target_polygon) for p in self._polygons)
+
+  def contains(self, x0: float, y0: float, x1: float, y1: float) -> bool:
+    rate = 0.01
+    center_x = (x0 + x1) / 2.0
+    center_y = (y0 + y1) / 2.0
+    x0 += (center_x - x0) * rate
+    y0 += (center_y - y0) * rate
+    x1 += (center_x - x1) * rate
+    y1 += (center_y - y1) * rate
+    target_polygon = Polygon([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+    return any(p.contains(target_polygon) for p in self._polygons)
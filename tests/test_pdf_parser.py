@@ -1,7 +1,11 @@
 import os
 import unittest
 
+from sqlite3_pool import SQLite3Pool
 from index_package.parser import PdfParser, PdfParserListeners
+from index_package.parser.page_cache import page_cache
+from index_package.parser.page_store import PageStore
+from index_package.parser.pdf_extractor import PageContent
 from index_package.utils import hash_sha512
 from tests.utils import get_temp_path
 
@@ -11,7 +15,6 @@ class TestPdfParser(unittest.TestCase):
     assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
     parser = PdfParser(
       cache_dir_path=get_temp_path("pdf_struct/cache"),
-      temp_dir_path=get_temp_path("pdf_struct/temp"),
       listeners=PdfParserListeners(
         on_page_added=lambda path:added_page_hashes.append(path),
         on_page_removed=lambda path:removed_page_hashes.append(path),
@@ -114,7 +117,6 @@ class TestPdfParser(unittest.TestCase):
     assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
     parser = PdfParser(
       cache_dir_path=get_temp_path("pdf_extract/cache"),
-      temp_dir_path=get_temp_path("pdf_extract/temp"),
       listeners=PdfParserListeners(
         on_page_added=lambda path:added_page_hashes.append(path),
         on_page_removed=lambda path:removed_page_hashes.append(path),
@@ -133,6 +135,95 @@ class TestPdfParser(unittest.TestCase):
       "mSmFG7L5wWaPNS2xfNJwyybeouZE1RwfF7sqmhFshVd6G137gapjXCm2hz1PtxKhIqOAKQ6xV61UsD2xortrRA==",
     ])
 
+  def test_compressed_pages(self):
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    file, file_hash = self._assets_info(assets_path, "纯粹理性批判.pdf")
+    contents: list[list] = []
+    for name, compress_pages in (("plain", False), ("compressed", True)):
+      # pages of same hash would be read from memory
+      page_cache().clear()
+      pdf = PdfParser(
+        cache_dir_path=get_temp_path(f"pdf_compressed/{name}"),
+        compress_pages=compress_pages,
+      ).pdf(file_hash, file, lambda _: None)
+      contents.append([(p.snapshot, p.annotations) for p in pdf.pages])
+
+    self.assertGreater(sum(len(a) for _, a in contents[0]), 0)
+    self.assertListEqual(contents[0], contents[1])
+
+  def test_extract_in_processes(self):
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    file, file_hash = self._assets_info(assets_path, "纯粹理性批判.pdf")
+    contents: list[list] = []
+    for name, extract_processes in (("threads", 0), ("processes", 2)):
+      page_cache().clear()
+      parser = PdfParser(
+        cache_dir_path=get_temp_path(f"pdf_processes/{name}"),
+        extract_processes=extract_processes,
+      )
+      try:
+        pdf = parser.pdf(file_hash, file, lambda _: None)
+        contents.append([(p.hash, p.snapshot, p.annotations) for p in pdf.pages])
+      finally:
+        parser.close()
+
+    self.assertGreater(sum(len(a) for _, _, a in contents[0]), 0)
+    self.assertListEqual(contents[0], contents[1])
+
+  def test_page_cache(self):
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    parser = PdfParser(get_temp_path("pdf_page_cache/cache"))
+    file, file_hash = self._assets_info(assets_path, "The Analysis of the Transference.pdf")
+    page_hash = parser.pdf(file_hash, file, lambda _: None).pages[0].hash
+    page_cache().clear()
+
+    snapshots: list[str] = []
+    for _ in range(2):
+      page = parser.page(page_hash)
+      assert page is not None
+      snapshots.append(page.snapshot)
+    self.assertNotEqual(snapshots[0], "")
+    self.assertEqual(snapshots[0], snapshots[1])
+    self.assertIsNotNone(page_cache().get(page_hash))
+
+    parser.fire_file_removed(file_hash)
+    self.assertIsNone(page_cache().get(page_hash))
+
+  def test_read_page_before_saved(self):
+    db = SQLite3Pool("pdf", os.path.join(get_temp_path("pdf_page_store"), "pdf.sqlite3"))
+    store = PageStore(db)
+    page_cache().clear()
+    self.assertEqual(store.read("foobar"), ("", []))
+    self.assertIsNone(page_cache().get("foobar"))
+
+    with db.connect() as (cursor, conn):
+      store.save(cursor, PageContent(hash="foobar", snapshot="hello world", annotations=[]))
+      conn.commit()
+    self.assertEqual(store.read("foobar"), ("hello world", []))
+
+  def test_migrate_flat_pages(self):
+    assets_path = os.path.abspath(os.path.join(__file__, "../assets"))
+    cache_dir_path = get_temp_path("pdf_flat/cache")
+    file, file_hash = self._assets_info(assets_path, "铁证待判.pdf")
+    pages = PdfParser(cache_dir_path).pdf(file_hash, file, lambda _: None).pages
+    pages_path = os.path.join(cache_dir_path, "pages")
+
+    # layout of old versions
+    for page in pages:
+      os.replace(page.page_file_path, os.path.join(pages_path, f"{page.hash}.pdf"))
+
+    pages = PdfParser(cache_dir_path).pdf(file_hash, file, lambda _: None).pages
+    for page in pages:
+      self.assertEqual(
+        os.path.relpath(page.page_file_path, pages_path),
+        os.path.join(page.hash[0], page.hash[1], f"{page.hash}.pdf"),
+      )
+      self.assertTrue(os.path.isfile(page.page_file_path))
+    self.assertListEqual(
+      [name for name in os.listdir(pages_path) if name.endswith(".pdf")],
+      [],
+    )
+
   def _assets_info(self, assets_path: str, name: str):
     path = os.path.join(assets_path, name)
     hash = hash_sha512(path)
@@ -141,10 +232,11 @@ class TestPdfParser(unittest.TestCase):
   def _read_hash_of_files(self, dir_path: str) -> list[str]:
     hash_of_files: list[str] = []
 
-    for file_name in os.listdir(dir_path):
-      hash, ext_name = os.path.splitext(file_name)
-      if ext_name == ".pdf":
-        hash_of_files.append(hash)
+    for _, _, file_names in os.walk(dir_path):
+      for file_name in file_names:
+        hash, ext_name = os.path.splitext(file_name)
+        if ext_name == ".pdf":
+          hash_of_files.append(hash)
 
     hash_of_files.sort()
     return hash_of_files
\ No newline at end of file
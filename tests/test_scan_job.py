@@ -0,0 +1,46 @@
+import os
+import unittest
+
+from typing import Callable
+from index_package.scanner import Scanner, Event
+from index_package.service.scan_job import ServiceScanJob
+from tests.utils import get_temp_path
+
+class TestServiceScanJob(unittest.TestCase):
+
+  def test_completed_job(self):
+    completed: list[bool] = []
+    job = self._create_job("scan_job_completed", lambda _: None, lambda: completed.append(True))
+    self.assertTrue(job.start({ "test": self._scan_path }))
+    self.assertListEqual(completed, [True])
+
+  def test_failed_job(self):
+    completed: list[bool] = []
+
+    def handle_event(event: Event):
+      raise ValueError(f"failed to handle {event.path}")
+
+    job = self._create_job("scan_job_failed", handle_event, lambda: completed.append(True))
+    with self.assertRaises(RuntimeError):
+      job.start({ "test": self._scan_path })
+    self.assertListEqual(completed, [])
+
+  def _create_job(
+    self,
+    name: str,
+    handle_event: Callable[[Event], None],
+    on_completed: Callable[[], None],
+  ) -> ServiceScanJob:
+    temp_path = get_temp_path(name)
+    self._scan_path = os.path.join(temp_path, "data")
+    os.makedirs(self._scan_path, exist_ok=True)
+    with open(os.path.join(self._scan_path, "foobar"), "w", encoding="utf-8") as file:
+      file.write("this is foobar")
+
+    return ServiceScanJob(
+      scanner=Scanner(os.path.join(temp_path, "scanner.sqlite3")),
+      max_workers=1,
+      progress_event_listener=lambda _: None,
+      handle_event=handle_event,
+      on_completed=on_completed,
+    )
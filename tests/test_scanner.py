@@ -1,17 +1,29 @@
 import os
 import time
+import threading
 import shutil
+import sqlite3
 import unittest
 
 from typing import Generator
-from index_package.scanner import Scanner, EventKind, EventTarget
+from index_package.scanner import Scanner, ScanFilter, Watcher, EventKind, EventTarget, is_watching_supported
+from index_package.scanner.events import record_removed_events_of_files
+from index_package.scanner.watcher import _IN_Q_OVERFLOW
+from index_package.progress_events import ProgressEvent, ScanScopeProgressEvent, WatchingErrorEvent
+from index_package.utils import InterruptException
 from tests.utils import get_temp_path
 
 class TestScanner(unittest.TestCase):
 
   def test_scanning_folder(self):
-    scan_path, db_path = self.setup_paths()
-    scanner = Scanner(db_path)
+    self._test_scanning_folder("scanner", in_memory_snapshot=True)
+
+  def test_scanning_folder_without_snapshot(self):
+    self._test_scanning_folder("scanner_without_snapshot", in_memory_snapshot=False)
+
+  def _test_scanning_folder(self, name: str, in_memory_snapshot: bool):
+    scan_path, db_path = self.setup_paths(name)
+    scanner = Scanner(db_path, in_memory_snapshot=in_memory_snapshot)
     scanner.commit_sources({
       "test": scan_path,
     })
@@ -20,6 +32,304 @@ class TestScanner(unittest.TestCase):
     self._test_modify_part_of_files(scan_path, scanner)
     time.sleep(0.1)
     self._test_delete_recursively(scan_path, scanner)
+    time.sleep(0.1)
+    self._test_rescan_without_changes(scan_path, scanner)
+
+  def test_scanning_multiple_scopes(self):
+    scan_path, db_path = self.setup_paths("scanner_multiple_scopes")
+    scanner = Scanner(db_path, max_concurrent_scopes=2)
+    sources: dict[str, str] = {}
+
+    for name in ("alpha", "beta", "gamma"):
+      scope_path = os.path.join(scan_path, name)
+      self._set_file(scope_path, "./foobar", f"this is {name}")
+      self._set_file(scope_path, "./sub/file", f"file of {name}")
+      sources[name] = scope_path
+
+    scanner.commit_sources(sources)
+    progress_events: list[ProgressEvent] = []
+    path_list: list[tuple[str, str]] = []
+
+    for event_id in scanner.scan(progress_events.append):
+      event = scanner.parse_event(event_id)
+      try:
+        path_list.append((event.scope, event.path))
+      finally:
+        event.close()
+
+    path_list.sort()
+    self.assertListEqual(path_list, [
+      (name, path)
+      for name in ("alpha", "beta", "gamma")
+      for path in ("/", "/foobar", "/sub", "/sub/file")
+    ])
+    completed_events = sorted(
+      (e.scope, e.scanned_files)
+      for e in progress_events
+      if isinstance(e, ScanScopeProgressEvent) and e.completed
+    )
+    self.assertListEqual(completed_events, [
+      ("alpha", 4), ("beta", 4), ("gamma", 4),
+    ])
+
+  def test_scanning_with_filter(self):
+    scan_path, db_path = self.setup_paths("scanner_filter")
+    self._set_file(scan_path, "./book.pdf", "pdf")
+    self._set_file(scan_path, "./note.txt", "txt")
+    self._set_file(scan_path, "./.paperignore", "drafts/\n*.tmp.pdf\n!keep.tmp.pdf\n")
+    self._set_file(scan_path, "./drafts/draft.pdf", "pdf")
+    self._set_file(scan_path, "./papers/a.tmp.pdf", "pdf")
+    self._set_file(scan_path, "./papers/keep.tmp.pdf", "pdf")
+    self._set_file(scan_path, "./papers/deep/deeper/c.pdf", "pdf")
+    self._set_file(scan_path, "./cache/d.pdf", "pdf")
+    self._set_file(scan_path, "./book.epub/e.pdf", "pdf")
+
+    scan_filter = ScanFilter(
+      include_extensions=("pdf",),
+      exclude_globs=("/cache",),
+      ignore_files=(".paperignore",),
+      max_depth=3,
+    )
+    scanner = Scanner(db_path, default_scan_filter=scan_filter)
+    scanner.commit_sources({ "test": scan_path })
+    added_path_list, _, _ = self._scan_and_classify_events(scanner)
+    self.assertListEqual([p for p, _ in added_path_list], [
+      "/", "/.paperignore", "/book.pdf",
+      "/papers", "/papers/deep", "/papers/deep/deeper", "/papers/keep.tmp.pdf",
+    ])
+
+    # files excluded by changed rules are removed, and included ones are added
+    time.sleep(0.1)
+    self._set_file(scan_path, "./.paperignore", "papers/\n")
+    added_path_list, removed_path_list, updated_path_list = self._scan_and_classify_events(scanner)
+    self.assertListEqual(added_path_list, [
+      ("/drafts", EventTarget.Directory),
+      ("/drafts/draft.pdf", EventTarget.File),
+    ])
+    self.assertListEqual(updated_path_list, [
+      ("/.paperignore", EventTarget.File),
+    ])
+    self.assertListEqual(removed_path_list, [
+      ("/papers", EventTarget.Directory),
+      ("/papers/deep", EventTarget.Directory),
+      ("/papers/deep/deeper", EventTarget.Directory),
+      ("/papers/keep.tmp.pdf", EventTarget.File),
+    ])
+
+    scanner = Scanner(db_path, default_scan_filter=ScanFilter(include_extensions=("txt",)))
+    added_path_list, removed_path_list, _ = self._scan_and_classify_events(scanner)
+    self.assertListEqual([p for p, _ in added_path_list], [
+      "/cache", "/note.txt", "/papers", "/papers/deep", "/papers/deep/deeper",
+    ])
+    self.assertListEqual([p for p, _ in removed_path_list], [
+      "/.paperignore", "/book.pdf", "/drafts/draft.pdf",
+    ])
+
+  def test_removing_scope(self):
+    scan_path, db_path = self.setup_paths("scanner_removing_scope")
+    scanner = Scanner(db_path)
+    self._set_file(scan_path, "./foobar", "hello world")
+    self._set_file(scan_path, "./earth/land", "this is a land")
+    self._set_file(scan_path, "./earth/sea", "this is sea")
+    scanner.commit_sources({ "test": scan_path })
+    scanner.scan()
+    self._clear_events(scanner)
+
+    time.sleep(0.1)
+    self._set_file(scan_path, "./foobar", "file is foobar")
+    self._set_file(scan_path, "./moon", "this is moon")
+    scanner.scan()
+    scanner.commit_sources({})
+
+    events: list[tuple[str, EventKind, EventTarget]] = []
+    for event_id in scanner.event_ids():
+      event = scanner.parse_event(event_id)
+      events.append((event.path, event.kind, event.target))
+      event.close()
+
+    events.sort(key=lambda e: e[0])
+    # moon was added and removed before handled, so it never appears
+    self.assertListEqual(events, [
+      ("/", EventKind.Removed, EventTarget.Directory),
+      ("/earth", EventKind.Removed, EventTarget.Directory),
+      ("/earth/land", EventKind.Removed, EventTarget.File),
+      ("/earth/sea", EventKind.Removed, EventTarget.File),
+      ("/foobar", EventKind.Removed, EventTarget.File),
+    ])
+
+  def test_removing_descendants_of_root(self):
+    scan_path, db_path = self.setup_paths("scanner_removing_descendants_of_root")
+    scanner = Scanner(db_path)
+    self._set_file(scan_path, "./foobar", "hello world")
+    self._set_file(scan_path, "./earth/land", "this is a land")
+    scanner.commit_sources({ "test": scan_path })
+    scanner.scan()
+    self._clear_events(scanner)
+
+    conn = sqlite3.connect(db_path)
+    try:
+      cursor = conn.cursor()
+      record_removed_events_of_files(cursor, "test", "/")
+      conn.commit()
+      cursor.execute("SELECT path FROM files WHERE scope = ?", ("test",))
+      self.assertListEqual([row[0] for row in cursor.fetchall()], ["/"])
+    finally:
+      conn.close()
+
+    events: list[tuple[str, EventKind]] = []
+    for event_id in scanner.event_ids():
+      event = scanner.parse_event(event_id)
+      events.append((event.path, event.kind))
+      event.close()
+
+    events.sort(key=lambda e: e[0])
+    self.assertListEqual(events, [
+      ("/earth", EventKind.Removed),
+      ("/earth/land", EventKind.Removed),
+      ("/foobar", EventKind.Removed),
+    ])
+
+  def test_scanning_stream(self):
+    scan_path, db_path = self.setup_paths("scanner_stream")
+    scanner = Scanner(db_path)
+    self._set_file(scan_path, "./foobar", "hello world")
+    scanner.commit_sources({ "test": scan_path })
+    origin_event_ids = scanner.scan()
+    self.assertEqual(len(origin_event_ids), 2)
+
+    # id of closed event must not be reused by new events
+    last_event = scanner.parse_event(origin_event_ids[-1])
+    last_event_path = last_event.path
+    last_event.close()
+
+    time.sleep(0.1)
+    self._set_file(scan_path, "./earth", "this is earth")
+    path_list: list[str] = []
+    event_ids = list(scanner.scan_stream())
+
+    for event_id in event_ids:
+      event = scanner.parse_event(event_id)
+      try:
+        path_list.append(event.path)
+      finally:
+        event.close()
+
+    self.assertGreater(event_ids[0], origin_event_ids[-1])
+    # events left by last scan come at last
+    self.assertListEqual(path_list, [
+      "/earth",
+      *sorted(p for p in ("/", "/foobar") if p != last_event_path),
+    ])
+
+  def test_resuming_interrupted_scan(self):
+    scan_path, db_path = self.setup_paths("scanner_resuming")
+    for i in range(20):
+      for j in range(100):
+        self._set_file(scan_path, f"./dir{i}/file{j}", "")
+
+    scanner = Scanner(db_path, walker_workers=1)
+    scanner.commit_sources({ "test": scan_path })
+    interrupted = threading.Event()
+
+    def interrupt(event: ProgressEvent):
+      if isinstance(event, ScanScopeProgressEvent):
+        interrupted.set()
+
+    with self.assertRaises(InterruptException):
+      list(scanner.scan_stream(interrupt, interrupted))
+
+    # folders which were scanned before interrupted are never walked again
+    progress_events: list[ProgressEvent] = []
+    scanner.scan(progress_events.append)
+    completed_event = progress_events[-1]
+    assert isinstance(completed_event, ScanScopeProgressEvent)
+    self.assertTrue(completed_event.completed)
+    self.assertLess(completed_event.scanned_files, 20 * 100)
+
+    added_path_list, _, _ = self._classify_events(scanner, scanner.event_ids())
+    self.assertEqual(len(added_path_list), 1 + 20 * 101)
+    self._clear_events(scanner)
+    self.assertListEqual(scanner.scan(), [])
+
+  @unittest.skipUnless(is_watching_supported(), "inotify is not supported")
+  def test_watching_folder(self):
+    scan_path, db_path = self.setup_paths("scanner_watching")
+    scanner = Scanner(db_path)
+    self._set_file(scan_path, "./foobar", "hello world")
+    self._set_file(scan_path, "./earth/land", "this is a land")
+    scanner.commit_sources({ "test": scan_path })
+    scanner.scan()
+    self._clear_events(scanner)
+
+    changed = threading.Event()
+    watcher = Watcher(scanner, lambda _: changed.set(), debounce=0.1)
+    with watcher:
+      self._set_file(scan_path, "./earth/sea", "this is sea")
+      self._set_file(scan_path, "./universe/sun/sun1", "this is sun1")
+      self._del_file(scan_path, "./foobar")
+      self.assertTrue(changed.wait(timeout=10.0))
+      time.sleep(0.3)
+
+    added_path_list, removed_path_list, updated_path_list = self._classify_events(scanner, scanner.event_ids())
+    self.assertListEqual(added_path_list, [
+      ("/earth/sea", EventTarget.File),
+      ("/universe", EventTarget.Directory),
+      ("/universe/sun", EventTarget.Directory),
+      ("/universe/sun/sun1", EventTarget.File),
+    ])
+    self.assertListEqual(updated_path_list, [
+      ("/", EventTarget.Directory),
+      ("/earth", EventTarget.Directory),
+    ])
+    self.assertListEqual(removed_path_list, [
+      ("/foobar", EventTarget.File),
+    ])
+    # the full scan agrees with what watcher recorded
+    self._clear_events(scanner)
+    self.assertListEqual(scanner.scan(), [])
+
+  @unittest.skipUnless(is_watching_supported(), "inotify is not supported")
+  def test_watching_overflow_and_failure(self):
+    scan_path, db_path = self.setup_paths("scanner_watching_overflow")
+    scanner = Scanner(db_path)
+    self._set_file(scan_path, "./foobar", "hello world")
+    scanner.commit_sources({ "test": scan_path })
+    scanner.scan()
+    self._clear_events(scanner)
+
+    overflowed = threading.Event()
+    failed = threading.Event()
+    errors: list[str] = []
+
+    def on_changed(_):
+      raise RuntimeError("on_changed failed")
+
+    def on_progress(event: ProgressEvent):
+      if isinstance(event, WatchingErrorEvent):
+        errors.append(event.error)
+        failed.set()
+
+    watcher = Watcher(
+      scanner=scanner,
+      on_changed=on_changed,
+      debounce=0.1,
+      on_overflowed=overflowed.set,
+      progress_event_listener=on_progress,
+    )
+    # it's not watched yet, only a full scan can find it
+    self._set_file(scan_path, "./moon", "this is moon")
+
+    with watcher:
+      # the full scan is left to owner of watcher, it never scans by itself
+      watcher._handle_event(-1, _IN_Q_OVERFLOW, "")
+      self.assertTrue(overflowed.wait(timeout=10.0))
+      self.assertListEqual(scanner.event_ids(), [])
+
+      time.sleep(0.3)
+      self._set_file(scan_path, "./sun", "this is sun")
+      self.assertTrue(failed.wait(timeout=10.0))
+
+    self.assertListEqual(errors, ["failed to record watched changes: on_changed failed"])
 
   def _test_insert_files(self, scan_path: str, scanner: Scanner):
     self._set_file(scan_path, "./foobar", "hello world")
@@ -84,8 +394,16 @@ class TestScanner(unittest.TestCase):
       ("/universe/sun/sun1", EventTarget.File),
     ])
 
-  def setup_paths(self) -> tuple[str, str]:
-    temp_path = get_temp_path("scanner")
+  def _test_rescan_without_changes(self, scan_path: str, scanner: Scanner):
+    os.makedirs(os.path.join(scan_path, "empty"))
+    added_path_list, _, _ = self._scan_and_classify_events(scanner)
+    self.assertListEqual(added_path_list, [
+      ("/empty", EventTarget.Directory),
+    ])
+    self.assertListEqual(scanner.scan(), [])
+
+  def setup_paths(self, name: str) -> tuple[str, str]:
+    temp_path = get_temp_path(name)
     scan_path = os.path.join(temp_path, "data")
     db_path = os.path.join(temp_path, "scanner.sqlite3")
 
@@ -95,12 +413,19 @@ class TestScanner(unittest.TestCase):
     list[tuple[str, EventTarget]],
     list[tuple[str, EventTarget]],
     list[tuple[str, EventTarget]],
+  ]:
+    return self._classify_events(scanner, scanner.scan())
+
+  def _classify_events(self, scanner: Scanner, event_ids: list[int]) -> tuple[
+    list[tuple[str, EventTarget]],
+    list[tuple[str, EventTarget]],
+    list[tuple[str, EventTarget]],
   ]:
     added_path_list: list[tuple[str, EventTarget]] = []
     removed_path_list: list[tuple[str, EventTarget]] = []
     updated_path_list: list[tuple[str, EventTarget]] = []
 
-    for event_id in scanner.scan():
+    for event_id in event_ids:
       event = scanner.parse_event(event_id)
       try:
         if event.kind == EventKind.Added:
@@ -117,6 +442,10 @@ class TestScanner(unittest.TestCase):
 
     return added_path_list, removed_path_list, updated_path_list
 
+  def _clear_events(self, scanner: Scanner):
+    for event_id in scanner.event_ids():
+      scanner.parse_event(event_id).close()
+
   def _set_file(self, base_path: str, path: str, content: str):
     abs_file_path = os.path.join(base_path, path)
     abs_dir_path = os.path.dirname(abs_file_path)
@@ -0,0 +1,259 @@
+import os
+import time
+import sqlite3
+import threading
+import unittest
+
+from sqlite3_pool import (
+  register_table_creators,
+  register_migration,
+  set_connection_profile,
+  enable_statement_statistics,
+  disable_statement_statistics,
+  statement_statistics,
+  ConnectionProfile,
+  SQLite3Pool,
+)
+from tests.utils import get_temp_path
+
+def _create_tables(cursor: sqlite3.Cursor):
+  cursor.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL)")
+
+def _migrate_add_index(cursor: sqlite3.Cursor):
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_files ON files (path)")
+
+def _migrate_add_column(cursor: sqlite3.Cursor):
+  cursor.execute("ALTER TABLE files ADD COLUMN mtime REAL")
+
+register_table_creators("test_migration", _create_tables)
+register_migration("test_migration", 2, _migrate_add_column)
+register_migration("test_migration", 1, _migrate_add_index)
+register_table_creators("test_profile", _create_tables)
+set_connection_profile("test_profile", ConnectionProfile(
+  synchronous="full",
+  busy_timeout=1234,
+))
+register_table_creators("test_shared_pool", _create_tables)
+set_connection_profile("test_shared_pool", ConnectionProfile(
+  pool_size=1,
+  prewarm_size=1,
+  checkout_timeout=0.5,
+))
+
+class TestSQLite3Pool(unittest.TestCase):
+
+  def test_migrate_new_database(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/new"), "db.sqlite3")
+    db = SQLite3Pool("test_migration", db_path)
+    self.assertEqual(self._user_version(db), 2)
+    self.assertListEqual(self._index_names(db), ["idx_files"])
+    self.assertListEqual(self._column_names(db), ["id", "path", "mtime"])
+
+  def test_migrate_existing_database(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/existing"), "db.sqlite3")
+    with sqlite3.connect(db_path) as conn:
+      _create_tables(conn.cursor())
+      conn.execute("INSERT INTO files (path) VALUES ('/foobar')")
+      conn.commit()
+    conn.close()
+
+    db = SQLite3Pool("test_migration", db_path)
+    self.assertEqual(self._user_version(db), 2)
+    self.assertListEqual(self._index_names(db), ["idx_files"])
+    self.assertListEqual(self._column_names(db), ["id", "path", "mtime"])
+
+    # opening again must not run migrations twice
+    db = SQLite3Pool("test_migration", db_path)
+    self.assertEqual(self._user_version(db), 2)
+
+    with db.connect() as (cursor, _):
+      cursor.execute("SELECT path FROM files")
+      self.assertListEqual(cursor.fetchall(), [("/foobar",)])
+
+  def test_register_after_created(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/register"), "db.sqlite3")
+    SQLite3Pool("test_migration", db_path)
+    with self.assertRaises(Exception):
+      register_migration("test_migration", 3, _migrate_add_index)
+
+  def test_connection_profile(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/profile"), "db.sqlite3")
+    db = SQLite3Pool("test_profile", db_path)
+    with db.connect() as (cursor, _):
+      cursor.execute("PRAGMA journal_mode")
+      self.assertEqual(cursor.fetchone()[0], "wal")
+      cursor.execute("PRAGMA synchronous")
+      self.assertEqual(cursor.fetchone()[0], 2)
+      cursor.execute("PRAGMA busy_timeout")
+      self.assertEqual(cursor.fetchone()[0], 1234)
+
+    with self.assertRaises(ValueError):
+      ConnectionProfile(journal_mode="WAL; DROP TABLE files")
+    with self.assertRaises(ValueError):
+      ConnectionProfile.from_config({ "unknown": 1 })
+
+  def test_shared_pool(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/shared"), "db.sqlite3")
+    db = SQLite3Pool("test_shared_pool", db_path)
+    self.assertEqual(db.metrics.idle, 1)
+    self.assertEqual(db.metrics.created, 1)
+
+    session = db.connect()
+    with self.assertRaises(TimeoutError):
+      db.connect()
+
+    def close_later():
+      time.sleep(0.1)
+      session.close()
+
+    thread = threading.Thread(target=close_later)
+    thread.start()
+    with db.connect() as (cursor, _):
+      cursor.execute("SELECT COUNT(*) FROM files")
+      self.assertEqual(cursor.fetchone()[0], 0)
+    thread.join()
+
+    metrics = db.metrics
+    self.assertEqual(metrics.created, 1)
+    self.assertEqual(metrics.idle, 1)
+    self.assertEqual(metrics.in_use, 0)
+    self.assertEqual(metrics.checkouts, 2)
+    self.assertEqual(metrics.waits, 1)
+
+  def test_readonly_connection(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/readonly"), "db.sqlite3")
+    db = SQLite3Pool("test_migration", db_path)
+
+    with db.connect() as (cursor, conn):
+      cursor.execute("BEGIN TRANSACTION")
+      cursor.execute("INSERT INTO files (path) VALUES ('/foobar')")
+
+      # write transaction is still open
+      with db.connect(readonly=True) as (read_cursor, _):
+        read_cursor.execute("SELECT COUNT(*) FROM files")
+        self.assertEqual(read_cursor.fetchone()[0], 0)
+        with self.assertRaises(sqlite3.OperationalError):
+          read_cursor.execute("INSERT INTO files (path) VALUES ('/readonly')")
+      conn.commit()
+
+    with db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT path FROM files")
+      self.assertListEqual(cursor.fetchall(), [("/foobar",)])
+
+    self.assertEqual(db.readonly_metrics.checkouts, 2)
+
+  def test_statement_statistics(self):
+    temp_path = get_temp_path("sqlite3_pool/statistics")
+    slow_log_path = os.path.join(temp_path, "slow.log")
+    db = SQLite3Pool("test_migration", os.path.join(temp_path, "db.sqlite3"))
+    enable_statement_statistics(slow_threshold=0.0, slow_log_path=slow_log_path)
+    try:
+      with db.connect() as (cursor, conn):
+        for i in range(10):
+          cursor.execute("INSERT INTO files (path) VALUES (?)", (f"/file{i}",))
+        cursor.execute("SELECT   path FROM files WHERE id IN (1, 2, 3)")
+        conn.execute("DELETE FROM files WHERE id = ?", (1,))
+        conn.commit()
+        conn.executescript("UPDATE files SET path = path;")
+      statistics = statement_statistics()
+    finally:
+      disable_statement_statistics()
+
+    counts = dict(
+      ((s.format, s.sql), s.count)
+      for s in statistics
+    )
+    self.assertDictEqual(counts, {
+      ("test_migration", "INSERT INTO files (path) VALUES (?)"): 10,
+      ("test_migration", "SELECT path FROM files WHERE id IN (...)"): 1,
+      ("test_migration", "DELETE FROM files WHERE id = ?"): 1,
+      ("test_migration", "UPDATE files SET path = path;"): 1,
+      ("test_migration", "COMMIT"): 1,
+    })
+    with open(slow_log_path, "r", encoding="utf-8") as file:
+      self.assertEqual(len(file.readlines()), 14)
+
+    self.assertListEqual(statement_statistics(), [])
+
+  def test_batch_session(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/batch"), "db.sqlite3")
+    db = SQLite3Pool("test_migration", db_path)
+
+    with db.batch(max_writes=3) as batch:
+      for i in range(2):
+        with db.write() as cursor:
+          cursor.execute("INSERT INTO files (path) VALUES (?)", (f"/file{i}",))
+
+      # not flushed yet
+      self.assertEqual(self._count_files(db), 0)
+      with self.assertRaises(ValueError):
+        with db.write() as cursor:
+          cursor.execute("INSERT INTO files (path) VALUES ('/failed')")
+          raise ValueError()
+
+      with db.write() as cursor:
+        cursor.execute("INSERT INTO files (path) VALUES ('/file2')")
+      self.assertEqual(self._count_files(db), 3)
+
+      with db.write() as cursor:
+        cursor.execute("INSERT INTO files (path) VALUES ('/file3')")
+      batch.cursor.execute("SELECT COUNT(*) FROM files")
+      self.assertEqual(batch.cursor.fetchone()[0], 4)
+      self.assertEqual(self._count_files(db), 3)
+
+    self.assertEqual(self._count_files(db), 4)
+
+    # without batch, every write commits
+    with db.write() as cursor:
+      cursor.execute("INSERT INTO files (path) VALUES ('/file4')")
+    self.assertEqual(self._count_files(db), 5)
+
+  def test_batch_lock(self):
+    db_path = os.path.join(get_temp_path("sqlite3_pool/batch_lock"), "db.sqlite3")
+    db = SQLite3Pool("test_migration", db_path)
+
+    with db.batch(max_seconds=0.2) as batch:
+      with db.read() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM files")
+        self.assertEqual(cursor.fetchone()[0], 0)
+      # reading never takes write lock
+      self.assertFalse(batch.conn.in_transaction)
+
+      with db.write() as cursor:
+        cursor.execute("INSERT INTO files (path) VALUES ('/file0')")
+      self.assertTrue(batch.conn.in_transaction)
+      with db.read() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM files")
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+      batch.flush_if_due()
+      self.assertTrue(batch.conn.in_transaction)
+      time.sleep(0.2)
+      batch.flush_if_due()
+      self.assertFalse(batch.conn.in_transaction)
+      self.assertEqual(self._count_files(db), 1)
+
+    # outside of batch, it reads with readonly connection
+    with db.read() as cursor:
+      cursor.execute("SELECT COUNT(*) FROM files")
+      self.assertEqual(cursor.fetchone()[0], 1)
+
+  def _count_files(self, db: SQLite3Pool) -> int:
+    with db.connect(readonly=True) as (cursor, _):
+      cursor.execute("SELECT COUNT(*) FROM files")
+      return cursor.fetchone()[0]
+
+  def _user_version(self, db: SQLite3Pool) -> int:
+    with db.connect() as (cursor, _):
+      cursor.execute("PRAGMA user_version")
+      return cursor.fetchone()[0]
+
+  def _index_names(self, db: SQLite3Pool) -> list[str]:
+    with db.connect() as (cursor, _):
+      cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+      return [row[0] for row in cursor.fetchall()]
+
+  def _column_names(self, db: SQLite3Pool) -> list[str]:
+    with db.connect() as (cursor, _):
+      cursor.execute("PRAGMA table_info(files)")
+      return [row[1] for row in cursor.fetchall()]